@@ -0,0 +1,46 @@
+"""
+Selects the AI provider from configuration.
+
+AI_BACKEND=gemini (default) talks to Gemini; AI_BACKEND=stub uses the offline
+fixture backend in ai/stub_impl.py for load tests and development without
+network access. Backends are imported lazily so the stub does not need the
+Gemini SDK configured.
+"""
+import os
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+AI_BACKEND = os.environ.get("AI_BACKEND", "gemini").strip().lower()
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def _build_provider(backend: str):
+    if backend == 'gemini':
+        from ai.gemini_impl import GeminiProvider
+        return GeminiProvider()
+    if backend == 'stub':
+        from ai.stub_impl import StubProvider
+        return StubProvider()
+    raise ValueError(f"Unknown AI_BACKEND '{backend}' (expected 'gemini' or 'stub')")
+
+
+def get_provider():
+    """Return the process-wide AIProvider for the configured backend."""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = _build_provider(AI_BACKEND)
+                logger.info(f"AI backend: {_provider.name} (model {_provider.model})")
+    return _provider
+
+
+def set_provider(provider):
+    """Swap the active provider (used by load-test scripts)."""
+    global _provider
+    with _provider_lock:
+        _provider = provider
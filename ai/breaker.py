@@ -0,0 +1,153 @@
+"""
+Per-model circuit breakers for LLM calls.
+
+Each breaker keeps a rolling window of recent outcomes. A call counts against
+the model when it raises or takes longer than AI_BREAKER_SLOW_CALL_MS. Once
+the bad-call rate in the window crosses AI_BREAKER_ERROR_RATE (with at least
+AI_BREAKER_MIN_CALLS samples) the breaker opens and calls are refused without
+touching the network. After AI_BREAKER_OPEN_SECONDS it goes half-open and
+lets a few trial calls through; one success closes it, one failure re-opens it.
+"""
+import os
+import time
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+AI_BREAKER_WINDOW_SECONDS = float(os.environ.get("AI_BREAKER_WINDOW_SECONDS", "60"))
+AI_BREAKER_MIN_CALLS = int(os.environ.get("AI_BREAKER_MIN_CALLS", "10"))
+AI_BREAKER_ERROR_RATE = float(os.environ.get("AI_BREAKER_ERROR_RATE", "0.5"))
+AI_BREAKER_SLOW_CALL_MS = float(os.environ.get("AI_BREAKER_SLOW_CALL_MS", "15000"))
+AI_BREAKER_OPEN_SECONDS = float(os.environ.get("AI_BREAKER_OPEN_SECONDS", "30"))
+AI_BREAKER_HALF_OPEN_CALLS = int(os.environ.get("AI_BREAKER_HALF_OPEN_CALLS", "1"))
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a model whose breaker is open."""
+
+
+class CircuitBreaker:
+    def __init__(self, name, window_seconds=AI_BREAKER_WINDOW_SECONDS, min_calls=AI_BREAKER_MIN_CALLS,
+                 error_rate=AI_BREAKER_ERROR_RATE, slow_call_ms=AI_BREAKER_SLOW_CALL_MS,
+                 open_seconds=AI_BREAKER_OPEN_SECONDS, half_open_calls=AI_BREAKER_HALF_OPEN_CALLS):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_ms = slow_call_ms
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self._lock = threading.Lock()
+        self._window = deque()  # (timestamp, ok, elapsed_ms)
+        self._state = STATE_CLOSED
+        self._opened_at = 0.0
+        self._trials_in_flight = 0
+        self._counters = {'opened': 0, 'rejected': 0}
+
+    def _trim(self, now):
+        cutoff = now - self.window_seconds
+        while self._window and self._window[0][0] < cutoff:
+            self._window.popleft()
+
+    def _open(self, now, reason):
+        self._state = STATE_OPEN
+        self._opened_at = now
+        self._trials_in_flight = 0
+        self._counters['opened'] += 1
+        logger.warning(f"Circuit for '{self.name}' opened: {reason}")
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == STATE_OPEN and time.time() - self._opened_at >= self.open_seconds:
+                self._state = STATE_HALF_OPEN
+                self._trials_in_flight = 0
+            return self._state
+
+    def allow(self) -> bool:
+        """Whether a call may go out now. A True in half-open state reserves a trial slot."""
+        state = self.state
+        with self._lock:
+            if state == STATE_CLOSED:
+                return True
+            if state == STATE_HALF_OPEN and self._trials_in_flight < self.half_open_calls:
+                self._trials_in_flight += 1
+                return True
+            self._counters['rejected'] += 1
+            return False
+
+    def release(self):
+        """Give back a half-open trial slot for a call that never reached the model."""
+        with self._lock:
+            if self._state == STATE_HALF_OPEN:
+                self._trials_in_flight = max(0, self._trials_in_flight - 1)
+
+    def record(self, ok: bool, elapsed_ms: float):
+        now = time.time()
+        good = ok and elapsed_ms <= self.slow_call_ms
+        with self._lock:
+            if self._state == STATE_HALF_OPEN:
+                self._trials_in_flight = max(0, self._trials_in_flight - 1)
+                if good:
+                    self._state = STATE_CLOSED
+                    self._window.clear()
+                    logger.info(f"Circuit for '{self.name}' closed after a successful trial call")
+                else:
+                    self._open(now, 'trial call failed')
+            self._window.append((now, good, elapsed_ms if ok else None))
+            self._trim(now)
+            if self._state == STATE_CLOSED and len(self._window) >= self.min_calls:
+                bad = sum(1 for _, g, _ in self._window if not g)
+                rate = bad / len(self._window)
+                if rate >= self.error_rate:
+                    self._open(now, f"{bad}/{len(self._window)} bad calls in the last {self.window_seconds:.0f}s")
+
+    def latency_percentile(self, pct: float, min_samples: int = 1):
+        """Latency percentile (ms) of successful calls in the window, or None with too few samples."""
+        with self._lock:
+            self._trim(time.time())
+            samples = sorted(ms for _, _, ms in self._window if ms is not None)
+        if len(samples) < max(1, min_samples):
+            return None
+        index = min(len(samples) - 1, int(round(pct / 100.0 * (len(samples) - 1))))
+        return samples[index]
+
+    def snapshot(self) -> dict:
+        state = self.state
+        with self._lock:
+            self._trim(time.time())
+            calls = len(self._window)
+            bad = sum(1 for _, g, _ in self._window if not g)
+            counters = dict(self._counters)
+        p95 = self.latency_percentile(95)
+        return dict(
+            counters,
+            state=state,
+            window_calls=calls,
+            window_error_rate=round(bad / calls, 3) if calls else 0.0,
+            p95_ms=round(p95, 1) if p95 is not None else None,
+            retry_in_seconds=round(max(0.0, self.open_seconds - (time.time() - self._opened_at)), 1)
+            if state == STATE_OPEN else None,
+        )
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(name, CircuitBreaker(name))
+    return breaker
+
+
+def breaker_states() -> dict:
+    return {name: breaker.snapshot() for name, breaker in _breakers.items()}
@@ -0,0 +1,226 @@
+"""
+Content-addressed cache for LLM responses.
+
+Entries are keyed on a hash of (system prompt, whitespace-normalized prompt,
+model, temperature, max_tokens). A small in-process LRU sits in front of a
+SQLite file that survives restarts and is shared by every worker on the host.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+AI_CACHE_ENABLED = os.environ.get("AI_CACHE_ENABLED", "1") == "1"
+AI_CACHE_PATH = os.environ.get("AI_CACHE_PATH", os.path.join(BASE_DIR, 'instance', 'ai_cache.db'))
+AI_CACHE_TTL_SECONDS = int(os.environ.get("AI_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+AI_CACHE_MAX_ENTRIES = int(os.environ.get("AI_CACHE_MAX_ENTRIES", "5000"))  # SQLite tier
+AI_CACHE_MEMORY_ENTRIES = int(os.environ.get("AI_CACHE_MEMORY_ENTRIES", "256"))  # LRU tier
+
+# Prune expired/oversized rows once every N writes rather than on every write
+PRUNE_EVERY_WRITES = 50
+
+
+def make_cache_key(system_prompt: str, prompt: str, model: str, temperature: float, max_tokens: int,
+                   version: str = '') -> str:
+    """
+    Stable SHA-256 key; prompt whitespace is collapsed so indentation changes do not miss.
+    `version` is the prompt registry hash of the template the prompt was rendered from.
+    """
+    normalized_prompt = ' '.join((prompt or '').split())
+    payload = json.dumps(
+        [(system_prompt or '').strip(), normalized_prompt, model, round(float(temperature), 3), int(max_tokens), version],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """Two-tier (memory LRU + SQLite) cache with TTL, size-based eviction and hit/miss counters."""
+
+    def __init__(self, path=AI_CACHE_PATH, ttl_seconds=AI_CACHE_TTL_SECONDS,
+                 max_entries=AI_CACHE_MAX_ENTRIES, memory_entries=AI_CACHE_MEMORY_ENTRIES,
+                 enabled=AI_CACHE_ENABLED):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.enabled = enabled
+        self._memory = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        self._schema_ready = False
+        self._writes_since_prune = 0
+        self._counters = {
+            'memory_hits': 0, 'disk_hits': 0, 'misses': 0,
+            'writes': 0, 'evictions': 0, 'expired': 0, 'errors': 0,
+        }
+
+    # --- SQLite tier ---
+    def _connect(self):
+        if not self._schema_ready:
+            # before connecting: sqlite cannot create the file in a missing directory
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=5)
+        if not self._schema_ready:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS ai_response_cache ('
+                ' key TEXT PRIMARY KEY,'
+                ' value TEXT NOT NULL,'
+                ' expires_at REAL NOT NULL,'
+                ' last_access REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_ai_cache_last_access ON ai_response_cache(last_access)')
+            conn.commit()
+            self._schema_ready = True
+        return conn
+
+    def _disk_get(self, key, now):
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT value, expires_at FROM ai_response_cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None, None
+            value, expires_at = row
+            if expires_at <= now:
+                conn.execute('DELETE FROM ai_response_cache WHERE key = ?', (key,))
+                conn.commit()
+                self._count('expired')
+                return None, None
+            conn.execute('UPDATE ai_response_cache SET last_access = ? WHERE key = ?', (now, key))
+            conn.commit()
+            return value, expires_at
+        finally:
+            conn.close()
+
+    def _disk_set(self, key, value, expires_at, now):
+        conn = self._connect()
+        try:
+            conn.execute(
+                'INSERT OR REPLACE INTO ai_response_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)',
+                (key, value, expires_at, now)
+            )
+            self._writes_since_prune += 1
+            if self._writes_since_prune >= PRUNE_EVERY_WRITES:
+                self._writes_since_prune = 0
+                self._prune(conn, now)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _prune(self, conn, now):
+        expired = conn.execute('DELETE FROM ai_response_cache WHERE expires_at <= ?', (now,)).rowcount
+        self._count('expired', max(expired, 0))
+        count = conn.execute('SELECT COUNT(*) FROM ai_response_cache').fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            conn.execute(
+                'DELETE FROM ai_response_cache WHERE key IN ('
+                ' SELECT key FROM ai_response_cache ORDER BY last_access ASC LIMIT ?)',
+                (overflow,)
+            )
+            self._count('evictions', overflow)
+
+    def _count(self, counter, n=1):
+        with self._lock:
+            self._counters[counter] += n
+
+    # --- memory tier ---
+    def _memory_put(self, key, value, expires_at):
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    # --- public API ---
+    def get(self, key):
+        """Return the cached response for `key`, or None on a miss."""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._counters['memory_hits'] += 1
+                    return value
+                del self._memory[key]
+        try:
+            value, expires_at = self._disk_get(key, now)
+        except sqlite3.Error as e:
+            logger.warning(f"AI cache read failed: {e}")
+            self._count('errors')
+            value = None
+        if value is None:
+            self._count('misses')
+            return None
+        with self._lock:
+            self._memory_put(key, value, expires_at)
+            self._counters['disk_hits'] += 1
+        return value
+
+    def set(self, key, value):
+        if not self.enabled or value is None:
+            return
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        with self._lock:
+            self._memory_put(key, value, expires_at)
+        try:
+            self._disk_set(key, value, expires_at, now)
+            self._count('writes')
+        except sqlite3.Error as e:
+            logger.warning(f"AI cache write failed: {e}")
+            self._count('errors')
+
+    def discard(self, key):
+        """Drop an entry, e.g. when the cached reply turned out to be unparseable."""
+        with self._lock:
+            self._memory.pop(key, None)
+        try:
+            conn = self._connect()
+            try:
+                conn.execute('DELETE FROM ai_response_cache WHERE key = ?', (key,))
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"AI cache discard failed: {e}")
+            self._count('errors')
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        try:
+            conn = self._connect()
+            try:
+                conn.execute('DELETE FROM ai_response_cache')
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"AI cache clear failed: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            memory_size = len(self._memory)
+        hits = counters['memory_hits'] + counters['disk_hits']
+        lookups = hits + counters['misses']
+        return dict(
+            counters,
+            enabled=self.enabled,
+            memory_size=memory_size,
+            hit_rate=round(hits / lookups, 3) if lookups else 0.0
+        )
+
+
+response_cache = ResponseCache()
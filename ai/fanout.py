@@ -0,0 +1,209 @@
+"""
+Run independent AI calls concurrently under a shared deadline.
+
+Calls run with a copy of the caller's context variables, so per-request
+state such as the metering user id follows them onto the pool.
+
+Under the eventlet worker the calls run on a bounded GreenPool; elsewhere (dev
+server, scripts) on a bounded thread pool. Calls that miss the deadline keep
+running and hand their result to an `on_late` callback, so the caller can
+render a placeholder now and push the real content later. `map_bounded`
+runs a batch of calls (e.g. triage escalations) with a fixed concurrency cap.
+"""
+import os
+import time
+import logging
+import threading
+import queue
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait as futures_wait
+
+logger = logging.getLogger(__name__)
+
+AI_FANOUT_WORKERS = int(os.environ.get("AI_FANOUT_WORKERS", "8"))
+AI_REPORT_DEADLINE_SECONDS = float(os.environ.get("AI_REPORT_DEADLINE_SECONDS", "6"))
+AI_HEDGE_WORKERS = int(os.environ.get("AI_HEDGE_WORKERS", "16"))
+AI_HEDGE_DEADLINE_SECONDS = float(os.environ.get("AI_HEDGE_DEADLINE_SECONDS", "60"))
+
+_pools = {}  # name -> (pid, pool)
+_pool_lock = threading.Lock()
+
+
+def _eventlet_active() -> bool:
+    try:
+        import eventlet.patcher
+        return eventlet.patcher.is_monkey_patched('thread')
+    except ImportError:
+        return False
+
+
+def _get_pool(name='fanout', size=AI_FANOUT_WORKERS):
+    """Lazily build the named pool in the serving process (after any fork / monkey patching)."""
+    entry = _pools.get(name)
+    if entry is not None and entry[0] == os.getpid():
+        return entry[1]
+    with _pool_lock:
+        entry = _pools.get(name)
+        if entry is None or entry[0] != os.getpid():
+            if _eventlet_active():
+                import eventlet
+                pool = eventlet.GreenPool(size)
+            else:
+                pool = ThreadPoolExecutor(max_workers=size, thread_name_prefix=f'ai-{name}')
+            entry = _pools[name] = (os.getpid(), pool)
+    return entry[1]
+
+
+def _deliver_late(on_late, name, result):
+    if on_late is None:
+        return
+    try:
+        on_late(name, result)
+    except Exception:
+        logger.exception(f"Late AI result delivery failed for '{name}'")
+
+
+def _on_green_done(gt, name, on_late):
+    try:
+        result = gt.wait()
+    except Exception:
+        logger.exception(f"AI fan-out call '{name}' failed after its deadline")
+        return
+    _deliver_late(on_late, name, result)
+
+
+def run_with_deadline(calls: dict, deadline_seconds: float = AI_REPORT_DEADLINE_SECONDS, on_late=None):
+    """
+    Start every zero-argument callable in `calls` at once and wait up to
+    `deadline_seconds` in total.
+
+    Returns (results, pending): results maps name -> return value for calls that
+    finished in time; pending lists the names still running. A call that raises
+    is logged and left out of both.
+    """
+    pool = _get_pool()
+    started = time.perf_counter()
+    results = {}
+
+    if not isinstance(pool, ThreadPoolExecutor):
+        import eventlet
+        threads = {name: pool.spawn(contextvars.copy_context().run, fn) for name, fn in calls.items()}
+        remaining = set(threads)
+        with eventlet.Timeout(deadline_seconds, False):
+            for name, gt in threads.items():
+                try:
+                    results[name] = gt.wait()
+                except Exception:
+                    logger.exception(f"AI fan-out call '{name}' failed")
+                remaining.discard(name)
+        pending = []
+        for name in [n for n in threads if n in remaining]:
+            gt = threads[name]
+            if gt.dead:
+                # Finished while we were blocked on an earlier call
+                try:
+                    results[name] = gt.wait()
+                except Exception:
+                    logger.exception(f"AI fan-out call '{name}' failed")
+                continue
+            pending.append(name)
+            gt.link(_on_green_done, name, on_late)
+    else:
+        futures = {pool.submit(contextvars.copy_context().run, fn): name for name, fn in calls.items()}
+        done, not_done = futures_wait(futures, timeout=deadline_seconds)
+        for future in done:
+            name = futures[future]
+            try:
+                results[name] = future.result()
+            except Exception:
+                logger.exception(f"AI fan-out call '{name}' failed")
+        pending = [futures[f] for f in not_done]
+        for future in not_done:
+            future.add_done_callback(
+                lambda f, name=futures[future]: _deliver_late(on_late, name, f.result()) if not f.exception() else None
+            )
+
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    logger.info(f"AI fan-out finished {len(results)}/{len(calls)} calls in {elapsed_ms:.0f}ms"
+                f"{' (late: ' + ', '.join(pending) + ')' if pending else ''}")
+    return results, pending
+
+
+def run_hedged(primary, backup, hedge_after_seconds: float, deadline_seconds: float = AI_HEDGE_DEADLINE_SECONDS):
+    """
+    Call `primary`; if it has not finished after `hedge_after_seconds` (or fails
+    before then), also start `backup`. Returns (label, value) for the first call
+    to succeed, where label is 'primary' or 'backup'; raises the last error if
+    both fail, or TimeoutError if neither answers within `deadline_seconds`.
+    The slower call is left to finish in the background.
+
+    Hedged calls run on their own pool: they are often made from inside a
+    run_with_deadline call, and a backup queued behind a full fan-out pool
+    would never start.
+    """
+    pool = _get_pool('hedge', AI_HEDGE_WORKERS)
+    outcomes = queue.Queue()
+    deadline = time.monotonic() + deadline_seconds
+
+    def _run(label, fn):
+        try:
+            outcomes.put((label, True, fn()))
+        except Exception as e:
+            outcomes.put((label, False, e))
+
+    def _start(label, fn):
+        ctx = contextvars.copy_context()
+        if isinstance(pool, ThreadPoolExecutor):
+            pool.submit(ctx.run, _run, label, fn)
+        else:
+            pool.spawn_n(ctx.run, _run, label, fn)
+
+    _start('primary', primary)
+    outstanding = 1
+    error = None
+    try:
+        label, ok, value = outcomes.get(timeout=min(hedge_after_seconds, deadline_seconds))
+        outstanding -= 1
+        if ok:
+            return label, value
+        error = value
+    except queue.Empty:
+        logger.info(f"Hedging: primary call still running after {hedge_after_seconds * 1000:.0f}ms, starting backup")
+
+    _start('backup', backup)
+    outstanding += 1
+    while outstanding:
+        try:
+            label, ok, value = outcomes.get(timeout=max(0.0, deadline - time.monotonic()))
+        except queue.Empty:
+            raise TimeoutError(f"Hedged call got no answer within {deadline_seconds:g}s")
+        outstanding -= 1
+        if ok:
+            return label, value
+        error = value
+    raise error
+
+
+def map_bounded(fn, items, concurrency: int):
+    """
+    Call `fn(item)` for every item with at most `concurrency` calls in flight
+    and return the results in input order. A call that raises yields None.
+    """
+    def _call(item):
+        try:
+            return fn(item)
+        except Exception:
+            logger.exception("Bounded AI call failed")
+            return None
+
+    items = list(items)
+    if not items:
+        return []
+    concurrency = max(1, min(concurrency, len(items)))
+    ctx = contextvars.copy_context()
+    if _eventlet_active():
+        import eventlet
+        pool = eventlet.GreenPool(concurrency)
+        return list(pool.imap(lambda item: ctx.copy().run(_call, item), items))
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='ai-bounded') as pool:
+        return list(pool.map(lambda item: ctx.copy().run(_call, item), items))
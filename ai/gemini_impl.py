@@ -1,9 +1,16 @@
 # /mnt/data/gemini_impl.py
 import os
 import json
+import time
 import logging
+import threading
+from contextlib import contextmanager
 import google.generativeai as genai
 from dotenv import load_dotenv
+from ai.breaker import get_breaker, breaker_states, CircuitOpenError
+from ai.fanout import run_hedged
+from ai.interface import AIProvider
+from ai.metering import note_model
 
 # Load environment variables (safe to call multiple times)
 load_dotenv()
@@ -12,6 +19,20 @@ logger = logging.getLogger(__name__)
 
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
 GEMINI_MODEL_NAME = os.environ.get("GEMINI_MODEL_NAME", "gemini-1.5-flash") # Updated default model
+GEMINI_FALLBACK_MODEL_NAME = os.environ.get("GEMINI_FALLBACK_MODEL_NAME", "gemini-flash-latest")
+# REST transport goes through `requests`, which eventlet can green; gRPC's C core
+# would block the single worker's hub. The SDK keeps one HTTP session per client.
+GEMINI_TRANSPORT = os.environ.get("GEMINI_TRANSPORT", "rest")
+GEMINI_MAX_CONCURRENCY = int(os.environ.get("GEMINI_MAX_CONCURRENCY", "4"))  # in-flight calls per model
+GEMINI_SLOT_TIMEOUT = float(os.environ.get("GEMINI_SLOT_TIMEOUT", "20"))  # seconds to wait for a free slot
+GEMINI_WARMUP_PING = os.environ.get("GEMINI_WARMUP_PING", "0") == "1"
+# Hedging: start the fallback model when the primary is slower than its recent p95
+GEMINI_HEDGE_ENABLED = os.environ.get("GEMINI_HEDGE_ENABLED", "0") == "1"
+GEMINI_HEDGE_MIN_DELAY_MS = float(os.environ.get("GEMINI_HEDGE_MIN_DELAY_MS", "1500"))
+GEMINI_HEDGE_DEFAULT_DELAY_MS = float(os.environ.get("GEMINI_HEDGE_DEFAULT_DELAY_MS", "4000"))  # until enough samples
+GEMINI_HEDGE_MIN_SAMPLES = int(os.environ.get("GEMINI_HEDGE_MIN_SAMPLES", "20"))
+
+SAFETY_BLOCKED_REPLY = "I understand your message, but I'm unable to provide a specific response due to safety guidelines. Please consider reaching out to a mental health professional for personalized support."
 
 # Debug logging
 logger.info(f"GEMINI_API_KEY loaded: {'Yes' if GEMINI_API_KEY else 'No'}")
@@ -19,57 +40,358 @@ if not GEMINI_API_KEY:
     logger.error("GEMINI_API_KEY is not set in environment variables!")
     logger.info(f"Available env vars starting with GEMINI: {[k for k in os.environ.keys() if k.startswith('GEMINI')]}")
 
+
+class GeminiClientPool:
+    """
+    Process-wide registry of configured Gemini models.
+
+    `genai.configure` runs once and each GenerativeModel is built once, so the
+    underlying HTTP session (and its keep-alive connections) is reused across
+    requests. Every model gets a bounded number of concurrent calls. State is
+    keyed on the PID so a pool created before a gunicorn fork is rebuilt in the
+    worker instead of sharing the parent's sockets and locks.
+    """
+
+    def __init__(self, max_concurrency=GEMINI_MAX_CONCURRENCY, slot_timeout=GEMINI_SLOT_TIMEOUT):
+        self.max_concurrency = max_concurrency
+        self.slot_timeout = slot_timeout
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._configured = False
+        self._models = {}
+        self._slots = {}
+        self._stats = {}
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            logger.info("Process changed since Gemini pool was built; rebuilding clients")
+            self._reset()
+
+    def _ensure_configured(self):
+        if self._configured:
+            return
+        if not GEMINI_API_KEY:
+            raise RuntimeError("GEMINI_API_KEY not set")
+        genai.configure(api_key=GEMINI_API_KEY, transport=GEMINI_TRANSPORT)
+        self._configured = True
+
+    def get_model(self, model_name: str):
+        """Return the shared GenerativeModel for `model_name`, creating it on first use."""
+        self._check_pid()
+        model = self._models.get(model_name)
+        if model is not None:
+            return model
+        with self._lock:
+            self._ensure_configured()
+            model = self._models.get(model_name)
+            if model is None:
+                model = genai.GenerativeModel(model_name)
+                self._models[model_name] = model
+                self._slots[model_name] = threading.BoundedSemaphore(self.max_concurrency)
+                self._stats[model_name] = {
+                    'cold_calls': 0, 'cold_ms_total': 0.0,
+                    'warm_calls': 0, 'warm_ms_total': 0.0, 'warm_ms_max': 0.0,
+                    'in_flight': 0, 'rejected': 0, 'errors': 0,
+                }
+                logger.info(f"Gemini model '{model_name}' created (transport={GEMINI_TRANSPORT})")
+        return model
+
+    @contextmanager
+    def slot(self, model_name: str):
+        """Hold one of the model's concurrency slots for the duration of a call."""
+        self.get_model(model_name)
+        semaphore = self._slots[model_name]
+        stats = self._stats[model_name]
+        if not semaphore.acquire(timeout=self.slot_timeout):
+            stats['rejected'] += 1
+            raise RuntimeError(f"Gemini concurrency limit reached for {model_name}")
+        stats['in_flight'] += 1
+        try:
+            yield
+        finally:
+            stats['in_flight'] -= 1
+            semaphore.release()
+
+    def record_call(self, model_name: str, elapsed_ms: float, ok: bool = True):
+        """Record call latency; the first call through a model is its cold call."""
+        stats = self._stats.get(model_name)
+        if stats is None:
+            return
+        if not ok:
+            stats['errors'] += 1
+            return
+        if stats['cold_calls'] == 0:
+            stats['cold_calls'] = 1
+            stats['cold_ms_total'] = elapsed_ms
+            logger.info(f"Gemini cold call to '{model_name}' took {elapsed_ms:.0f}ms")
+        else:
+            stats['warm_calls'] += 1
+            stats['warm_ms_total'] += elapsed_ms
+            stats['warm_ms_max'] = max(stats['warm_ms_max'], elapsed_ms)
+
+    def warm_up(self, model_names=None):
+        """Configure the SDK and build the primary and fallback models ahead of traffic."""
+        model_names = model_names or [GEMINI_MODEL_NAME, GEMINI_FALLBACK_MODEL_NAME]
+        for name in model_names:
+            try:
+                model = self.get_model(name)
+                if GEMINI_WARMUP_PING:
+                    # count_tokens is free and opens the keep-alive connection
+                    start = time.perf_counter()
+                    model.count_tokens("ping")
+                    logger.info(f"Gemini warm-up ping to '{name}' took {(time.perf_counter() - start) * 1000:.0f}ms")
+            except Exception as e:
+                logger.warning(f"Gemini warm-up for '{name}' failed: {e}")
+
+    def stats(self) -> dict:
+        """Cold vs warm latency and slot usage per model."""
+        out = {}
+        for name, s in self._stats.items():
+            out[name] = {
+                'cold_calls': s['cold_calls'],
+                'cold_ms': round(s['cold_ms_total'], 1) if s['cold_calls'] else None,
+                'warm_calls': s['warm_calls'],
+                'warm_ms_avg': round(s['warm_ms_total'] / s['warm_calls'], 1) if s['warm_calls'] else None,
+                'warm_ms_max': round(s['warm_ms_max'], 1),
+                'in_flight': s['in_flight'],
+                'max_concurrency': self.max_concurrency,
+                'rejected': s['rejected'],
+                'errors': s['errors'],
+            }
+        return out
+
+
+client_pool = GeminiClientPool()
+
+
+def warm_up_gemini_pool():
+    """Build the shared Gemini clients at startup. Safe to call when no API key is set."""
+    if not GEMINI_API_KEY:
+        logger.warning("Skipping Gemini warm-up: GEMINI_API_KEY not set")
+        return
+    client_pool.warm_up()
+
+
+def gemini_pool_stats() -> dict:
+    return client_pool.stats()
+
+
+def gemini_breaker_states() -> dict:
+    return breaker_states()
+
+
+def _generate(model_name: str, prompt: str, max_tokens: int, temperature: float):
+    breaker = get_breaker(model_name)
+    if not breaker.allow():
+        raise CircuitOpenError(f"Circuit open for {model_name}")
+    model = client_pool.get_model(model_name)
+    reached_model = False
+    try:
+        with client_pool.slot(model_name):
+            reached_model = True
+            start = time.perf_counter()
+            try:
+                response = model.generate_content(
+                    prompt,
+                    generation_config=genai.types.GenerationConfig(
+                        max_output_tokens=max_tokens,
+                        temperature=temperature
+                    )
+                )
+            except Exception:
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                client_pool.record_call(model_name, elapsed_ms, ok=False)
+                breaker.record(False, elapsed_ms)
+                raise
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            client_pool.record_call(model_name, elapsed_ms)
+            breaker.record(True, elapsed_ms)
+    finally:
+        if not reached_model:
+            breaker.release()
+    return response
+
+
+def _generate_text(model_name: str, prompt: str, max_tokens: int, temperature: float) -> str:
+    response = _generate(model_name, prompt, max_tokens, temperature)
+    # Handle safety filter blocks
+    try:
+        return response.text
+    except ValueError as e:
+        if "safety_ratings" in str(e):
+            logger.warning("Response blocked by safety filters")
+            return SAFETY_BLOCKED_REPLY
+        raise
+
+
+def _hedge_delay_seconds(model_name: str) -> float:
+    p95 = get_breaker(model_name).latency_percentile(95, min_samples=GEMINI_HEDGE_MIN_SAMPLES)
+    delay_ms = p95 if p95 is not None else GEMINI_HEDGE_DEFAULT_DELAY_MS
+    return max(delay_ms, GEMINI_HEDGE_MIN_DELAY_MS) / 1000.0
+
+
 def ask_gemini_system_user(system_prompt: str, user_text: str, max_tokens: int = 1024, temperature: float = 0.2):
     """
     Simple wrapper to call Gemini using the Python SDK.
+
+    The primary model is skipped while its circuit is open. With hedging on,
+    the fallback model is started once the primary runs past its p95 latency
+    and whichever answers first wins; otherwise the fallback is only tried
+    after the primary fails.
     """
     if not GEMINI_API_KEY:
         raise RuntimeError("GEMINI_API_KEY not set")
 
-    genai.configure(api_key=GEMINI_API_KEY)
-    
-    # Use the correct model name format for the installed version
-    model_name_sdk = "gemini-1.5-flash"
-    
-    try:
-        model = genai.GenerativeModel(model_name_sdk)
-        
-        # The SDK expects a list of contents. The system prompt can be sent as a separate message.
-        # However, to match the previous implementation, I will concatenate the prompts.
-        prompt = f"{system_prompt}\n\nUser: {user_text}"
-        
-        response = model.generate_content(
-            prompt,
-            generation_config=genai.types.GenerationConfig(
-                max_output_tokens=max_tokens,
-                temperature=temperature
-            )
-        )
-        
-        # Handle safety filter blocks
+    # The SDK expects a list of contents. The system prompt can be sent as a separate message.
+    # However, to match the previous implementation, I will concatenate the prompts.
+    prompt = f"{system_prompt}\n\nUser: {user_text}"
+    primary, fallback = GEMINI_MODEL_NAME, GEMINI_FALLBACK_MODEL_NAME
+
+    def call_primary():
+        return _generate_text(primary, prompt, max_tokens, temperature)
+
+    def call_fallback():
+        return _generate_text(fallback, prompt, max_tokens, temperature)
+
+    hedge = (GEMINI_HEDGE_ENABLED and fallback != primary
+             and get_breaker(primary).state != 'open' and get_breaker(fallback).state != 'open')
+    if hedge:
         try:
-            return response.text
-        except ValueError as e:
-            if "safety_ratings" in str(e):
-                logger.warning("Response blocked by safety filters")
-                return "I understand your message, but I'm unable to provide a specific response due to safety guidelines. Please consider reaching out to a mental health professional for personalized support."
-            else:
-                raise e
-        
-    except Exception as e:
+            label, text = run_hedged(call_primary, call_fallback, _hedge_delay_seconds(primary))
+            if label != 'primary':
+                logger.info(f"Hedged Gemini call answered by fallback model '{fallback}'")
+            note_model(primary if label == 'primary' else fallback, fallback=label != 'primary')
+            return text
+        except Exception:
+            logger.exception("Hedged Gemini call failed on both models")
+            raise
+
+    try:
+        text = call_primary()
+        note_model(primary)
+        return text
+    except CircuitOpenError:
+        logger.warning(f"Circuit open for '{primary}', going straight to '{fallback}'")
+    except Exception:
         logger.exception("Gemini call failed")
-        # Try with gemini-flash-latest as a fallback (known working model)
-        try:
-            model = genai.GenerativeModel("gemini-flash-latest")
-            prompt = f"{system_prompt}\n\nUser: {user_text}"
-            response = model.generate_content(
-                prompt,
-                generation_config=genai.types.GenerationConfig(
-                    max_output_tokens=max_tokens,
-                    temperature=temperature
+    # Try with gemini-flash-latest as a fallback (known working model)
+    try:
+        text = call_fallback()
+        note_model(fallback, fallback=True)
+        return text
+    except Exception as e2:
+        logger.exception("Gemini call with fallback model also failed")
+        raise e2
+
+
+def stream_gemini_system_user(system_prompt: str, user_text: str, max_tokens: int = 1024,
+                              temperature: float = 0.2, should_stop=None):
+    """
+    Streamed variant of ask_gemini_system_user: yields text chunks as the model
+    produces them. `should_stop()` is checked between chunks; when it returns
+    True the stream is closed so the rest of the generation is not billed.
+    """
+    if not GEMINI_API_KEY:
+        raise RuntimeError("GEMINI_API_KEY not set")
+
+    prompt = f"{system_prompt}\n\nUser: {user_text}"
+    model_name = GEMINI_MODEL_NAME
+    breaker = get_breaker(model_name)
+    if not breaker.allow():
+        model_name = GEMINI_FALLBACK_MODEL_NAME
+        breaker = get_breaker(model_name)
+        if not breaker.allow():
+            raise CircuitOpenError("Circuit open for primary and fallback Gemini models")
+    note_model(model_name, fallback=model_name != GEMINI_MODEL_NAME)
+    model = client_pool.get_model(model_name)
+    recorded = False
+    try:
+        with client_pool.slot(model_name):
+            start = time.perf_counter()
+            first_chunk_ms = None
+            response = None
+            try:
+                response = model.generate_content(
+                    prompt,
+                    generation_config=genai.types.GenerationConfig(
+                        max_output_tokens=max_tokens,
+                        temperature=temperature
+                    ),
+                    stream=True
                 )
-            )
-            return response.text
-        except Exception as e2:
-            logger.exception("Gemini call with fallback model also failed")
-            raise e2
+                for chunk in response:
+                    if should_stop is not None and should_stop():
+                        logger.info(f"Gemini stream on '{model_name}' cancelled by caller")
+                        break
+                    try:
+                        text = chunk.text
+                    except ValueError as e:
+                        if "safety_ratings" in str(e):
+                            logger.warning("Streamed response blocked by safety filters")
+                            yield SAFETY_BLOCKED_REPLY
+                            break
+                        raise
+                    if not text:
+                        continue
+                    if first_chunk_ms is None:
+                        first_chunk_ms = (time.perf_counter() - start) * 1000
+                        logger.info(f"Gemini stream on '{model_name}' first chunk after {first_chunk_ms:.0f}ms")
+                    yield text
+            except Exception:
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                client_pool.record_call(model_name, elapsed_ms, ok=False)
+                breaker.record(False, elapsed_ms)
+                recorded = True
+                raise
+            finally:
+                _close_stream(response)
+            client_pool.record_call(model_name, (time.perf_counter() - start) * 1000)
+            # The breaker tracks time to first token; total stream time depends on reply length
+            breaker.record(True, first_chunk_ms if first_chunk_ms is not None else (time.perf_counter() - start) * 1000)
+            recorded = True
+    finally:
+        if not recorded:
+            # Slot refused or consumer abandoned the generator: free any half-open trial
+            breaker.release()
+
+
+def _close_stream(response):
+    """Release the underlying HTTP/gRPC stream of an abandoned streamed response."""
+    iterator = getattr(response, '_iterator', None)
+    for method in ('cancel', 'close'):
+        closer = getattr(iterator, method, None)
+        if callable(closer):
+            try:
+                closer()
+            except Exception:
+                logger.debug("Closing Gemini stream failed", exc_info=True)
+            return
+
+
+class GeminiProvider(AIProvider):
+    """AIProvider backed by the shared Gemini client pool."""
+
+    name = "gemini"
+    model = GEMINI_MODEL_NAME
+
+    def ask(self, prompt: str, system_prompt: str = "", max_tokens: int = 1024, temperature: float = 0.2, **kwargs) -> str:
+        return ask_gemini_system_user(system_prompt, prompt, max_tokens=max_tokens, temperature=temperature)
+
+    def stream(self, prompt: str, should_stop=None, system_prompt: str = "", max_tokens: int = 1024,
+               temperature: float = 0.2, **kwargs):
+        return stream_gemini_system_user(system_prompt, prompt, max_tokens=max_tokens,
+                                         temperature=temperature, should_stop=should_stop)
+
+    def warm_up(self):
+        warm_up_gemini_pool()
+
+    def status(self) -> dict:
+        return {
+            'model_available': bool(GEMINI_API_KEY),
+            'model': GEMINI_MODEL_NAME,
+            'clients': gemini_pool_stats(),
+            'breakers': gemini_breaker_states(),
+        }
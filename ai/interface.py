@@ -3,6 +3,11 @@ from abc import ABC, abstractmethod
 class AIProvider(ABC):
     """Abstract interface for an AI provider."""
 
+    # Short backend name reported by /api/ai-status
+    name = "base"
+    # Model identifier; part of every response cache key
+    model = ""
+
     @abstractmethod
     def ask(self, prompt: str, **kwargs) -> str:
         """
@@ -10,9 +15,25 @@ class AIProvider(ABC):
 
         Args:
             prompt: The prompt to send to the AI.
-            **kwargs: Additional provider-specific arguments.
+            **kwargs: Additional provider-specific arguments
+                (system_prompt, max_tokens, temperature).
 
         Returns:
             The AI's response as a string.
         """
         pass
+
+    def stream(self, prompt: str, should_stop=None, **kwargs):
+        """
+        Yields the response in chunks. Providers without streaming support
+        return the whole response as a single chunk.
+        """
+        yield self.ask(prompt, **kwargs)
+
+    def warm_up(self):
+        """Prepare clients ahead of traffic. Optional."""
+        pass
+
+    def status(self) -> dict:
+        """Provider-specific health and latency details."""
+        return {}
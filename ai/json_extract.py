@@ -0,0 +1,250 @@
+"""
+Single-pass JSON extraction for LLM replies.
+
+`JsonExtractor` can be fed a reply whole or chunk by chunk (streaming). It
+skips any prose or code fences before the first '{' / '[', tracks nesting and
+string state by jumping between structural characters with a compiled regex,
+and stops at the end of the first complete top-level value. Text is joined
+once, when the value is parsed.
+
+A reply that ends mid-value (token limit) is repaired structurally: a string
+value cut short is closed, a dangling key or partial literal is dropped, and
+the open containers are closed. A schema then fills in or coerces the fields
+the caller relies on. `extract_json` tries the C decoder in place first and
+only falls back to the scanner when the reply is not well-formed.
+"""
+import re
+import json
+import copy
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Structural characters outside strings, and the characters that matter inside them
+_OUTSIDE = re.compile(r'[{}\[\]",:]')
+_INSIDE = re.compile(r'["\\]')
+
+_CLOSERS = {'{': '}', '[': ']'}
+
+_decoder = json.JSONDecoder()
+
+# Container states
+_KEY = 0      # object: expecting a key or '}'
+_COLON = 1    # object: key read, expecting ':'
+_VALUE = 2    # expecting a value (object after ':' or array element)
+_AFTER = 3    # value read, expecting ',' or the closer
+
+
+class JsonExtractor:
+    def __init__(self, expect='object'):
+        """`expect` is 'object', 'array' or 'any' and selects which opening bracket starts the value."""
+        self._openers = {'object': '{', 'array': '[', 'any': '{['}[expect]
+        self._chunks = []
+        self._length = 0          # characters fed so far
+        self._start = None        # offset of the opening bracket
+        self._end = None          # offset just past the closing bracket
+        self._stack = []          # [opener, state]
+        self._in_string = False
+        self._escape = False
+        self._string_is_key = False
+        self._primitive = False   # inside a bare number / literal
+        self._safe_end = None     # offset after the last complete value
+        self._safe_closers = ''   # closers needed if cut at _safe_end
+
+    @property
+    def done(self) -> bool:
+        return self._end is not None
+
+    def feed(self, chunk: str) -> bool:
+        """Consume the next piece of the reply. Returns True once a complete value has been seen."""
+        if self.done or not chunk:
+            return self.done
+        base = self._length
+        self._chunks.append(chunk)
+        self._length += len(chunk)
+        pos = 0
+        n = len(chunk)
+
+        if self._start is None:
+            pos = min((i for i in (chunk.find(c) for c in self._openers) if i != -1), default=-1)
+            if pos == -1:
+                return False
+            self._start = base + pos
+            self._open(chunk[pos], base + pos)
+            pos += 1
+
+        while pos < n:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    pos += 1
+                    continue
+                m = _INSIDE.search(chunk, pos)
+                if m is None:
+                    return False
+                pos = m.end()
+                if m.group() == '\\':
+                    if pos < n:
+                        pos += 1
+                    else:
+                        self._escape = True
+                    continue
+                self._in_string = False
+                top = self._stack[-1]
+                if self._string_is_key:
+                    top[1] = _COLON
+                else:
+                    top[1] = _AFTER
+                    self._mark_safe(base + pos)
+                continue
+
+            m = _OUTSIDE.search(chunk, pos)
+            if m is None:
+                if self._stack[-1][1] == _VALUE and chunk[pos:].strip():
+                    self._primitive = True
+                return False
+            ch = m.group()
+            at = m.start()
+            top = self._stack[-1]
+            if top[1] == _VALUE and chunk[pos:at].strip():
+                self._primitive = True
+            pos = m.end()
+
+            if ch == '"':
+                self._in_string = True
+                self._string_is_key = top[0] == '{' and top[1] == _KEY
+                self._primitive = False
+            elif ch in '{[':
+                self._primitive = False
+                self._open(ch, base + at)
+            elif ch in '}]':
+                self._primitive = False
+                self._stack.pop()
+                if not self._stack:
+                    self._end = base + pos
+                    return True
+                self._stack[-1][1] = _AFTER
+                self._mark_safe(base + pos)
+            elif ch == ',':
+                if self._primitive:
+                    self._primitive = False
+                    self._mark_safe(base + at)
+                top[1] = _KEY if top[0] == '{' else _VALUE
+            elif ch == ':':
+                top[1] = _VALUE
+        return False
+
+    def _open(self, opener, offset):
+        self._stack.append([opener, _KEY if opener == '{' else _VALUE])
+        self._mark_safe(offset + 1)
+
+    def _mark_safe(self, offset):
+        self._safe_end = offset
+        self._safe_closers = ''.join(_CLOSERS[o] for o, _ in reversed(self._stack))
+
+    def text(self):
+        """The extracted (possibly repaired) JSON text, or None if no value started."""
+        if self._start is None:
+            return None
+        joined = ''.join(self._chunks)
+        if self.done:
+            return joined[self._start:self._end]
+        # Truncated: keep a string value that was cut short, otherwise cut back to the last complete value
+        if self._in_string and not self._string_is_key:
+            body = joined[self._start:]
+            if self._escape:
+                body = body[:-1]
+            closers = ''.join(_CLOSERS[o] for o, _ in reversed(self._stack))
+            return body + '"' + closers
+        return joined[self._start:self._safe_end] + self._safe_closers
+
+    @property
+    def truncated(self) -> bool:
+        return self._start is not None and not self.done
+
+    def result(self):
+        """Parse the extracted value. Returns None when nothing usable was found."""
+        text = self.text()
+        if text is None:
+            return None
+        if self.truncated and self._primitive:
+            # Cut after a number or literal: keep it if it already parses (e.g. "severity": 7)
+            closers = ''.join(_CLOSERS[o] for o, _ in reversed(self._stack))
+            try:
+                return json.loads(''.join(self._chunks)[self._start:].rstrip() + closers)
+            except ValueError:
+                pass
+        try:
+            return json.loads(text)
+        except ValueError:
+            # Common model slip: trailing comma before a closer
+            try:
+                return json.loads(re.sub(r',\s*([}\]])', r'\1', text))
+            except ValueError:
+                return None
+
+
+def _coerce(value, kind):
+    if isinstance(value, kind) and not (kind is int and isinstance(value, bool)):
+        return value
+    if kind is int:
+        if isinstance(value, float):
+            return int(value)
+        if isinstance(value, str):
+            m = re.search(r'-?\d+', value)
+            if m:
+                return int(m.group())
+    if kind is str and isinstance(value, (int, float)):
+        return str(value)
+    if kind is list and isinstance(value, str) and value.strip():
+        return [value]
+    raise ValueError
+
+
+def apply_schema(obj, schema):
+    """
+    Fill in missing fields and coerce types. `schema` maps field -> (type, default);
+    a default of None leaves a missing or malformed field out, so the caller can tell
+    it was absent. A dict result with none of the schema's fields present is rejected (None).
+    """
+    if not isinstance(obj, dict):
+        return None
+    if schema and not any(key in obj for key in schema):
+        return None
+    for key, (kind, default) in schema.items():
+        if key in obj:
+            try:
+                obj[key] = _coerce(obj[key], kind)
+                continue
+            except ValueError:
+                obj.pop(key)
+        if default is not None:
+            obj[key] = copy.deepcopy(default)
+    return obj
+
+
+def extract_json(text, schema=None, expect='object'):
+    """
+    Pull the first JSON value out of an LLM reply.
+    Returns the parsed value (repaired and schema-checked when `schema` is given) or None.
+    """
+    if not text:
+        return None
+    # Fast path: a well-formed value decodes in place, ignoring whatever follows it
+    openers = {'object': '{', 'array': '[', 'any': '{['}[expect]
+    start = min((i for i in (text.find(c) for c in openers) if i != -1), default=-1)
+    if start == -1:
+        return None
+    try:
+        value = _decoder.raw_decode(text, start)[0]
+    except ValueError:
+        extractor = JsonExtractor(expect=expect)
+        extractor.feed(text[start:])
+        value = extractor.result()
+        if value is None:
+            return None
+        if extractor.truncated:
+            logger.info("Repaired truncated JSON reply")
+    if schema is not None:
+        return apply_schema(value, schema)
+    return value
@@ -0,0 +1,263 @@
+"""
+Token and latency metering for AI calls.
+
+Every call made through ai.service runs inside `metered(feature, ...)`, which
+records the feature tag, the requesting user, estimated prompt/response
+tokens, wall time, the model that answered, whether a fallback model was used
+and whether the response cache answered. Records are rolled up in memory into
+per-minute buckets keyed by (feature, user, model) with a latency histogram,
+and flushed to the ai_usage_metrics table by a background task.
+"""
+import os
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+AI_METRICS_ENABLED = os.environ.get("AI_METRICS_ENABLED", "1") == "1"
+AI_METRICS_FLUSH_SECONDS = float(os.environ.get("AI_METRICS_FLUSH_SECONDS", "60"))
+AI_METRICS_WINDOW_MINUTES = int(os.environ.get("AI_METRICS_WINDOW_MINUTES", "60"))  # kept in memory for summaries
+
+# Upper bounds (ms) of the latency histogram buckets; the last one catches everything slower
+LATENCY_BUCKETS_MS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, float('inf'))
+
+# Set per request (see app.before_request) and copied into fan-out workers
+current_user_id = contextvars.ContextVar('ai_current_user_id', default=None)
+_current_call = contextvars.ContextVar('ai_current_call', default=None)
+
+
+def estimate_tokens(text) -> int:
+    """Rough token count (~4 characters per token), good enough for budgeting."""
+    if not text:
+        return 0
+    return max(1, len(text) // 4)
+
+
+class CallRecord:
+    __slots__ = ('feature', 'user_id', 'model', 'fallback', 'cache_hit', 'error',
+                 'prompt_tokens', 'response_tokens', 'wall_ms', 'response')
+
+    def __init__(self, feature, user_id, model, prompt_tokens):
+        self.feature = feature
+        self.user_id = user_id
+        self.model = model
+        self.fallback = False
+        self.cache_hit = False
+        self.error = False
+        self.prompt_tokens = prompt_tokens
+        self.response_tokens = 0
+        self.wall_ms = 0.0
+        self.response = None
+
+
+def _new_aggregate():
+    return {
+        'calls': 0, 'cache_hits': 0, 'fallback_calls': 0, 'errors': 0,
+        'prompt_tokens': 0, 'response_tokens': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+        'histogram': [0] * len(LATENCY_BUCKETS_MS),
+    }
+
+
+def _merge(into, agg):
+    for key in ('calls', 'cache_hits', 'fallback_calls', 'errors', 'prompt_tokens', 'response_tokens', 'total_ms'):
+        into[key] += agg[key]
+    into['max_ms'] = max(into['max_ms'], agg['max_ms'])
+    into['histogram'] = [a + b for a, b in zip(into['histogram'], agg['histogram'])]
+
+
+def histogram_percentile(histogram, pct):
+    """Approximate percentile (bucket upper bound, ms) from a latency histogram."""
+    total = sum(histogram)
+    if not total:
+        return None
+    threshold = total * pct / 100.0
+    running = 0
+    for bound, count in zip(LATENCY_BUCKETS_MS, histogram):
+        running += count
+        if running >= threshold:
+            return bound if bound != float('inf') else None
+    return None
+
+
+class AIMeter:
+    def __init__(self, window_minutes=AI_METRICS_WINDOW_MINUTES, enabled=AI_METRICS_ENABLED):
+        self.window_minutes = window_minutes
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # one flush at a time (API-triggered and background)
+        # minute (epoch // 60) -> {(feature, user_id, model): aggregate}
+        self._buckets = {}
+        self._flushed_through = -1  # last minute written to the database
+
+    def record(self, call: CallRecord):
+        if not self.enabled:
+            return
+        minute = int(time.time() // 60)
+        key = (call.feature, call.user_id, call.model or '')
+        with self._lock:
+            agg = self._buckets.setdefault(minute, {}).get(key)
+            if agg is None:
+                agg = self._buckets[minute][key] = _new_aggregate()
+            agg['calls'] += 1
+            agg['cache_hits'] += call.cache_hit
+            agg['fallback_calls'] += call.fallback
+            agg['errors'] += call.error
+            agg['prompt_tokens'] += call.prompt_tokens
+            agg['response_tokens'] += call.response_tokens
+            agg['total_ms'] += call.wall_ms
+            agg['max_ms'] = max(agg['max_ms'], call.wall_ms)
+            for i, bound in enumerate(LATENCY_BUCKETS_MS):
+                if call.wall_ms <= bound:
+                    agg['histogram'][i] += 1
+                    break
+
+    def summary(self, minutes=None, include_users=True, user_ids=None) -> dict:
+        """
+        Per-feature (and, with include_users, per-user) roll-up of the in-memory window.
+        With user_ids, only calls made by those users are counted.
+        """
+        minutes = minutes or self.window_minutes
+        since = int(time.time() // 60) - minutes + 1
+        by_feature, by_user = {}, {}
+        with self._lock:
+            for minute, entries in self._buckets.items():
+                if minute < since:
+                    continue
+                for (feature, user_id, model), agg in entries.items():
+                    if user_ids is not None and user_id not in user_ids:
+                        continue
+                    _merge(by_feature.setdefault(feature, _new_aggregate()), agg)
+                    if include_users and user_id is not None:
+                        _merge(by_user.setdefault(user_id, _new_aggregate()), agg)
+        summary = {
+            'window_minutes': minutes,
+            'features': {name: self._describe(agg) for name, agg in sorted(by_feature.items())},
+        }
+        if include_users:
+            summary['users'] = {uid: self._describe(agg) for uid, agg in by_user.items()}
+        return summary
+
+    @staticmethod
+    def _describe(agg) -> dict:
+        calls = agg['calls']
+        return {
+            'calls': calls,
+            'cache_hits': agg['cache_hits'],
+            'fallback_calls': agg['fallback_calls'],
+            'errors': agg['errors'],
+            'prompt_tokens': agg['prompt_tokens'],
+            'response_tokens': agg['response_tokens'],
+            'avg_ms': round(agg['total_ms'] / calls, 1) if calls else None,
+            'p50_ms': histogram_percentile(agg['histogram'], 50),
+            'p95_ms': histogram_percentile(agg['histogram'], 95),
+            'max_ms': round(agg['max_ms'], 1),
+        }
+
+    def flush(self) -> int:
+        """
+        Write completed minute buckets to ai_usage_metrics (needs an app context).
+        Returns the number of rows written. Buckets stay in memory for summaries
+        until they fall out of the window; a failed flush is retried next time.
+        """
+        from extensions import db
+        from models import AIUsageMetric
+
+        # Serialized so two flushes cannot both write the same pending minutes
+        with self._flush_lock:
+            last = int(time.time() // 60) - 1
+            with self._lock:
+                for minute in [m for m in self._buckets if m < last - self.window_minutes]:
+                    del self._buckets[minute]
+                pending = {m: dict(e) for m, e in self._buckets.items() if self._flushed_through < m <= last}
+            rows = []
+            for minute, entries in sorted(pending.items()):
+                bucket_start = datetime.fromtimestamp(minute * 60, tz=timezone.utc).replace(tzinfo=None)
+                for (feature, user_id, model), agg in entries.items():
+                    rows.append(AIUsageMetric(
+                        bucket_start=bucket_start, feature=feature, user_id=user_id, model=model,
+                        calls=agg['calls'], cache_hits=agg['cache_hits'], fallback_calls=agg['fallback_calls'],
+                        errors=agg['errors'], prompt_tokens=agg['prompt_tokens'],
+                        response_tokens=agg['response_tokens'], total_ms=agg['total_ms'], max_ms=agg['max_ms'],
+                        latency_histogram={str(b): c for b, c in zip(LATENCY_BUCKETS_MS, agg['histogram']) if c},
+                    ))
+            if rows:
+                try:
+                    db.session.add_all(rows)
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    logger.warning(f"AI metrics flush failed, will retry: {e}")
+                    return 0
+            with self._lock:
+                self._flushed_through = max(self._flushed_through, last)
+            return len(rows)
+
+
+meter = AIMeter()
+
+
+@contextmanager
+def metered(feature: str, prompt: str = '', system_prompt: str = '', model: str = ''):
+    """
+    Meter one AI call. The caller sets `call.response` (and `call.cache_hit`) on the
+    yielded record; the backend can report the model it used via note_model().
+    """
+    call = CallRecord(feature, current_user_id.get(), model,
+                      estimate_tokens(system_prompt) + estimate_tokens(prompt))
+    token = _current_call.set(call)
+    start = time.perf_counter()
+    try:
+        yield call
+    except Exception:
+        call.error = True
+        raise
+    finally:
+        call.wall_ms = (time.perf_counter() - start) * 1000
+        _current_call.reset(token)
+        if call.response is not None and not call.response_tokens:
+            call.response_tokens = estimate_tokens(call.response)
+        call.response = None
+        meter.record(call)
+
+
+def note_model(model: str, fallback: bool = False):
+    """Called by a backend to record which model answered the current metered call."""
+    call = _current_call.get()
+    if call is not None:
+        call.model = model
+        call.fallback = call.fallback or fallback
+
+
+def ai_usage_summary(minutes=None, include_users=True, user_ids=None) -> dict:
+    return meter.summary(minutes, include_users, user_ids)
+
+
+def _flush_loop(app, socketio):
+    logger.info("AI metrics flusher started")
+    while True:
+        socketio.sleep(AI_METRICS_FLUSH_SECONDS)
+        try:
+            with app.app_context():
+                meter.flush()
+        except Exception:
+            logger.exception("AI metrics flush loop error")
+
+
+_flusher_pid = None
+_flusher_lock = threading.Lock()
+
+
+def ensure_metrics_flusher(app, socketio):
+    """Start the periodic flush once per serving process (see utils.job_queue.ensure_job_worker)."""
+    global _flusher_pid
+    if not AI_METRICS_ENABLED or _flusher_pid == os.getpid():
+        return
+    with _flusher_lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+        socketio.start_background_task(_flush_loop, app, socketio)
@@ -0,0 +1,121 @@
+"""
+Prompt registry for the files in ai_prompts/.
+
+Every `*.txt` file is read once (preloaded at startup) and compiled into a
+`string.Template`; placeholders use `$name`. Each prompt carries a short
+content hash as its version, which callers pass into the response cache key
+so cached replies are dropped when a prompt is edited. Files are re-read when
+their mtime changes, checked at most every AI_PROMPT_RELOAD_SECONDS.
+"""
+import os
+import time
+import string
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+AI_PROMPTS_DIR = os.environ.get("AI_PROMPTS_DIR", os.path.join(BASE_DIR, 'ai_prompts'))
+AI_PROMPT_RELOAD_SECONDS = float(os.environ.get("AI_PROMPT_RELOAD_SECONDS", "2"))  # 0 disables hot reload
+
+
+class PromptTemplate:
+    def __init__(self, name, path, text, mtime):
+        self.name = name
+        self.path = path
+        self.text = text
+        self.mtime = mtime
+        self.template = string.Template(text)
+        self.version = hashlib.sha256(text.encode('utf-8')).hexdigest()[:12]
+        self.checked_at = time.monotonic()
+        # Prompts without placeholders are rendered once here
+        self._static = text if not self.template.get_identifiers() else None
+
+    def render(self, **values) -> str:
+        if self._static is not None:
+            return self._static
+        return self.template.substitute(**values)
+
+
+class PromptRegistry:
+    def __init__(self, directory=AI_PROMPTS_DIR, reload_seconds=AI_PROMPT_RELOAD_SECONDS):
+        self.directory = directory
+        self.reload_seconds = reload_seconds
+        self._prompts = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def _read(self, name, path):
+        mtime = os.path.getmtime(path)
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read().strip()
+        return PromptTemplate(name, path, text, mtime)
+
+    def load_all(self):
+        """Read every prompt file in the directory."""
+        prompts = {}
+        for filename in sorted(os.listdir(self.directory)):
+            if not filename.endswith('.txt'):
+                continue
+            name = filename[:-len('.txt')]
+            try:
+                prompts[name] = self._read(name, os.path.join(self.directory, filename))
+            except OSError as e:
+                logger.error(f"Could not load prompt '{name}': {e}")
+        with self._lock:
+            self._prompts = prompts
+            self._loaded = True
+        logger.info(f"Loaded {len(prompts)} prompts from {self.directory}")
+        return prompts
+
+    def _maybe_reload(self, prompt):
+        if self.reload_seconds <= 0:
+            return prompt
+        now = time.monotonic()
+        if now - prompt.checked_at < self.reload_seconds:
+            return prompt
+        prompt.checked_at = now
+        try:
+            if os.path.getmtime(prompt.path) == prompt.mtime:
+                return prompt
+            fresh = self._read(prompt.name, prompt.path)
+        except OSError as e:
+            logger.warning(f"Keeping cached prompt '{prompt.name}'; reload failed: {e}")
+            return prompt
+        with self._lock:
+            self._prompts[prompt.name] = fresh
+        if fresh.version != prompt.version:
+            logger.info(f"Prompt '{prompt.name}' reloaded: {prompt.version} -> {fresh.version}")
+        return fresh
+
+    def get(self, name) -> PromptTemplate:
+        if not self._loaded:
+            self.load_all()
+        prompt = self._prompts.get(name)
+        if prompt is None:
+            raise KeyError(f"Unknown prompt '{name}' (looked in {self.directory})")
+        return self._maybe_reload(prompt)
+
+    def render(self, name, **values) -> str:
+        return self.get(name).render(**values)
+
+    def versions(self) -> dict:
+        if not self._loaded:
+            self.load_all()
+        return {name: p.version for name, p in sorted(self._prompts.items())}
+
+
+prompt_registry = PromptRegistry()
+
+
+def render_prompt_pair(name, **values):
+    """
+    Render `<name>_system` and `<name>_user` and return
+    (system_prompt, prompt, version) where version combines both file hashes.
+    """
+    system = prompt_registry.get(f"{name}_system")
+    user = prompt_registry.get(f"{name}_user")
+    return system.render(), user.render(**values), f"{system.version}.{user.version}"
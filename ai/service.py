@@ -1,130 +1,253 @@
 import os
 import json
-import re
+import zlib
 import logging
 import asyncio
-from ai.gemini_impl import ask_gemini_system_user
-from severity import heuristic_severity
+from ai.backend import get_provider, AI_BACKEND
+from ai.prompts import prompt_registry, render_prompt_pair
+from ai.json_extract import extract_json, apply_schema
+from ai.cache import response_cache, make_cache_key
+from ai.fanout import run_with_deadline, AI_REPORT_DEADLINE_SECONDS
+from ai.metering import metered, ai_usage_summary
+from severity import heuristic_severity_detail
+from risk_tracker import risk_tracker, RISK_ESCALATE, RISK_LLM_GATE
+from risk_classifier import classify_risk
 
 logger = logging.getLogger(__name__)
 
-def ask(prompt: str, system_prompt: str = "You are a helpful AI assistant.", **kwargs) -> str:
+# Generation settings actually sent by `ask`; they are part of every cache key
+ASK_MAX_TOKENS = 1024
+ASK_TEMPERATURE = 0.7
+# Output budget per assessment in a batched insight call
+ASSESSMENT_BATCH_TOKENS_PER_ITEM = int(os.environ.get("ASSESSMENT_BATCH_TOKENS_PER_ITEM", "350"))
+
+# Field -> (type, default) for each JSON reply shape; used to repair truncated or partial replies.
+# Severity and action have no default: a reply cut off before them falls back to the heuristic.
+SEVERITY_SCHEMA = {
+    'reply': (str, 'I hear you. Can you say more?'),
+    'severity': (int, None),
+    'reason': (str, ''),
+    'recommended_action': (str, None),
+}
+RECOMMENDED_ACTIONS = ('none', 'recommend_appointment', 'emergency_hotline')
+ASSESSMENT_INSIGHTS_SCHEMA = {'summary': (str, ''), 'recommendations': (list, []), 'resources': (list, [])}
+PROGRESS_RECOMMENDATIONS_SCHEMA = {'insights': (list, []), 'actions': (list, [])}
+DIGITAL_DETOX_SCHEMA = {'analysis': (str, ''), 'recommendations': (list, []), 'score': (str, '')}
+MEDICATION_ADHERENCE_SCHEMA = {'adherence_score': (int, 0), 'insight': (str, ''), 'recommendation': (str, '')}
+MESSAGE_TRIAGE_SCHEMA = {'severity': (int, None), 'reason': (str, '')}
+
+# How chat messages the risk classifier rates confidently low risk are answered: 'llm' (default) sends
+# the plain chat prompt without the severity check (response-cached); 'local' (opt-in) picks one of
+# LOW_RISK_REPLIES with no backend call
+CHAT_FAST_PATH = os.environ.get("CHAT_FAST_PATH", "llm").lower()
+LOW_RISK_REPLIES = (
+    "Thanks for sharing that with me. How are you feeling about it?",
+    "I'm glad you reached out. What's been on your mind today?",
+    "That makes sense. Would you like to tell me a bit more?",
+    "I'm here and listening. What would be most helpful to talk about right now?",
+)
+
+def _parse_reply(response: str, schema: dict = None, expect: str = 'object'):
+    """First JSON value in a reply (code fences and prose skipped); ValueError if there is none."""
+    value = extract_json(response, schema=schema, expect=expect)
+    if value is None:
+        raise ValueError("No usable JSON in AI reply")
+    return value
+
+def _ask_cache_key(prompt: str, system_prompt: str, prompt_version: str = '') -> str:
+    return make_cache_key(system_prompt, prompt, get_provider().model, ASK_TEMPERATURE, ASK_MAX_TOKENS,
+                          version=prompt_version)
+
+def ask(prompt: str, system_prompt: str = "You are a helpful AI assistant.", cache: bool = False,
+        prompt_version: str = '', feature: str = 'general', **kwargs) -> str:
     """
     A simple wrapper to call the configured AI client.
+    With cache=True, identical (system prompt, prompt) pairs are answered from the response cache;
+    prompt_version (from the prompt registry) is part of the key. `feature` tags the call for metering.
     """
-    try:
-        return ask_gemini_system_user(system_prompt, prompt, max_tokens=1024, temperature=0.7)
-    except Exception as e:
-        logger.exception("AI service 'ask' failed")
-        raise e
+    provider = get_provider()
+    with metered(feature, prompt, system_prompt, model=provider.model) as call:
+        cache_key = _ask_cache_key(prompt, system_prompt, prompt_version) if cache else None
+        if cache_key:
+            cached = response_cache.get(cache_key)
+            if cached is not None:
+                call.cache_hit = True
+                call.response = cached
+                return cached
+        try:
+            response = provider.ask(prompt, system_prompt=system_prompt, max_tokens=ASK_MAX_TOKENS, temperature=ASK_TEMPERATURE)
+        except Exception as e:
+            logger.exception("AI service 'ask' failed")
+            raise e
+        call.response = response
+        if cache_key:
+            response_cache.set(cache_key, response)
+        return response
 
-async def ask_with_severity(user_text: str, user_id=None, prefer_llm=True):
-    # 1) quick heuristic
-    score = heuristic_severity(user_text)
+def forget_cached(prompt: str, system_prompt: str, prompt_version: str = ''):
+    """Evict a cached reply that could not be used (e.g. it failed JSON parsing)."""
+    response_cache.discard(_ask_cache_key(prompt, system_prompt, prompt_version))
 
-    # 2) load system prompt from file for maintainability
-    try:
-        # Corrected path to be relative to project root
-        with open('ai_prompts/psychologist_system.txt','r', encoding='utf-8') as f:
-            system_prompt = f.read()
-    except Exception:
-        system_prompt = ("You are Dr. Anya, an empathetic psychologist. "
-                         "Respond concisely. "
-                         "Output ONLY JSON: "
-                         '{"reply": "string", "severity": int(0-10), "reason": "string<=12words", ' 
-                         '"recommended_action": "none"|"recommend_appointment"|"emergency_hotline"}.')
+def check_api_status() -> dict:
+    """
+    Report AI configuration, per-model client latency (cold vs warm calls), circuit state
+    and the loaded prompt versions. Usage is per feature only: any signed-in user may call
+    this, so per-user figures stay on the provider-only /provider/api/ai-usage.
+    """
+    return dict(
+        get_provider().status(),
+        backend=AI_BACKEND,
+        prompts=prompt_registry.versions(),
+        usage=ai_usage_summary(15, include_users=False),
+        cache=response_cache.stats()
+    )
+
+def reply_with_severity(user_text: str, user_id=None, prefer_llm=True) -> dict:
+    """
+    Reply to a chat message and rate its risk.
+
+    With a user_id the message joins that user's conversation risk (risk_tracker).
+    The AI severity check (JSON reply with a severity) always runs when the message
+    or the conversation reaches RISK_LLM_GATE. Below that the local risk classifier
+    decides: messages it rates confidently low risk get the plain chat reply
+    without the severity check (a local reply with CHAT_FAST_PATH=local) and the
+    heuristic score stands; uncertain ones still get the AI check. Without a
+    classifier, tracked conversations below the gate skip the check and anonymous
+    messages get it. Sustained risk across the conversation escalates even when no
+    single message would.
+    """
+    # 1) quick heuristic; matched keywords are returned so a score can be explained
+    heuristic = heuristic_severity_detail(user_text)
+    score = heuristic['score']
+    signals = sorted({m['keyword'] for m in heuristic['matches']})
+    conversation = risk_tracker.observe(user_id, score) if user_id is not None else None
+
+    # 2) local classifier for messages the heuristic does not already send to the AI check
+    risk_probability = None
+    if not prefer_llm:
+        ai_check = False
+    elif conversation is not None and risk_tracker.needs_ai_check(score, conversation):
+        ai_check = True
+    elif conversation is None and score >= RISK_LLM_GATE:
+        ai_check = True
+    else:
+        classified = classify_risk(user_text)
+        if classified is not None:
+            risk_probability, confidently_low = classified
+            ai_check = not confidently_low
+        else:
+            ai_check = conversation is None
 
     raw = None
-    try:
-        # call gemini wrapper with reduced tokens for chat
-        raw = ask_gemini_system_user(system_prompt, user_text, max_tokens=300, temperature=0.2)
-    except Exception:
-        logger.exception("Gemini call failed inside ask_with_severity")
+    reply_text = None
+    if ai_check:
+        # 3) system prompt from the registry (preloaded; no file I/O per message)
+        try:
+            system_prompt = prompt_registry.render('psychologist_system')
+        except Exception:
+            system_prompt = ("You are Dr. Anya, an empathetic psychologist. "
+                             "Respond concisely. "
+                             "Output ONLY JSON: "
+                             '{"reply": "string", "severity": int(0-10), "reason": "string<=12words", '
+                             '"recommended_action": "none"|"recommend_appointment"|"emergency_hotline"}.')
+        try:
+            # call the configured backend with reduced tokens for chat
+            provider = get_provider()
+            with metered('chat_severity', user_text, system_prompt, model=provider.model) as call:
+                raw = call.response = provider.ask(user_text, system_prompt=system_prompt, max_tokens=300, temperature=0.2)
+        except Exception:
+            logger.exception("AI backend call failed inside reply_with_severity")
+    elif risk_probability is not None and CHAT_FAST_PATH == 'local':
+        # confidently low risk: answered locally, no backend call and no severity rating
+        reply_text = _low_risk_reply(user_text)
+    else:
+        # low risk (classifier or quiet conversation): an ordinary chat reply, no severity rating;
+        # repeated small talk is answered from the response cache
+        reply_text = generate_chat_response(user_text, cache=risk_probability is not None)
 
     parsed = None
     recommended_action = 'none'
     reason = ''
     if raw:
-        # attempt to find first JSON object inside the returned text
-        # The model should return valid JSON, but this is a good fallback
-        clean_raw = raw.strip().replace('```json', '').replace('```', '')
-        m = re.search(r'\{[\s\S]*\}', clean_raw)
-        json_str = m.group(0) if m else clean_raw.strip()
-        
-        # Try to fix truncated JSON by adding missing closing parts
-        try:
-            parsed = json.loads(json_str)
-        except json.JSONDecodeError as e:
-            logger.warning(f"JSON parsing failed, attempting to fix truncated response: {json_str[:100]}...")
-            # Try to fix common truncation issues
-            if json_str.count('{') > json_str.count('}'):
-                json_str += '}'
-            if json_str.count('"') % 2 != 0:
-                json_str += '"'
-            try:
-                parsed = json.loads(json_str)
-            except Exception:
-                logger.exception(f"Failed parsing LLM JSON response even after fixes: {json_str}")
-                parsed = None
+        # single pass over the reply; truncated JSON is repaired against the schema
+        parsed = extract_json(raw, schema=SEVERITY_SCHEMA)
+        if parsed is None:
+            logger.warning(f"Failed parsing LLM JSON response: {raw[:100]}...")
 
     if parsed:
         reply_text = parsed.get('reply','I hear you. Can you say more?')
-        llm_sev = int(parsed.get('severity', score))
-        score = max(score, min(10, llm_sev))
-        recommended_action = parsed.get('recommended_action','none')
-        reason = parsed.get('reason','')
-    else:
+        if 'severity' in parsed:
+            score = max(score, min(10, parsed['severity']))
+    elif reply_text is None:
         # fallback short reply
         reply_text = "I hear you — that sounds really hard. Can you tell me what happened before this?"
-        if score >= 9:
-            recommended_action = 'emergency_hotline'
-            reason = 'explicit self-harm language or plan'
-        elif score >= 7:
+
+    if parsed and parsed.get('recommended_action') in RECOMMENDED_ACTIONS:
+        recommended_action = parsed['recommended_action']
+        reason = parsed.get('reason','')
+    elif score >= 9:
+        # no usable action from the model (no reply, or cut off before it): derive it from the score
+        recommended_action = 'emergency_hotline'
+        reason = 'explicit self-harm language or plan'
+    elif score >= 7:
+        recommended_action = 'recommend_appointment'
+        reason = 'high distress signals'
+    else:
+        recommended_action = 'none'
+        reason = 'heuristic check'
+
+    conversation_risk = None
+    if conversation is not None:
+        if parsed:
+            risk_tracker.revise_latest(user_id, score)
+            conversation = risk_tracker.snapshot(user_id) or conversation
+        conversation_risk = conversation['risk']
+        if conversation_risk >= RISK_ESCALATE and recommended_action == 'none':
             recommended_action = 'recommend_appointment'
-            reason = 'high distress signals'
-        else:
-            recommended_action = 'none'
-            reason = 'heuristic check'
+            reason = 'sustained distress across recent messages'
 
-    escalate = score >= 7
+    escalate = score >= 7 or (conversation_risk is not None and conversation_risk >= RISK_ESCALATE)
     return {
         'reply': reply_text,
         'severity': int(score),
         'escalate': bool(escalate),
         'recommended_action': recommended_action,
-        'reason': reason
+        'reason': reason,
+        'signals': signals,
+        'conversation_risk': conversation_risk,
+        'risk_probability': round(risk_probability, 3) if risk_probability is not None else None,
+        'ai_checked': ai_check
     }
 
+def _low_risk_reply(user_text: str) -> str:
+    """A LOW_RISK_REPLIES entry; the same message always gets the same reply."""
+    return LOW_RISK_REPLIES[zlib.crc32(user_text.encode('utf-8')) % len(LOW_RISK_REPLIES)]
+
+async def ask_with_severity(user_text: str, user_id=None, prefer_llm=True):
+    return reply_with_severity(user_text, user_id=user_id, prefer_llm=prefer_llm)
+
+def _request_assessment_insights(assessment_type: str, score: int, responses: list):
+    """Parsed insights for one assessment, or None if the reply had no usable JSON."""
+    # Concise prompt for token efficiency
+    system_prompt, prompt, version = render_prompt_pair('assessment_insights', assessment_type=assessment_type, score=score, responses=responses)
+    response = ask(prompt, system_prompt=system_prompt, max_tokens=600, cache=True, prompt_version=version, feature='assessment_insights')
+    
+    # Try to parse the response as JSON
+    try:
+        return _parse_reply(response, ASSESSMENT_INSIGHTS_SCHEMA)
+    except ValueError:
+        logger.error(f"Failed to parse assessment insights JSON: {response}")
+        forget_cached(prompt, system_prompt, version)
+        return None
+
 def generate_assessment_insights(assessment_type: str, score: int, responses: list) -> dict:
     """
     Generate AI-powered insights based on assessment results.
     Returns a dictionary with summary, recommendations, and resources.
     """
     try:
-        # Concise prompt for token efficiency
-        prompt = f"""
-        Type: {assessment_type}, Score: {score}, Responses: {responses}
-        
-        Return JSON:
-        {{
-            "summary": "Brief summary (<100 words)",
-            "recommendations": ["Rec 1", "Rec 2", "Rec 3"],
-            "resources": ["Res 1", "Res 2", "Res 3"]
-        }}
-        
-        Context: GAD-7/PHQ-9 scoring. Be empathetic, actionable.
-        """
-        
-        system_prompt = "You are a mental health professional."
-        response = ask(prompt, system_prompt=system_prompt, max_tokens=600)
-        
-        # Try to parse the response as JSON
-        clean_response = response.strip().replace('```json', '').replace('```', '')
-        try:
-            insights = json.loads(clean_response)
-            return insights
-        except json.JSONDecodeError:
-            logger.error(f"Failed to parse assessment insights JSON: {response}")
+        insights = _request_assessment_insights(assessment_type, score, responses)
+        if insights is None:
             # If parsing fails, create a basic response
             return {
                 "summary": f"Your {assessment_type} assessment indicates a score of {score}. This suggests a need for attention to your mental health.",
@@ -139,6 +262,7 @@ def generate_assessment_insights(assessment_type: str, score: int, responses: li
                     "Find a therapist at Psychology Today or similar directories"
                 ]
             }
+        return insights
             
     except Exception as e:
         logger.exception("Error generating assessment insights")
@@ -157,29 +281,85 @@ def generate_assessment_insights(assessment_type: str, score: int, responses: li
             ]
         }
 
+def generate_assessment_insights_batch(assessments: list, max_tokens_per_item: int = ASSESSMENT_BATCH_TOKENS_PER_ITEM,
+                                       before_call=None) -> dict:
+    """
+    Generate insights for several assessments with one model call.
+
+    `assessments` is a list of dicts with id, assessment_type, score and responses.
+    The reply is split back into per-id results; items that are missing or malformed
+    in the batch reply are retried one by one. Returns {id: insights or None}, where
+    None means the item failed on its own as well. `before_call()`, when given, runs
+    before every model call, the batch call and each retry (e.g. a rate limiter).
+    """
+    if not assessments:
+        return {}
+    by_id = {str(a['id']): a for a in assessments}
+    results = {}
+
+    lines = [json.dumps({
+        'id': key,
+        'type': a['assessment_type'],
+        'score': a['score'],
+        'responses': a.get('responses') or [],
+    }, default=str) for key, a in by_id.items()]
+    system_prompt, prompt, _ = render_prompt_pair('assessment_insights_batch', items='\n'.join(lines), count=len(lines))
+    try:
+        if before_call is not None:
+            before_call()
+        provider = get_provider()
+        with metered('insights_batch', prompt, system_prompt, model=provider.model) as call:
+            response = call.response = provider.ask(prompt, system_prompt=system_prompt,
+                                                    max_tokens=max_tokens_per_item * len(lines), temperature=ASK_TEMPERATURE)
+        parsed = extract_json(response, schema={'results': (list, [])})
+    except Exception:
+        logger.exception(f"Batch insight call for {len(lines)} assessments failed")
+        parsed = None
+
+    for entry in (parsed or {}).get('results', []):
+        if not isinstance(entry, dict):
+            continue
+        key = str(entry.pop('id', ''))
+        if key not in by_id or key in results:
+            continue
+        insights = apply_schema(entry, ASSESSMENT_INSIGHTS_SCHEMA)
+        if not insights or not insights['summary']:
+            continue
+        results[key] = insights
+        # Seed the single-item cache so later per-assessment lookups are free
+        a = by_id[key]
+        item_system, item_prompt, item_version = render_prompt_pair(
+            'assessment_insights', assessment_type=a['assessment_type'], score=a['score'], responses=a.get('responses') or [])
+        response_cache.set(_ask_cache_key(item_prompt, item_system, item_version), json.dumps(insights))
+
+    missing = [key for key in by_id if key not in results]
+    if missing:
+        logger.warning(f"Batch reply covered {len(results)}/{len(by_id)} assessments; retrying {len(missing)} individually")
+    for key in missing:
+        a = by_id[key]
+        try:
+            if before_call is not None:
+                before_call()
+            results[key] = _request_assessment_insights(a['assessment_type'], a['score'], a.get('responses') or [])
+        except Exception:
+            logger.exception(f"Insight retry for assessment {key} failed")
+            results[key] = None
+
+    return {a['id']: results[str(a['id'])] for a in assessments}
+
 def generate_progress_recommendations(user_data: dict) -> dict:
     """
     Generate AI-powered progress recommendations based on user data.
     """
     try:
-        prompt = f"""
-        Data: {user_data}
+        system_prompt, prompt, version = render_prompt_pair('progress_recommendations', user_data=user_data)
+        response = ask(prompt, system_prompt=system_prompt, max_tokens=500, cache=True, prompt_version=version, feature='progress_insights')
         
-        Return JSON:
-        {{
-            "insights": [{{"title": "T1", "desc": "D1"}}],
-            "actions": [{{"title": "A1", "desc": "D1", "priority": "high"}}]
-        }}
-        """
-        
-        system_prompt = "You are a mental health coach."
-        response = ask(prompt, system_prompt=system_prompt, max_tokens=500)
-        
-        clean_response = response.strip().replace('```json', '').replace('```', '')
         try:
-            return json.loads(clean_response)
-        except json.JSONDecodeError:
+            return _parse_reply(response, PROGRESS_RECOMMENDATIONS_SCHEMA)
+        except ValueError:
              logger.error(f"Failed to parse progress recommendations JSON: {response}")
+             forget_cached(prompt, system_prompt, version)
              return {
                 "insights": [
                     {"title": "Keep Going", "desc": "You're making progress on your mental health journey."},
@@ -208,25 +388,14 @@ def generate_digital_detox_insights(detox_data: dict) -> dict:
     Generate AI-powered digital detox insights.
     """
     try:
-        prompt = f"""
-        Data: {detox_data}
-        
-        Return JSON:
-        {{
-            "analysis": "Brief analysis",
-            "recommendations": ["Rec 1", "Rec 2"],
-            "score": "Score/100 (string)"
-        }}
-        """
+        system_prompt, prompt, version = render_prompt_pair('digital_detox', detox_data=detox_data)
+        response = ask(prompt, system_prompt=system_prompt, max_tokens=400, cache=True, prompt_version=version, feature='detox')
         
-        system_prompt = "You are a digital wellness coach."
-        response = ask(prompt, system_prompt=system_prompt, max_tokens=400)
-        
-        clean_response = response.strip().replace('```json', '').replace('```', '')
         try:
-            return json.loads(clean_response)
-        except json.JSONDecodeError:
+            return _parse_reply(response, DIGITAL_DETOX_SCHEMA)
+        except ValueError:
             logger.error(f"Failed to parse digital detox insights JSON: {response}")
+            forget_cached(prompt, system_prompt, version)
             return {
                 "analysis": "Your digital habits show room for improvement in screen time management.",
                 "recommendations": [
@@ -248,38 +417,46 @@ def generate_digital_detox_insights(detox_data: dict) -> dict:
             "score": "70"
         }
 
-def generate_chat_response(prompt: str) -> str:
+def generate_chat_response(prompt: str, cache: bool = False) -> str:
     """
     Generate a chat response for the AI chat feature.
+    With cache=True a repeated message is answered from the response cache (used for low-risk small talk).
     """
     try:
-        enhanced_prompt = f"User: {prompt}\nResponse:"
-        system_prompt = "Supportive mental health assistant. Brief, empathetic (2-3 sentences)."
-        
-        return ask(enhanced_prompt, system_prompt=system_prompt, max_tokens=150)
+        system_prompt, enhanced_prompt, version = render_prompt_pair('chat', message=prompt)
+        return ask(enhanced_prompt, system_prompt=system_prompt, max_tokens=150, cache=cache,
+                   prompt_version=version, feature='chat')
     except Exception as e:
         logger.exception("Error generating chat response")
         return "I'm here to support you. How can I help you today?"
 
+def stream_chat_response(prompt: str, should_stop=None):
+    """
+    Streamed counterpart of generate_chat_response; yields reply text chunks.
+    """
+    system_prompt, enhanced_prompt, _ = render_prompt_pair('chat', message=prompt)
+    provider = get_provider()
+    with metered('chat', enhanced_prompt, system_prompt, model=provider.model) as call:
+        parts = []
+        for chunk in provider.stream(enhanced_prompt, should_stop=should_stop, system_prompt=system_prompt,
+                                     max_tokens=ASK_MAX_TOKENS, temperature=ASK_TEMPERATURE):
+            parts.append(chunk)
+            yield chunk
+        call.response = ''.join(parts)
+
 def generate_goal_suggestions(patient_data: dict) -> list:
     """
     Generate AI-powered goal suggestions based on patient data.
     """
     try:
-        prompt = f"""
-        Data: {patient_data}
-        
-        Suggest 3 goals. Return JSON array: [{{"title": "T", "description": "D"}}]
-        """
-        
-        system_prompt = "Wellness coach."
-        response = ask(prompt, system_prompt=system_prompt, max_tokens=300)
+        system_prompt, prompt, version = render_prompt_pair('goal_suggestions', patient_data=patient_data)
+        response = ask(prompt, system_prompt=system_prompt, max_tokens=300, cache=True, prompt_version=version, feature='goals')
         
-        clean_response = response.strip().replace('```json', '').replace('```', '')
         try:
-            return json.loads(clean_response)
-        except json.JSONDecodeError:
+            return _parse_reply(response, expect='array')
+        except ValueError:
             logger.error(f"Failed to parse goal suggestions JSON: {response}")
+            forget_cached(prompt, system_prompt, version)
             return []
     except Exception as e:
         logger.exception("Error generating goal suggestions")
@@ -290,26 +467,14 @@ def analyze_medication_adherence(medication_logs: list, patient_data: dict) -> d
     Analyze medication adherence and provide insights.
     """
     try:
-        prompt = f"""
-        Logs: {medication_logs}
-        Data: {patient_data}
+        system_prompt, prompt, version = render_prompt_pair('medication_adherence', medication_logs=medication_logs, patient_data=patient_data)
+        response = ask(prompt, system_prompt=system_prompt, max_tokens=300, cache=True, prompt_version=version, feature='medication_adherence')
         
-        Return JSON:
-        {{
-            "adherence_score": 85,
-            "insight": "Brief insight",
-            "recommendation": "Brief rec"
-        }}
-        """
-        
-        system_prompt = "Medical assistant."
-        response = ask(prompt, system_prompt=system_prompt, max_tokens=300)
-        
-        clean_response = response.strip().replace('```json', '').replace('```', '')
         try:
-            return json.loads(clean_response)
-        except json.JSONDecodeError:
+            return _parse_reply(response, MEDICATION_ADHERENCE_SCHEMA)
+        except ValueError:
             logger.error(f"Failed to parse medication adherence JSON: {response}")
+            forget_cached(prompt, system_prompt, version)
             return {
                 "adherence_score": 0,
                 "insight": "Unable to analyze adherence at this time.",
@@ -323,27 +488,25 @@ def analyze_medication_adherence(medication_logs: list, patient_data: dict) -> d
             "recommendation": "Continue tracking your medication."
         }
 
+def generate_wellness_report_insights(patient_data: dict, medication_logs: list,
+                                      deadline_seconds: float = AI_REPORT_DEADLINE_SECONDS, on_late=None):
+    """
+    Run the wellness report's goal-suggestion and medication-adherence calls concurrently.
+    Returns (results, pending) as from ai.fanout.run_with_deadline; sections still running
+    at the deadline are passed to on_late(section, result) when they finish.
+    """
+    return run_with_deadline({
+        'goal_suggestions': lambda: generate_goal_suggestions(patient_data),
+        'medication_adherence': lambda: analyze_medication_adherence(medication_logs, patient_data),
+    }, deadline_seconds=deadline_seconds, on_late=on_late)
+
 def generate_journal_insights(title: str, content: str, sentiment: str) -> str:
     """
     Generate AI-powered insights for a journal entry.
     """
     try:
-        prompt = f"""
-        Title: {title}
-        Content: {content}
-        Sentiment: {sentiment}
-        
-        Provide a supportive response with:
-        1. Insights (2-3 sentences)
-        2. Suggestions (3 bullet points)
-        3. Coping Strategies (2-3 items)
-        4. Encouragement (1 sentence)
-        
-        Format: Plain text with headers. Keep it under 800 chars.
-        """
-        
-        system_prompt = "You are Dr. Anya, a compassionate wellness coach."
-        return ask(prompt, system_prompt=system_prompt, max_tokens=400)
+        system_prompt, prompt, _ = render_prompt_pair('journal_insights', title=title, content=content, sentiment=sentiment)
+        return ask(prompt, system_prompt=system_prompt, max_tokens=400, feature='journal')
     except Exception as e:
         logger.exception("Error generating journal insights")
         return "Thank you for sharing. Consider discussing these feelings with a professional."
@@ -353,19 +516,27 @@ def analyze_voice_emotion(transcribed_text: str, audio_features: dict) -> str:
     Analyze voice recording for emotion and insights.
     """
     try:
-        prompt = f"""
-        Text: {transcribed_text}
-        Audio Features: {audio_features}
-        
-        Analyze emotion. Return format:
-        EMOTION: [emotion]
-        CONFIDENCE: [high/med/low]
-        INSIGHTS: [brief explanation]
-        SUGGESTIONS: [2 brief suggestions]
-        """
-        
-        system_prompt = "You are an AI analyzing voice for emotion."
-        return ask(prompt, system_prompt=system_prompt, max_tokens=300)
+        system_prompt, prompt, _ = render_prompt_pair('voice_emotion', transcribed_text=transcribed_text, audio_features=audio_features)
+        return ask(prompt, system_prompt=system_prompt, max_tokens=300, feature='voice')
     except Exception as e:
         logger.exception("Error analyzing voice emotion")
-        return "Neutral: Analysis unavailable."
\ No newline at end of file
+        return "Neutral: Analysis unavailable."
+
+def assess_message_severity(message: str):
+    """
+    Rate a patient message for triage. Returns {'severity': 0-10, 'reason': str},
+    or None when the backend failed or the reply had no usable JSON.
+    """
+    try:
+        system_prompt, prompt, _ = render_prompt_pair('message_triage', message=message)
+        response = ask(prompt, system_prompt=system_prompt, max_tokens=120, feature='message_triage')
+        rating = _parse_reply(response, MESSAGE_TRIAGE_SCHEMA)
+        if 'severity' not in rating:
+            # Cut off before the rating: no AI opinion rather than a made-up 0
+            logger.warning(f"Message triage reply has no severity: {response[:100]}...")
+            return None
+        rating['severity'] = max(0, min(10, rating['severity']))
+        return rating
+    except Exception:
+        logger.exception("Error rating message severity")
+        return None
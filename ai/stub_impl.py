@@ -0,0 +1,138 @@
+"""
+Offline stand-in for the LLM backend (AI_BACKEND=stub).
+
+Replies come from JSON fixtures, one family per prompt shape (severity JSON,
+assessment insights, goals, detox, ...), so every caller gets output it can
+parse. Latency is drawn from a configurable distribution using a seeded RNG,
+which makes load-test runs repeatable without network access or API quota.
+
+AI_STUB_LATENCY examples: "fixed:800", "uniform:300,1500", "lognormal:900,0.35"
+(median ms, sigma). "none" disables the delay.
+"""
+import os
+import json
+import math
+import time
+import re
+import random
+import hashlib
+import logging
+import threading
+from ai.interface import AIProvider
+from ai.metering import note_model
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+
+AI_STUB_FIXTURES = os.environ.get("AI_STUB_FIXTURES", os.path.join(BASE_DIR, 'fixtures', 'stub_replies.json'))
+AI_STUB_LATENCY = os.environ.get("AI_STUB_LATENCY", "")  # empty: use each family's own latency
+AI_STUB_SEED = int(os.environ.get("AI_STUB_SEED", "1234"))
+AI_STUB_ERROR_RATE = float(os.environ.get("AI_STUB_ERROR_RATE", "0"))
+AI_STUB_CHUNK_MS = float(os.environ.get("AI_STUB_CHUNK_MS", "30"))  # delay between streamed chunks
+
+_ITEM_ID = re.compile(r'"id": "([^"]+)"')
+
+
+def parse_latency(spec: str):
+    """Turn a latency spec into a function rng -> milliseconds."""
+    spec = (spec or 'none').strip().lower()
+    kind, _, args = spec.partition(':')
+    values = [float(v) for v in args.split(',') if v.strip()]
+    if kind == 'none':
+        return lambda rng: 0.0
+    if kind == 'fixed' and len(values) == 1:
+        return lambda rng: values[0]
+    if kind == 'uniform' and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == 'lognormal' and len(values) == 2:
+        mu = math.log(values[0])
+        return lambda rng: rng.lognormvariate(mu, values[1])
+    raise ValueError(f"Invalid stub latency spec: {spec!r}")
+
+
+class StubProvider(AIProvider):
+    """Deterministic fixture-backed AIProvider with simulated latency."""
+
+    name = "stub"
+    model = "stub"
+
+    def __init__(self, fixtures_path=AI_STUB_FIXTURES, latency=AI_STUB_LATENCY, seed=AI_STUB_SEED,
+                 error_rate=AI_STUB_ERROR_RATE):
+        with open(fixtures_path, 'r', encoding='utf-8') as f:
+            fixtures = json.load(f)
+        self.default_reply = fixtures.get('default', '')
+        self.families = []
+        for family in fixtures.get('families', []):
+            self.families.append({
+                'name': family['name'],
+                'match': family['match'],
+                'replies': family['replies'],
+                'latency': parse_latency(latency or family.get('latency', 'none')),
+                'per_id': family.get('per_id', False),
+            })
+        self._default_latency = parse_latency(latency or 'none')
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._calls = {}
+        logger.info(f"Stub AI backend loaded {len(self.families)} reply families from {fixtures_path}")
+
+    def _match(self, text):
+        for family in self.families:
+            if all(m in text for m in family['match']):
+                return family
+        return None
+
+    def _reply_for(self, system_prompt, prompt):
+        text = f"{system_prompt}\n{prompt}"
+        family = self._match(text)
+        name = family['name'] if family else 'default'
+        with self._lock:
+            self._calls[name] = self._calls.get(name, 0) + 1
+            delay_ms = (family['latency'] if family else self._default_latency)(self._rng)
+            fail = self.error_rate > 0 and self._rng.random() < self.error_rate
+        if family is None:
+            reply = self.default_reply
+        elif family['per_id']:
+            # Batched prompt: one templated item per id, as the batch prompt asks for
+            items = []
+            for item_id in _ITEM_ID.findall(prompt):
+                digest = int(hashlib.sha256(item_id.encode('utf-8')).hexdigest(), 16)
+                items.append(dict(family['replies'][digest % len(family['replies'])], id=item_id))
+            reply = json.dumps({'results': items})
+        else:
+            digest = int(hashlib.sha256(prompt.encode('utf-8')).hexdigest(), 16)
+            reply = family['replies'][digest % len(family['replies'])]
+            if not isinstance(reply, str):
+                reply = json.dumps(reply)
+        return name, reply, delay_ms, fail
+
+    def ask(self, prompt: str, system_prompt: str = "", **kwargs) -> str:
+        note_model(self.model)
+        name, reply, delay_ms, fail = self._reply_for(system_prompt, prompt)
+        time.sleep(delay_ms / 1000.0)
+        if fail:
+            raise RuntimeError(f"Simulated stub failure ({name})")
+        return reply
+
+    def stream(self, prompt: str, should_stop=None, system_prompt: str = "", **kwargs):
+        name, reply, delay_ms, fail = self._reply_for(system_prompt, prompt)
+        time.sleep(delay_ms / 1000.0)
+        if fail:
+            raise RuntimeError(f"Simulated stub failure ({name})")
+        words = reply.split(' ')
+        for i in range(0, len(words), 4):
+            if should_stop is not None and should_stop():
+                return
+            if i:
+                time.sleep(AI_STUB_CHUNK_MS / 1000.0)
+            yield ' '.join(words[i:i + 4]) + (' ' if i + 4 < len(words) else '')
+
+    def status(self) -> dict:
+        return {
+            'model_available': True,
+            'model': self.model,
+            'stub_calls': dict(self._calls),
+            'error_rate': self.error_rate,
+        }
@@ -0,0 +1,107 @@
+"""
+Chart series for the provider analytics page, aggregated in SQL.
+
+Detox logs are summed per day with one GROUP BY query (screen time, and the
+1-5 wellness value stored in DigitalDetoxLog.ai_score_value at write time), so
+the database returns at most one row per day of the window however many
+patients the institution has. Week and month buckets are folded from those
+daily rows. Results are cached in-process for ANALYTICS_CACHE_SECONDS per
+(institution, days, granularity).
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+
+from sqlalchemy import func, case
+
+from extensions import db
+from models import User, DigitalDetoxLog, AI_SCORE_VALUES
+
+ANALYTICS_CACHE_SECONDS = float(os.environ.get("ANALYTICS_CACHE_SECONDS", "300"))
+ANALYTICS_CACHE_SIZE = 256
+SERIES_MAX_DAYS = 366
+GRANULARITIES = ('day', 'week', 'month')
+
+_cache = OrderedDict()  # (institution, days, granularity) -> (expires at, series)
+_cache_lock = threading.Lock()
+
+
+def _bucket(day, granularity):
+    """Label of the bucket `day` falls in: the day, the Monday of its week, or its month."""
+    if granularity == 'week':
+        return (day - timedelta(days=day.weekday())).isoformat()
+    if granularity == 'month':
+        return day.strftime('%Y-%m')
+    return day.isoformat()
+
+
+def _score_value():
+    # Rows inserted without the ORM (demo scripts) have no ai_score_value; map their label in SQL
+    label_value = case(*[(DigitalDetoxLog.ai_score == label, value) for label, value in AI_SCORE_VALUES.items()],
+                       else_=None)
+    return func.coalesce(DigitalDetoxLog.ai_score_value, label_value)
+
+
+def _daily_rows(institution, since):
+    patient_ids = db.session.query(User.id).filter(User.role == 'patient', User.institution == institution)
+    score = _score_value()
+    return db.session.query(
+        DigitalDetoxLog.date,
+        func.sum(DigitalDetoxLog.screen_time_hours),
+        func.count(DigitalDetoxLog.id),
+        func.sum(score),
+        func.count(score),
+    ).filter(DigitalDetoxLog.user_id.in_(patient_ids), DigitalDetoxLog.date >= since) \
+        .group_by(DigitalDetoxLog.date).order_by(DigitalDetoxLog.date).all()
+
+
+def detox_series(institution, days=30, granularity='day') -> dict:
+    """
+    Average screen time and wellness score (1-5) per bucket over the last `days`
+    days, as chart-ready parallel lists. Buckets without logs are left out.
+    Raises ValueError for an unknown granularity.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity '{granularity}'")
+    days = max(1, min(int(days), SERIES_MAX_DAYS))
+    key = (institution, days, granularity)
+    now = time.monotonic()
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached and cached[0] > now:
+            _cache.move_to_end(key)
+            return cached[1]
+
+    # bucket label -> [screen time sum, logs, score sum, scored logs]
+    buckets = OrderedDict()
+    for day, screen_sum, logs, score_sum, scored in _daily_rows(institution, date.today() - timedelta(days=days)):
+        if isinstance(day, str):  # SQLite without type processing
+            day = date.fromisoformat(day)
+        totals = buckets.setdefault(_bucket(day, granularity), [0.0, 0, 0, 0])
+        totals[0] += screen_sum or 0.0
+        totals[1] += logs
+        totals[2] += score_sum or 0
+        totals[3] += scored
+
+    series = {
+        'institution': institution,
+        'days': days,
+        'granularity': granularity,
+        'labels': list(buckets),
+        'screen_time': [round(t[0] / t[1], 1) if t[1] else 0 for t in buckets.values()],
+        'wellness_score': [round(t[2] / t[3], 1) if t[3] else 0 for t in buckets.values()],
+        'logs': [t[1] for t in buckets.values()],
+    }
+    with _cache_lock:
+        _cache[key] = (now + ANALYTICS_CACHE_SECONDS, series)
+        _cache.move_to_end(key)
+        while len(_cache) > ANALYTICS_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return series
+
+
+def clear_series_cache():
+    with _cache_lock:
+        _cache.clear()
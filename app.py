@@ -11,12 +11,14 @@ import base64
 
 from werkzeug.utils import secure_filename
 import uuid
+import threading
 
 import os
 from datetime import datetime, timedelta, date, timezone
 from functools import wraps
 from sqlalchemy import func
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import joinedload
 
 from dotenv import load_dotenv
 
@@ -51,7 +53,7 @@ console_formatter = logging.Formatter('%(levelname)s - %(message)s')
 console_handler.setFormatter(console_formatter)
 logger.addHandler(console_handler)
 
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_from_directory, g
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_from_directory, g, Response
 from nltk.stem import WordNetLemmatizer
 from nltk.tokenize import word_tokenize
 import nltk
@@ -76,8 +78,11 @@ from flask_caching import Cache
 from flask_assets import Environment, Bundle
 # Import blueprints from routes package
 from routes import all_blueprints
+from routes.provider import load_wellness_ai_sections
 
 import ai.service as ai_service
+from severity import heuristic_severity
+from triage import heuristic_triage, TRIAGE_LLM_THRESHOLD
 from extensions import db, migrate, flask_session, compress, csrf
 from models import User, Assessment, DigitalDetoxLog, RPMData, Gamification, ClinicalNote, InstitutionalAnalytics, Appointment, Goal, Medication, MedicationLog, BreathingExerciseLog, YogaLog, MusicTherapyLog, ProgressRecommendation, get_user_wellness_trend, get_institutional_summary, Notification
 from models import BlogPost, BlogComment, BlogLike, BlogInsight, Prescription, MoodLog  # Ensure BlogPost and related models are imported
@@ -127,17 +132,14 @@ def validate_file_security(file):
         logger.error(f"Error during file validation: {e}")
         return False, f"File validation error: {str(e)}"
 
-# Import new dependencies for patient features
-try:
-    from textblob import TextBlob
-    import librosa
-    import numpy as np
-    TEXTBLOB_AVAILABLE = True
-    LIBROSA_AVAILABLE = True
-except ImportError as e:
-    logger.warning(f"Some patient feature dependencies not available: {e}")
-    TEXTBLOB_AVAILABLE = False
-    LIBROSA_AVAILABLE = False
+# Optional dependencies for patient features; only probed here, they are imported where the
+# work runs (utils.cpu_tasks)
+from importlib.util import find_spec
+TEXTBLOB_AVAILABLE = find_spec('textblob') is not None
+LIBROSA_AVAILABLE = find_spec('librosa') is not None and find_spec('numpy') is not None
+if not (TEXTBLOB_AVAILABLE and LIBROSA_AVAILABLE):
+    logger.warning(f"Some patient feature dependencies not available: "
+                   f"textblob={TEXTBLOB_AVAILABLE}, librosa/numpy={LIBROSA_AVAILABLE}")
 
 # Database configuration
 app = Flask(__name__)
@@ -151,10 +153,6 @@ os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///mindful_horizon.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-    'pool_pre_ping': True,
-    'pool_recycle': 300,
-}
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 db_path = os.path.join(basedir, 'instance', 'mindful_horizon.db')
@@ -164,19 +162,14 @@ logger.info(f"Using database at: {app.config['SQLALCHEMY_DATABASE_URI']}")
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-# Database connection pooling configuration
-engine_options = {
-    'pool_size': 10,
-    'pool_recycle': 120,
-    'pool_pre_ping': True,
-    'max_overflow': 20
-}
-
-# Improve SQLite compatibility with threaded servers (e.g., SocketIO)
-if app.config.get('SQLALCHEMY_DATABASE_URI', '').startswith('sqlite:///'):
-    engine_options['connect_args'] = {'check_same_thread': False}
+# Database connection pooling configuration (DB_POOL_* env vars, instrumented pool; see utils.pool_stats).
+# Pool figures are also served on /metrics, which requires METRICS_TOKEN as a bearer token (off when unset).
+from utils.pool_stats import pool_engine_options, pool_status, pool_metrics_text
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = pool_engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
 
-app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options
+# Optional read replica (DATABASE_REPLICA_URL) for analytics and report reads, see utils.db_routing
+from utils.db_routing import replica_binds, replica_status, read_replica
+app.config['SQLALCHEMY_BINDS'] = replica_binds()
 
 # DEBUGGING HELPER: set to True for local debugging to skip strict security headers
 app.config.setdefault('DEBUG_DISABLE_SECURITY', os.getenv('DEBUG_DISABLE_SECURITY', '0') == '1')
@@ -225,6 +218,10 @@ app.config['REMEMBER_COOKIE_SAMESITE'] = 'Strict'
 from extensions import init_extensions
 init_extensions(app)
 
+# PostgreSQL queries yield to the eventlet hub instead of blocking the worker (see utils.green_db)
+from utils.green_db import init_green_db, green_db_status
+init_green_db(app)
+
 from models import *
 from utils.database_utils import check_database, init_db
 
@@ -244,6 +241,38 @@ csrf.init_app(app)
 for blueprint in all_blueprints:
     app.register_blueprint(blueprint)
 
+# Statement counts, DB time and N+1 warnings per request (Server-Timing header + query_stats log)
+from utils.query_stats import init_query_stats, query_budget
+init_query_stats(app)
+
+# Build the configured AI backend's clients once per process so the first AI request skips SDK setup
+from ai.backend import get_provider
+from ai.prompts import prompt_registry
+get_provider().warm_up()
+prompt_registry.load_all()
+
+# Background job worker (assessment insights, etc.) runs inside the serving process
+from utils.job_queue import ensure_job_worker, enqueue_job
+from ai.metering import ensure_metrics_flusher, current_user_id as ai_metering_user
+from risk_tracker import risk_tracker, ensure_risk_checkpointer, RISK_ESCALATE
+# Per-institution daily rollups, updated from activity-log writes (see institution_rollups)
+from institution_rollups import install_rollup_hooks, ensure_rollup_worker
+install_rollup_hooks()
+# CPU-bound work (hashing, audio features, sentiment) runs in a worker pool, off the eventlet hub
+from utils.offload import (offload, offload_status, offload_metrics_text, ensure_loop_lag_monitor,
+                           OffloadRejected, OffloadTimeout)
+from utils import cpu_tasks
+
+@app.before_request
+def start_background_jobs():
+    ensure_job_worker(app, socketio)
+    ensure_metrics_flusher(app, socketio)
+    ensure_risk_checkpointer(app, socketio)
+    ensure_rollup_worker(app, socketio)
+    ensure_loop_lag_monitor(app, socketio)
+    # Attribute AI calls made while handling this request to the signed-in user
+    ai_metering_user.set(session.get('user_id'))
+
 # Asset management
 assets = Environment(app)
 
@@ -380,10 +409,18 @@ def api_message():
         if not recipient_id or not message:
             return jsonify(success=False, error='recipient_id and message are required'), 400
 
-        # create notification
-        notif = Notification(sender_id=session.get('user_id'), recipient_id=recipient_id, message=message, type='message', payload=None)
+        # create notification, scored by the keyword heuristic so it lands in the provider's triage queue
+        severity, severity_reason = heuristic_triage(message)
+        notif = Notification(sender_id=session.get('user_id'), recipient_id=recipient_id, message=message, type='message', payload=None,
+                             severity=severity, severity_source='heuristic', severity_reason=severity_reason, triaged_at=datetime.utcnow())
         db.session.add(notif)
         db.session.commit()
+        if severity >= TRIAGE_LLM_THRESHOLD:
+            try:
+                enqueue_job('message_triage', {'recipient_id': notif.recipient_id, 'notification_ids': [notif.id]},
+                            user_id=notif.recipient_id)
+            except Exception as e:
+                logger.error(f"Could not queue triage escalation for message {notif.id}: {e}")
         return jsonify(success=True, id=notif.id)
     except Exception as e:
         db.session.rollback()
@@ -459,8 +496,10 @@ def send_prescription(patient_id):
 
 
 @app.route('/wellness-report/<int:user_id>')
+@query_budget(25)
 @login_required
 @role_required('provider')
+@read_replica('wellness_report')
 def wellness_report(user_id):
     from datetime import datetime
     
@@ -556,7 +595,6 @@ def wellness_report(user_id):
             for d in digital_detox_logs[:5]
         ]
     }
-    ai_goal_suggestions = ai_service.generate_goal_suggestions(patient_data_for_ai)
 
     # Fetch medication logs for AI adherence analysis
     medication_logs = MedicationLog.query.filter_by(user_id=user_id).order_by(MedicationLog.taken_at.desc()).limit(30).all()
@@ -564,7 +602,10 @@ def wellness_report(user_id):
         {'medication_id': log.medication_id, 'taken_at': log.taken_at.isoformat()}
         for log in medication_logs
     ]
-    ai_medication_adherence_insights = ai_service.analyze_medication_adherence(medication_logs_data, patient_data_for_ai)
+
+    # Goal suggestions and adherence analysis are independent; run them concurrently
+    ai_goal_suggestions, ai_medication_adherence_insights, ai_pending_sections, ai_report_token = \
+        load_wellness_ai_sections(user_id, patient_data_for_ai, medication_logs_data)
 
     return render_template('wellness_report.html', 
                          user_name=session['user_name'], 
@@ -580,6 +621,8 @@ def wellness_report(user_id):
                          phq9_data=filtered_phq9_data,
                          ai_goal_suggestions=ai_goal_suggestions,
                          ai_medication_adherence_insights=ai_medication_adherence_insights,
+                         ai_pending_sections=ai_pending_sections,
+                         ai_report_token=ai_report_token,
                          datetime=datetime)
 
 @app.route('/profile', methods=['GET', 'POST'])
@@ -594,7 +637,7 @@ def profile():
     if request.method == 'POST':
         user.name = request.form.get('name', user.name)
         user.email = request.form.get('email', user.email)
-        user.institution = request.form.get('institution', user.institution)
+        user.set_institution(request.form.get('institution', user.institution))
 
         # Handle password change
         password = request.form.get('password')
@@ -603,7 +646,13 @@ def profile():
             if not is_strong:
                 flash(message, 'error')
                 return redirect(url_for('profile'))
-            user.set_password(password)
+            try:
+                user.set_password(password)
+            except (OffloadRejected, OffloadTimeout) as e:
+                db.session.rollback()
+                logger.warning(f"Password change not saved, server busy: {e}")
+                flash('The server is busy right now. Please try again in a moment.', 'error')
+                return redirect(url_for('profile'))
 
         # Handle profile picture upload with enhanced security
         if 'profile_pic' in request.files:
@@ -1655,6 +1704,7 @@ def blog_list():
     return render_template('blog_list.html', posts=posts, insights=insights)
 
 @app.route('/blog/<int:post_id>')
+@query_budget(15)
 def blog_detail(post_id):
     post = BlogPost.query.get_or_404(post_id)
     
@@ -1663,7 +1713,7 @@ def blog_detail(post_id):
     db.session.commit()
     
     # Get comments for this post
-    comments = BlogComment.query.filter_by(post_id=post_id).order_by(BlogComment.created_at.asc()).all()
+    comments = BlogComment.query.options(joinedload(BlogComment.user)).filter_by(post_id=post_id).order_by(BlogComment.created_at.asc()).all()
     
     # Check if current user has liked this post
     user_has_liked = False
@@ -1939,41 +1989,8 @@ def upload_voice():
 
         if LIBROSA_AVAILABLE:
             try:
-                # Load audio file
-                y, sr = librosa.load(file_path, duration=120)  # Max 2 minutes
-
-                # Extract basic features
-                audio_features = {
-                    'duration': len(y) / sr,
-                    'sample_rate': sr
-                }
-
-                # Extract acoustic features
-                try:
-                    # Pitch (fundamental frequency)
-                    pitches, magnitudes = librosa.piptrack(y=y, sr=sr)
-                    pitch_values = pitches[pitches > 0]
-                    if len(pitch_values) > 0:
-                        audio_features['mean_pitch'] = float(np.mean(pitch_values))
-                        audio_features['pitch_std'] = float(np.std(pitch_values))
-
-                    # Energy (RMS)
-                    rms = librosa.feature.rms(y=y)
-                    audio_features['mean_energy'] = float(np.mean(rms))
-                    audio_features['energy_std'] = float(np.std(rms))
-
-                    # Zero-crossing rate (related to voice quality)
-                    zcr = librosa.feature.zero_crossing_rate(y)
-                    audio_features['mean_zcr'] = float(np.mean(zcr))
-                    audio_features['zcr_std'] = float(np.std(zcr))
-
-                    # Spectral features
-                    spectral_centroid = librosa.feature.spectral_centroid(y=y, sr=sr)
-                    audio_features['mean_spectral_centroid'] = float(np.mean(spectral_centroid))
-                    audio_features['spectral_centroid_std'] = float(np.std(spectral_centroid))
-
-                except Exception as feature_error:
-                    logger.warning(f"Feature extraction error: {feature_error}")
+                # Feature extraction is CPU-heavy; run it in the offload pool
+                audio_features = offload('voice_features', cpu_tasks.voice_features, file_path)
 
                 # Simple emotion classification based on features
                 emotion_result = classify_emotion(audio_features)
@@ -2050,19 +2067,44 @@ def health_check():
         db_status = f'unhealthy: {str(e)}'
 
     # Test AI services
+    ai_circuits = {}
     try:
         ai_check = ai_service.check_api_status()
         ai_status = 'available' if ai_check.get('model_available') else 'unavailable'
+        ai_circuits = {name: b['state'] for name, b in ai_check.get('breakers', {}).items()}
+        if ai_circuits and all(state == 'open' for state in ai_circuits.values()):
+            ai_status = 'degraded: all model circuits open'
     except Exception as e:
         ai_status = f'error: {str(e)}'
 
+    # Connection pool figures; a saturated pool shows up here before requests time out
+    pools = pool_status()
+    if db_status == 'healthy' and any(p['saturated'] for p in pools.values()):
+        db_status = 'degraded: connection pool saturated'
+
     return jsonify({
         'status': 'healthy',
         'database': db_status,
+        'database_pools': pools,
+        'read_replica': replica_status(),
+        'green_db': green_db_status(),
+        'offload': offload_status(),
         'ai_service': ai_status,
+        'ai_circuits': ai_circuits,
         'timestamp': datetime.now().isoformat()
     }), 200
 
+@app.route('/metrics')
+@limiter.exempt
+def metrics():
+    """Connection pool and offload metrics in Prometheus text format (bearer METRICS_TOKEN; off when unset)."""
+    token = os.environ.get('METRICS_TOKEN')
+    if not token:
+        return Response('Metrics are disabled; set METRICS_TOKEN to enable them\n', status=403, mimetype='text/plain')
+    if not secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    return Response(pool_metrics_text() + offload_metrics_text(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/ai-status')
 @login_required
 def ai_status():
@@ -2104,12 +2146,51 @@ def handle_connect():
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handle user disconnection"""
+    # Stop any reply still streaming to this client
+    cancel_flag = _active_chat_streams.pop(request.sid, None)
+    if cancel_flag is not None:
+        cancel_flag.set()
     if 'user_id' in session:
         user_room = f'user_{session["user_id"]}'
         leave_room(user_room)
         logger.info(f"User {session['user_id']} disconnected from room {user_room}")
 
 # --- SocketIO Chat Handler ---
+# sid -> Event set when the client disconnects or starts a newer streamed message
+_active_chat_streams = {}
+
+def _stream_chat_reply(user_message):
+    """Forward model tokens as chat_response_chunk events, then a final chat_response."""
+    sid = request.sid
+    previous = _active_chat_streams.pop(sid, None)
+    if previous is not None:
+        previous.set()
+    cancelled = threading.Event()
+    _active_chat_streams[sid] = cancelled
+
+    severity = heuristic_severity(user_message)
+    is_crisis = severity >= 7
+    if session.get('user_id') is not None:
+        is_crisis = is_crisis or risk_tracker.observe(session['user_id'], severity)['risk'] >= RISK_ESCALATE
+    parts = []
+    try:
+        for index, chunk in enumerate(ai_service.stream_chat_response(user_message, should_stop=cancelled.is_set)):
+            parts.append(chunk)
+            emit('chat_response_chunk', {'index': index, 'text': chunk})
+    except Exception as e:
+        logger.error(f"Streaming chat handler error: {e}")
+        if not parts:
+            parts = ["I apologize, but I'm having trouble responding right now. Please try again in a moment."]
+    finally:
+        if _active_chat_streams.get(sid) is cancelled:
+            del _active_chat_streams[sid]
+
+    if cancelled.is_set():
+        logger.info(f"Chat stream for {session.get('user_email', 'unknown')} cancelled after {len(parts)} chunk(s)")
+        return
+    logger.info(f"Chat interaction (streamed) - User: {session.get('user_email', 'unknown')}, Length: {len(user_message)}, Crisis: {is_crisis}")
+    emit('chat_response', {'reply': ''.join(parts), 'is_crisis': is_crisis, 'streamed': True})
+
 @socketio.on('chat_message')
 def handle_chat_message(data):
     # Basic validation - check if user is logged in via session
@@ -2127,15 +2208,17 @@ def handle_chat_message(data):
     if not user_message:
         emit('error', {'message': 'Message cannot be empty'})
         return
+
+    ai_metering_user.set(session.get('user_id'))
+    if data.get('stream'):
+        _stream_chat_reply(user_message)
+        return
     
     try:
-        ai_resp = ai_service.generate_chat_response(user_message)
-        if isinstance(ai_resp, dict):
-            reply_text = ai_resp.get('response') or ai_resp.get('reply') or str(ai_resp)
-            is_crisis = bool(ai_resp.get('needs_followup')) or bool(ai_resp.get('is_crisis'))
-        else:
-            reply_text = str(ai_resp)
-            is_crisis = False
+        # Rated against the user's recent messages; the AI severity check only runs for risky conversations
+        ai_resp = ai_service.reply_with_severity(user_message, user_id=session.get('user_id'))
+        reply_text = ai_resp['reply']
+        is_crisis = ai_resp['escalate']
         
         # Log the interaction for monitoring
         logger.info(f"Chat interaction - User: {session.get('user_email', 'unknown')}, Length: {len(user_message)}, Crisis: {is_crisis}")
@@ -2226,9 +2309,9 @@ def google_logged_in(blueprint, token):
                     email=email, 
                     google_id=google_id, 
                     name=name,
-                    role='patient',  # Default role for Google OAuth users
-                    institution='Default University'
+                    role='patient'  # Default role for Google OAuth users
                 )
+                user.set_institution('Default University')
                 db.session.add(user)
                 db.session.commit()
                 logger.info("New user created with patient role.")
@@ -2255,7 +2338,7 @@ def google_logged_in(blueprint, token):
         if not user.role:
             logger.warning(f"User {user.email} has no role, assigning default 'patient' role.")
             user.role = 'patient'
-            user.institution = user.institution or 'Default University'
+            user.set_institution(user.institution or 'Default University')
             try:
                 db.session.commit()
                 logger.info("Default role assigned to user.")
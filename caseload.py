@@ -0,0 +1,159 @@
+"""
+Provider caseload: one row per patient with their latest digital detox log and
+latest clinical note, computed in SQL.
+
+Patients are matched to the provider's institution through the institution_tokens
+table, which User.set_institution keeps current on every write.
+
+The latest rows come from ROW_NUMBER() window functions over each patient's
+detox logs and notes (served by the (user_id, date) and (patient_id,
+session_date) indexes), so no history is loaded into Python. Risk level and
+activity status are CASE expressions on the latest detox log, which lets the
+database search, filter and sort the caseload. Pages are keyset-paginated on
+(sort key, patient id); the cursor is opaque to callers.
+"""
+import os
+import json
+import base64
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func, case, or_, and_, tuple_
+
+from extensions import db
+from models import User, DigitalDetoxLog, ClinicalNote, InstitutionToken, institution_tokens
+
+CASELOAD_PAGE_SIZE = int(os.environ.get("CASELOAD_PAGE_SIZE", "50"))
+CASELOAD_MAX_PAGE_SIZE = 200
+CASELOAD_ACTIVE_DAYS = 7
+DEFAULT_INSTITUTION = 'Sample University'
+RISK_LEVELS = ('High', 'Medium', 'Low')
+
+# Stand-ins for patients with no session / no detox log, so every sort key is non-null for keyset comparisons
+_NO_SESSION = datetime(1970, 1, 1)
+_NO_ACTIVITY = date(1970, 1, 1)
+
+
+def caseload_patient_filter(institution):
+    """
+    Filter for patients in a provider's caseload: patients whose institution shares a
+    keyword with the provider's (an indexed lookup in institution_tokens), plus patients
+    without an institution when the provider uses the default one. Falls back to an exact
+    institution match when no patient shares a keyword.
+    """
+    tokens = institution_tokens(institution)
+    sharing = db.session.query(InstitutionToken.user_id).filter(InstitutionToken.token.in_(tokens)) if tokens else None
+    if sharing is not None and db.session.query(User.id).filter(User.role == 'patient', User.id.in_(sharing)).first():
+        in_caseload = User.id.in_(sharing)
+    else:
+        in_caseload = User.institution == institution
+    if institution == DEFAULT_INSTITUTION:
+        in_caseload = or_(in_caseload, User.institution.is_(None), User.institution == '')
+    return and_(User.role == 'patient', in_caseload)
+
+
+def _caseload_subquery(institution):
+    in_caseload = caseload_patient_filter(institution)
+    patient_ids = db.session.query(User.id).filter(in_caseload)
+
+    detox = db.session.query(
+        DigitalDetoxLog.user_id, DigitalDetoxLog.date, DigitalDetoxLog.screen_time_hours, DigitalDetoxLog.ai_score,
+        func.row_number().over(partition_by=DigitalDetoxLog.user_id,
+                               order_by=(DigitalDetoxLog.date.desc(), DigitalDetoxLog.id.desc())).label('rn'),
+    ).filter(DigitalDetoxLog.user_id.in_(patient_ids)).subquery('latest_detox')
+    notes = db.session.query(
+        ClinicalNote.patient_id, ClinicalNote.session_date,
+        func.row_number().over(partition_by=ClinicalNote.patient_id,
+                               order_by=(ClinicalNote.session_date.desc(), ClinicalNote.id.desc())).label('rn'),
+    ).filter(ClinicalNote.patient_id.in_(patient_ids)).subquery('latest_note')
+
+    high = or_(detox.c.screen_time_hours > 8, detox.c.ai_score == 'Needs Improvement')
+    medium = or_(detox.c.screen_time_hours > 6, detox.c.ai_score == 'Good')
+    active_since = date.today() - timedelta(days=CASELOAD_ACTIVE_DAYS)
+    return db.session.query(
+        User.id.label('user_id'),
+        User.name.label('name'),
+        User.email.label('email'),
+        case((high, 'High'), (medium, 'Medium'), else_='Low').label('risk_level'),
+        case((high, 3), (medium, 2), else_=1).label('risk_rank'),
+        case((detox.c.date >= active_since, 'Active'), else_='Inactive').label('status'),
+        detox.c.ai_score.label('digital_score'),
+        func.coalesce(detox.c.date, _NO_ACTIVITY).label('last_activity'),
+        func.coalesce(notes.c.session_date, _NO_SESSION).label('last_session'),
+    ).filter(in_caseload) \
+        .outerjoin(detox, and_(detox.c.user_id == User.id, detox.c.rn == 1)) \
+        .outerjoin(notes, and_(notes.c.patient_id == User.id, notes.c.rn == 1)) \
+        .subquery('caseload')
+
+
+# sort name -> (column of the caseload subquery, default direction, cursor value decoder)
+SORTS = {
+    'risk': ('risk_rank', 'desc', int),
+    'name': ('name', 'asc', str),
+    'last_session': ('last_session', 'desc', datetime.fromisoformat),
+    'last_activity': ('last_activity', 'desc', date.fromisoformat),
+}
+
+
+def _encode_cursor(value, user_id):
+    raw = json.dumps([value.isoformat() if isinstance(value, (date, datetime)) else value, user_id])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def _decode_cursor(cursor, decode):
+    try:
+        value, user_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return decode(value), int(user_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid caseload cursor")
+
+
+def caseload_page(institution, search=None, risk=None, status=None, sort='risk', direction=None,
+                  cursor=None, limit=CASELOAD_PAGE_SIZE) -> dict:
+    """
+    One page of the caseload for a provider's institution.
+
+    `search` matches name or email (case-insensitive substring), `risk` is one of
+    RISK_LEVELS, `status` 'Active' or 'Inactive'. `sort` is a key of SORTS and
+    `direction` 'asc' or 'desc' (each sort has its own default). Pass the returned
+    `next_cursor` to get the following page; it is None on the last page.
+    Raises ValueError for an unknown sort or a malformed cursor.
+    """
+    if sort not in SORTS:
+        raise ValueError(f"Unknown caseload sort '{sort}'")
+    column_name, default_direction, decode = SORTS[sort]
+    direction = direction if direction in ('asc', 'desc') else default_direction
+    limit = max(1, min(int(limit), CASELOAD_MAX_PAGE_SIZE))
+
+    caseload = _caseload_subquery(institution)
+    key = caseload.c[column_name]
+    query = db.session.query(caseload)
+    if search:
+        query = query.filter(or_(caseload.c.name.icontains(search, autoescape=True),
+                                 caseload.c.email.icontains(search, autoescape=True)))
+    if risk in RISK_LEVELS:
+        query = query.filter(caseload.c.risk_level == risk)
+    if status in ('Active', 'Inactive'):
+        query = query.filter(caseload.c.status == status)
+    if cursor:
+        after = tuple_(*_decode_cursor(cursor, decode))
+        position = tuple_(key, caseload.c.user_id)
+        query = query.filter(position > after if direction == 'asc' else position < after)
+    if direction == 'asc':
+        query = query.order_by(key.asc(), caseload.c.user_id.asc())
+    else:
+        query = query.order_by(key.desc(), caseload.c.user_id.desc())
+
+    rows = query.limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    patients = [{
+        'user_id': row.user_id,
+        'name': row.name,
+        'email': row.email,
+        'risk_level': row.risk_level,
+        'last_session': row.last_session.strftime('%Y-%m-%d') if row.last_session != _NO_SESSION else 'No sessions',
+        'status': row.status,
+        'digital_score': row.digital_score or 'No data',
+    } for row in rows]
+    next_cursor = _encode_cursor(getattr(rows[-1], column_name), rows[-1].user_id) if has_more else None
+    return {'patients': patients, 'next_cursor': next_cursor, 'sort': sort, 'direction': direction}
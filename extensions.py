@@ -5,9 +5,11 @@ from flask_migrate import Migrate
 from flask_session import Session
 from flask_compress import Compress
 from flask_wtf.csrf import CSRFProtect
+from utils.db_routing import RoutingSession
 
 # Initialize extensions
-db = SQLAlchemy()
+# Writes go to the primary; SELECTs inside utils.db_routing.read_replica() may use the replica bind
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
 flask_session = Session()
 compress = Compress()
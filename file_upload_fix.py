@@ -9,6 +9,8 @@ from PIL import Image
 import uuid
 import logging
 
+from utils.offload import offload
+
 logger = logging.getLogger(__name__)
 
 # File upload configuration
@@ -215,8 +217,16 @@ def get_file_hash(file_path):
 def compress_image(file_path, max_size_kb=500, quality=85):
     """
     Compress image file to reduce size while maintaining quality
+    (in the offload pool, so PIL's work does not stall the event loop)
     Returns: (success: bool, new_size: int, error_message: str)
     """
+    try:
+        return offload('compress_image', _compress_image, file_path, max_size_kb, quality)
+    except Exception as e:
+        logger.error(f"Error compressing image: {e}")
+        return False, 0, f"Compression error: {str(e)}"
+
+def _compress_image(file_path, max_size_kb, quality):
     try:
         with Image.open(file_path) as img:
             # Convert to RGB if necessary (for JPEG compatibility)
@@ -238,7 +248,7 @@ def compress_image(file_path, max_size_kb=500, quality=85):
             if new_size > max_size_kb * 1024:
                 # Try with lower quality
                 if quality > 60:
-                    return compress_image(file_path, max_size_kb, quality - 10)
+                    return _compress_image(file_path, max_size_kb, quality - 10)
                 else:
                     return False, new_size, f"Could not compress image below {max_size_kb}KB"
             
@@ -0,0 +1,412 @@
+"""
+Per-institution, per-day activity rollups behind the provider dashboard summary.
+
+Two tables are maintained from the activity logs (detox, assessments,
+medication, breathing, yoga, music therapy):
+
+  - user_daily_activity: one row per patient per day with the number of
+    activity rows, screen-time sum/count and assessment wellness points;
+  - institutional_analytics: one row per institution per day with the
+    dashboard figures as of that day (active users and screen time over the
+    last ROLLUP_ACTIVE_DAYS, high-risk patients, wellness over the last
+    ROLLUP_WELLNESS_DAYS, engagement and appointment completion).
+
+Writes drive the updates: a session hook turns inserted and deleted log rows
+into per-(user, day) deltas when the transaction commits, and the rollup worker
+applies them every ROLLUP_FLUSH_SECONDS and recomputes the affected
+institutions' rows from user_daily_activity. Edits to existing log rows, role
+or institution changes and the deltas lost with a restart are picked up by the
+nightly reconciliation (after ROLLUP_RECONCILE_HOUR), which rebuilds the last
+ROLLUP_RECONCILE_DAYS from the logs; `python -m scripts.reconcile_rollups`
+runs it by hand and backfills further back.
+
+The dashboard reads one institutional_analytics row instead of scanning logs.
+"""
+import os
+import time
+import logging
+import threading
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import event, func, case, and_
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from extensions import db
+from utils.db_routing import read_replica
+from models import (User, InstitutionalAnalytics, UserDailyActivity, DigitalDetoxLog, Assessment, MedicationLog,
+                    BreathingExerciseLog, YogaLog, MusicTherapyLog, Appointment)
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_ACTIVE_DAYS = 7
+ROLLUP_RISK_DAYS = 7
+ROLLUP_WELLNESS_DAYS = 30
+ROLLUP_HIGH_RISK_SCREEN_HOURS = 8
+ROLLUP_FLUSH_SECONDS = float(os.environ.get("ROLLUP_FLUSH_SECONDS", "30"))
+ROLLUP_RECONCILE_HOUR = int(os.environ.get("ROLLUP_RECONCILE_HOUR", "3"))  # local time
+ROLLUP_RECONCILE_DAYS = int(os.environ.get("ROLLUP_RECONCILE_DAYS", "35"))
+SESSION_MINUTES = 45  # appointments carry no duration
+SATISFACTION_SCORE = 4.2  # placeholder until there is a feedback model
+
+# Activity log model -> attribute holding its date or timestamp
+ACTIVITY_SOURCES = {
+    DigitalDetoxLog: 'date',
+    Assessment: 'created_at',
+    MedicationLog: 'taken_at',
+    BreathingExerciseLog: 'created_at',
+    YogaLog: 'created_at',
+    MusicTherapyLog: 'created_at',
+}
+
+# Questionnaire -> maximum score; wellness is the inverted score on a 0-10 scale
+WELLNESS_SCALES = {'GAD-7': 21, 'PHQ-9': 27}
+
+# Delta / daily row fields, in this order
+_FIELDS = ('activities', 'screen_time_sum', 'screen_time_logs', 'wellness_sum', 'wellness_count')
+
+
+def wellness_points(assessment_type, score):
+    """0-10 wellness contribution of one assessment, or None if the type is not scored."""
+    if score is None:
+        return None
+    if assessment_type in WELLNESS_SCALES:
+        return (1 - score / WELLNESS_SCALES[assessment_type]) * 10
+    if assessment_type == 'Daily Mood':
+        return score * 2  # mood 1-5
+    return None
+
+
+def _wellness_points_sql():
+    """wellness_points() as a SQL expression over Assessment."""
+    whens = [(Assessment.assessment_type == name, (1 - Assessment.score * 1.0 / top) * 10)
+             for name, top in WELLNESS_SCALES.items()]
+    whens.append((Assessment.assessment_type == 'Daily Mood', Assessment.score * 2.0))
+    return case(*whens, else_=None)
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):  # SQLite date()
+        return date.fromisoformat(value)
+    return value
+
+
+def _contribution(obj):
+    """(user_id, day, delta) for one activity log row."""
+    when = getattr(obj, ACTIVITY_SOURCES[type(obj)]) or datetime.utcnow()
+    delta = [1, 0.0, 0, 0.0, 0]
+    if isinstance(obj, DigitalDetoxLog) and obj.screen_time_hours is not None:
+        delta[1], delta[2] = float(obj.screen_time_hours), 1
+    elif isinstance(obj, Assessment):
+        points = wellness_points(obj.assessment_type, obj.score)
+        if points is not None:
+            delta[3], delta[4] = points, 1
+    return obj.user_id, _as_date(when), delta
+
+
+def _add(totals, key, delta, sign=1):
+    row = totals[key]
+    for i, value in enumerate(delta):
+        row[i] += sign * value
+
+
+def _new_totals():
+    return defaultdict(lambda: [0, 0.0, 0, 0.0, 0])
+
+
+# --- Write hooks ---
+
+def _after_flush(session, flush_context):
+    changes = [(obj, 1) for obj in session.new] + [(obj, -1) for obj in session.deleted]
+    for obj, sign in changes:
+        if type(obj) in ACTIVITY_SOURCES:
+            user_id, day, delta = _contribution(obj)
+            _add(session.info.setdefault('rollup_deltas', _new_totals()), (user_id, day), delta, sign)
+        elif isinstance(obj, User) and obj.role == 'patient' and obj.institution:
+            # A new or removed patient changes the institution's total
+            session.info.setdefault('rollup_institutions', set()).add(obj.institution)
+
+
+def _after_commit(session):
+    deltas = session.info.pop('rollup_deltas', None)
+    institutions = session.info.pop('rollup_institutions', None)
+    if deltas or institutions:
+        rollups.add(deltas or {}, institutions or ())
+
+
+def _after_rollback(session):
+    session.info.pop('rollup_deltas', None)
+    session.info.pop('rollup_institutions', None)
+
+
+_hooks_installed = False
+_hooks_lock = threading.Lock()
+
+
+def install_rollup_hooks():
+    """Listen on every ORM session, once per process."""
+    global _hooks_installed
+    with _hooks_lock:
+        if _hooks_installed:
+            return
+        event.listen(Session, 'after_flush', _after_flush)
+        event.listen(Session, 'after_commit', _after_commit)
+        event.listen(Session, 'after_rollback', _after_rollback)
+        _hooks_installed = True
+
+
+# --- Rollup computation ---
+
+def _patient_ids(institution):
+    return db.session.query(User.id).filter(User.role == 'patient', User.institution == institution)
+
+
+def rollup_institution_day(institution, day) -> InstitutionalAnalytics:
+    """Recompute (and stage, without committing) one institution's row for `day` from user_daily_activity."""
+    patient_ids = _patient_ids(institution)
+
+    def in_window(days):
+        return and_(UserDailyActivity.user_id.in_(patient_ids),
+                    UserDailyActivity.date >= day - timedelta(days=days), UserDailyActivity.date <= day)
+
+    total_users = db.session.query(func.count(User.id)) \
+        .filter(User.role == 'patient', User.institution == institution).scalar() or 0
+    active_users = db.session.query(func.count(func.distinct(UserDailyActivity.user_id))) \
+        .filter(in_window(ROLLUP_ACTIVE_DAYS), UserDailyActivity.activities > 0).scalar() or 0
+    screen_sum, screen_logs = db.session.query(
+        func.sum(UserDailyActivity.screen_time_sum), func.sum(UserDailyActivity.screen_time_logs)
+    ).filter(in_window(ROLLUP_RISK_DAYS)).one()
+    high_risk = db.session.query(UserDailyActivity.user_id).filter(in_window(ROLLUP_RISK_DAYS)) \
+        .group_by(UserDailyActivity.user_id) \
+        .having(func.sum(UserDailyActivity.screen_time_sum)
+                > ROLLUP_HIGH_RISK_SCREEN_HOURS * func.sum(UserDailyActivity.screen_time_logs)).subquery()
+    high_risk_users = db.session.query(func.count()).select_from(high_risk).scalar() or 0
+    wellness_sum, wellness_count = db.session.query(
+        func.sum(UserDailyActivity.wellness_sum), func.sum(UserDailyActivity.wellness_count)
+    ).filter(in_window(ROLLUP_WELLNESS_DAYS)).one()
+    appointments, completed = db.session.query(
+        func.count(Appointment.id), func.sum(case((Appointment.status == 'completed', 1), else_=0))
+    ).filter(Appointment.provider_id.in_(patient_ids),
+             Appointment.date >= day - timedelta(days=ROLLUP_ACTIVE_DAYS), Appointment.date <= day).one()
+
+    row = InstitutionalAnalytics.query.filter_by(institution=institution, date=day).first()
+    if row is None:
+        row = InstitutionalAnalytics(institution=institution, date=day)
+        db.session.add(row)
+    row.total_users = total_users
+    row.active_users = active_users
+    row.engagement_rate = round(active_users / total_users * 100, 1) if total_users else 0.0
+    row.avg_screen_time = round(screen_sum / screen_logs, 1) if screen_logs else 0.0
+    row.high_risk_users = high_risk_users
+    row.avg_wellness_score = round(wellness_sum / wellness_count, 1) if wellness_count else 0.0
+    row.appointments = appointments or 0
+    row.completed_appointments = completed or 0
+    return row
+
+
+def _summary(row) -> dict:
+    return {
+        'total_users': row.total_users or 0,
+        'active_users': row.active_users or 0,
+        'avg_screen_time': row.avg_screen_time or 0.0,
+        'high_risk_users': row.high_risk_users or 0,
+        'engagement_rate': row.engagement_rate or 0.0,
+        'avg_wellness_score': row.avg_wellness_score or 0.0,
+        'avg_session_duration': float(SESSION_MINUTES) if row.appointments else 0.0,
+        'completion_rate': round(row.completed_appointments / row.appointments * 100, 1) if row.appointments else 0.0,
+        'satisfaction_score': SATISFACTION_SCORE,
+    }
+
+
+def institution_summary(institution, day=None) -> dict:
+    """Dashboard figures for an institution from its rollup row, computed and stored on first use of the day."""
+    day = day or date.today()
+    with read_replica('institutional_summary'):
+        row = InstitutionalAnalytics.query.filter_by(institution=institution, date=day).first()
+    if row is None:
+        row = rollup_institution_day(institution, day)
+        try:
+            db.session.commit()
+        except Exception as e:
+            # Another request stored the same row first; the computed figures are still good
+            db.session.rollback()
+            logger.debug(f"Rollup row for {institution} {day} not stored: {e}")
+    return _summary(row)
+
+
+def _activity_totals(start):
+    """{(user_id, day): [activities, screen sum, screen logs, wellness sum, wellness count]} from the logs since `start`."""
+    totals = _new_totals()
+    for model, attribute in ACTIVITY_SOURCES.items():
+        column = getattr(model, attribute)
+        is_date = attribute == 'date'
+        day = column if is_date else func.date(column)
+        extra = []
+        if model is DigitalDetoxLog:
+            extra = [func.sum(DigitalDetoxLog.screen_time_hours), func.count(DigitalDetoxLog.screen_time_hours)]
+        elif model is Assessment:
+            points = _wellness_points_sql()
+            extra = [func.sum(points), func.count(points)]
+        since = start if is_date else datetime.combine(start, datetime.min.time())
+        query = db.session.query(model.user_id, day, func.count(), *extra) \
+            .filter(column >= since).group_by(model.user_id, day)
+        try:
+            rows = query.all()
+        except OperationalError as e:
+            # e.g. music_therapy_logs before its migration; count it as no activity
+            db.session.rollback()
+            logger.warning(f"Skipping {model.__tablename__} in rollup reconciliation: {e}")
+            continue
+        for user_id, row_day, count, *sums in rows:
+            delta = [count, 0.0, 0, 0.0, 0]
+            if model is DigitalDetoxLog:
+                delta[1], delta[2] = float(sums[0] or 0.0), sums[1]
+            elif model is Assessment:
+                delta[3], delta[4] = float(sums[0] or 0.0), sums[1]
+            _add(totals, (user_id, _as_date(row_day)), delta)
+    return totals
+
+
+class InstitutionRollups:
+    def __init__(self):
+        self._deltas = _new_totals()
+        self._institutions = set()
+        self._reconciled_on = None
+        self._lock = threading.Lock()
+
+    def add(self, deltas, institutions=()):
+        """Queue committed per-(user, day) deltas and institutions whose totals changed."""
+        with self._lock:
+            for key, delta in deltas.items():
+                _add(self._deltas, key, delta)
+            self._institutions.update(institutions)
+
+    def _take(self):
+        with self._lock:
+            deltas, self._deltas = self._deltas, _new_totals()
+            institutions, self._institutions = self._institutions, set()
+        return deltas, institutions
+
+    def flush(self) -> int:
+        """
+        Apply queued deltas to user_daily_activity and refresh the affected rollup
+        rows (needs an app context). Returns the number of rollup rows refreshed;
+        a failed flush is queued again.
+        """
+        deltas, institutions = self._take()
+        if not deltas and not institutions:
+            return 0
+        today = date.today()
+        try:
+            for (user_id, day), delta in deltas.items():
+                changes = {getattr(UserDailyActivity, f): getattr(UserDailyActivity, f) + v
+                           for f, v in zip(_FIELDS, delta)}
+                updated = db.session.query(UserDailyActivity) \
+                    .filter_by(user_id=user_id, date=day).update(changes, synchronize_session=False)
+                if not updated:
+                    db.session.add(UserDailyActivity(user_id=user_id, date=day, **dict(zip(_FIELDS, delta))))
+            db.session.flush()
+
+            # institution -> earliest day whose rollups may have changed
+            earliest = {institution: today for institution in institutions}
+            user_days = defaultdict(list)
+            for user_id, day in deltas:
+                user_days[user_id].append(day)
+            if user_days:
+                for user_id, institution in db.session.query(User.id, User.institution) \
+                        .filter(User.id.in_(list(user_days)), User.role == 'patient'):
+                    if institution:
+                        earliest[institution] = min(earliest.get(institution, today), *user_days[user_id])
+
+            refreshed = 0
+            for institution, since in earliest.items():
+                # Today's row, plus any stored rows whose windows include a changed day
+                days = {today}
+                days.update(d for (d,) in db.session.query(InstitutionalAnalytics.date).filter(
+                    InstitutionalAnalytics.institution == institution,
+                    InstitutionalAnalytics.date >= since,
+                    InstitutionalAnalytics.date < today))
+                for day in sorted(days):
+                    rollup_institution_day(institution, day)
+                    refreshed += 1
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.warning(f"Rollup flush failed, will retry: {e}")
+            self.add(deltas, institutions)
+            return 0
+        return refreshed
+
+    def reconcile(self, days=ROLLUP_RECONCILE_DAYS) -> dict:
+        """
+        Rebuild user_daily_activity and institutional_analytics for the last `days`
+        days from the activity logs (needs an app context).
+        """
+        started = time.perf_counter()
+        today = date.today()
+        start = today - timedelta(days=days)
+        # Once a day, even if it fails; the next night (or the script) tries again
+        self._reconciled_on = today
+        # Deltas queued so far for the rebuilt days are already in the logs; take them before
+        # reading the logs, so that deltas queued while the logs are read stay queued for flush()
+        with self._lock:
+            taken = {key: self._deltas.pop(key) for key in [k for k in self._deltas if k[1] >= start]}
+        try:
+            totals = _activity_totals(start)
+            db.session.query(UserDailyActivity).filter(UserDailyActivity.date >= start) \
+                .delete(synchronize_session=False)
+            db.session.add_all([UserDailyActivity(user_id=user_id, date=day, **dict(zip(_FIELDS, delta)))
+                                for (user_id, day), delta in totals.items() if delta[0] > 0])
+            db.session.flush()
+            institutions = [i for (i,) in db.session.query(User.institution).filter(
+                User.role == 'patient', User.institution.isnot(None), User.institution != '').distinct()]
+            for institution in institutions:
+                for offset in range(days + 1):
+                    rollup_institution_day(institution, start + timedelta(days=offset))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            self.add(taken)
+            raise
+        result = {'days': days, 'user_days': len(totals), 'institutions': len(institutions),
+                  'seconds': round(time.perf_counter() - started, 1)}
+        logger.info(f"Rollup reconciliation finished: {result}")
+        return result
+
+    def reconcile_due(self) -> bool:
+        return self._reconciled_on != date.today() and datetime.now().hour >= ROLLUP_RECONCILE_HOUR
+
+
+rollups = InstitutionRollups()
+
+
+def _rollup_loop(app, socketio):
+    logger.info("Institution rollup worker started")
+    while True:
+        socketio.sleep(ROLLUP_FLUSH_SECONDS)
+        try:
+            with app.app_context():
+                rollups.flush()
+                if rollups.reconcile_due():
+                    rollups.reconcile()
+        except Exception:
+            logger.exception("Institution rollup loop error")
+
+
+_worker_pid = None
+_worker_lock = threading.Lock()
+
+
+def ensure_rollup_worker(app, socketio):
+    """Start the rollup flush/reconcile loop once per serving process (see utils.job_queue.ensure_job_worker)."""
+    global _worker_pid
+    if _worker_pid == os.getpid():
+        return
+    with _worker_lock:
+        if _worker_pid == os.getpid():
+            return
+        _worker_pid = os.getpid()
+        socketio.start_background_task(_rollup_loop, app, socketio)
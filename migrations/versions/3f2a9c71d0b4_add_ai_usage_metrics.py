@@ -0,0 +1,49 @@
+"""add ai_usage_metrics
+
+Revision ID: 3f2a9c71d0b4
+Revises: 
+Create Date: 2026-10-18 09:12:40.118233
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f2a9c71d0b4'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases bootstrapped with db.create_all() may already have the table
+    if sa.inspect(op.get_bind()).has_table('ai_usage_metrics'):
+        return
+    op.create_table(
+        'ai_usage_metrics',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('bucket_start', sa.DateTime(), nullable=False),
+        sa.Column('feature', sa.String(length=50), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('model', sa.String(length=100), nullable=False),
+        sa.Column('calls', sa.Integer(), nullable=False),
+        sa.Column('cache_hits', sa.Integer(), nullable=False),
+        sa.Column('fallback_calls', sa.Integer(), nullable=False),
+        sa.Column('errors', sa.Integer(), nullable=False),
+        sa.Column('prompt_tokens', sa.Integer(), nullable=False),
+        sa.Column('response_tokens', sa.Integer(), nullable=False),
+        sa.Column('total_ms', sa.Float(), nullable=False),
+        sa.Column('max_ms', sa.Float(), nullable=False),
+        sa.Column('latency_histogram', sa.JSON(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_ai_usage_bucket_feature', 'ai_usage_metrics', ['bucket_start', 'feature'], unique=False)
+    op.create_index('idx_ai_usage_user_bucket', 'ai_usage_metrics', ['user_id', 'bucket_start'], unique=False)
+
+
+def downgrade():
+    op.drop_index('idx_ai_usage_user_bucket', table_name='ai_usage_metrics')
+    op.drop_index('idx_ai_usage_bucket_feature', table_name='ai_usage_metrics')
+    op.drop_table('ai_usage_metrics')
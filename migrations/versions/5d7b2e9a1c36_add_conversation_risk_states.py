@@ -0,0 +1,34 @@
+"""add conversation_risk_states
+
+Revision ID: 5d7b2e9a1c36
+Revises: 8c1e5b2f94a7
+Create Date: 2026-10-18 13:02:51.774019
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d7b2e9a1c36'
+down_revision = '8c1e5b2f94a7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if sa.inspect(op.get_bind()).has_table('conversation_risk_states'):
+        return
+    op.create_table(
+        'conversation_risk_states',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('events', sa.JSON(), nullable=False),
+        sa.Column('risk', sa.Float(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('conversation_risk_states')
@@ -0,0 +1,36 @@
+"""add notification severity triage columns
+
+Revision ID: 8c1e5b2f94a7
+Revises: 3f2a9c71d0b4
+Create Date: 2026-10-18 10:41:05.532871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c1e5b2f94a7'
+down_revision = '3f2a9c71d0b4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    columns = {c['name'] for c in sa.inspect(op.get_bind()).get_columns('notifications')}
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        if 'severity' not in columns:
+            batch_op.add_column(sa.Column('severity', sa.Integer(), nullable=True))
+            batch_op.add_column(sa.Column('severity_source', sa.String(length=20), nullable=True))
+            batch_op.add_column(sa.Column('severity_reason', sa.String(length=255), nullable=True))
+            batch_op.add_column(sa.Column('triaged_at', sa.DateTime(), nullable=True))
+            batch_op.create_index('idx_notifications_recipient_read_severity', ['recipient_id', 'read', 'severity'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.drop_index('idx_notifications_recipient_read_severity')
+        batch_op.drop_column('triaged_at')
+        batch_op.drop_column('severity_reason')
+        batch_op.drop_column('severity_source')
+        batch_op.drop_column('severity')
@@ -0,0 +1,97 @@
+"""add composite indexes for hot query shapes
+
+Revision ID: a41c7d93e2f8
+Revises: 5d7b2e9a1c36
+Create Date: 2026-10-18 14:20:37.405112
+
+"""
+import json
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+logger = logging.getLogger('alembic.runtime.migration')
+
+
+# revision identifiers, used by Alembic.
+revision = 'a41c7d93e2f8'
+down_revision = '5d7b2e9a1c36'
+branch_labels = None
+depends_on = None
+
+# (table, index name, columns, unique)
+INDEXES = [
+    ('rpm_data', 'idx_rpm_user_date', ['user_id', 'date'], False),
+    ('gamification', 'uq_gamification_user', ['user_id'], True),
+    ('clinical_notes', 'idx_clinical_notes_patient_session', ['patient_id', 'session_date'], False),
+    ('appointments', 'idx_appointments_provider_status_date', ['provider_id', 'status', 'date'], False),
+    ('appointments', 'idx_appointments_user_date_time', ['user_id', 'date', 'time'], False),
+    ('medication_logs', 'idx_medication_logs_user_taken', ['user_id', 'taken_at'], False),
+    ('notifications', 'idx_notifications_recipient_created', ['recipient_id', 'created_at'], False),
+    ('blog_comments', 'idx_blog_comments_post_created', ['post_id', 'created_at'], False),
+    ('blog_likes', 'idx_blog_likes_post_user', ['post_id', 'user_id'], False),
+]
+
+
+gamification = sa.table(
+    'gamification',
+    sa.column('id', sa.Integer), sa.column('user_id', sa.Integer), sa.column('points', sa.Integer),
+    sa.column('streak', sa.Integer), sa.column('badges', sa.JSON), sa.column('last_activity', sa.Date),
+)
+
+
+def _merge_duplicate_gamification():
+    """
+    Fold each user's extra gamification rows into the oldest one so the unique index can be
+    built: points are summed (each row earned its own), streak and last activity take the
+    maximum and badges the union. Logs how many rows were merged.
+    """
+    bind = op.get_bind()
+    duplicated = sa.select(gamification.c.user_id).group_by(gamification.c.user_id) \
+        .having(sa.func.count() > 1).scalar_subquery()
+    rows = bind.execute(sa.select(gamification).where(gamification.c.user_id.in_(duplicated))
+                        .order_by(gamification.c.user_id, gamification.c.id)).mappings().all()
+    by_user = {}
+    for row in rows:
+        by_user.setdefault(row['user_id'], []).append(row)
+    removed = 0
+    for user_id, (keep, *extras) in by_user.items():
+        group = [keep, *extras]
+        badges, seen = [], set()
+        for row in group:
+            for badge in row['badges'] or []:
+                marker = json.dumps(badge, sort_keys=True)
+                if marker not in seen:
+                    seen.add(marker)
+                    badges.append(badge)
+        activity = [row['last_activity'] for row in group if row['last_activity'] is not None]
+        bind.execute(gamification.update().where(gamification.c.id == keep['id']).values(
+            points=sum(row['points'] or 0 for row in group),
+            streak=max(row['streak'] or 0 for row in group),
+            badges=badges,
+            last_activity=max(activity) if activity else None,
+        ))
+        bind.execute(gamification.delete().where(gamification.c.id.in_([row['id'] for row in extras])))
+        removed += len(extras)
+    if removed:
+        logger.warning(f"Merged {removed} duplicate gamification rows into {len(by_user)} users' rows "
+                       f"before creating uq_gamification_user")
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    for table, name, columns, unique in INDEXES:
+        if not inspector.has_table(table):
+            continue
+        # Databases bootstrapped with db.create_all() may already have the index
+        if name in {ix['name'] for ix in inspector.get_indexes(table)}:
+            continue
+        if name == 'uq_gamification_user':
+            _merge_duplicate_gamification()
+        op.create_index(name, table, columns, unique=unique)
+
+
+def downgrade():
+    for table, name, _, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,42 @@
+"""add users.institution_key and institution_tokens
+
+Revision ID: c7e2d4f81b95
+Revises: a41c7d93e2f8
+Create Date: 2026-10-18 15:05:12.640391
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7e2d4f81b95'
+down_revision = 'a41c7d93e2f8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Populate both with `python -m scripts.backfill_institution_tokens` after upgrading
+    inspector = sa.inspect(op.get_bind())
+    if 'institution_key' not in {c['name'] for c in inspector.get_columns('users')}:
+        with op.batch_alter_table('users', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('institution_key', sa.String(length=100), nullable=True))
+            batch_op.create_index(batch_op.f('ix_users_institution_key'), ['institution_key'], unique=False)
+    if not inspector.has_table('institution_tokens'):
+        op.create_table(
+            'institution_tokens',
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('token', sa.String(length=100), nullable=False),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('user_id', 'token')
+        )
+        op.create_index('idx_institution_tokens_token_user', 'institution_tokens', ['token', 'user_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('idx_institution_tokens_token_user', table_name='institution_tokens')
+    op.drop_table('institution_tokens')
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_users_institution_key'))
+        batch_op.drop_column('institution_key')
@@ -0,0 +1,68 @@
+"""add user_daily_activity and rollup columns on institutional_analytics
+
+Revision ID: e93b6f20a7d4
+Revises: c7e2d4f81b95
+Create Date: 2026-10-18 15:48:09.217730
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e93b6f20a7d4'
+down_revision = 'c7e2d4f81b95'
+branch_labels = None
+depends_on = None
+
+NEW_COLUMNS = [
+    sa.Column('appointments', sa.Integer(), nullable=True),
+    sa.Column('completed_appointments', sa.Integer(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+]
+
+
+def upgrade():
+    # Populate both tables with `python -m scripts.reconcile_rollups` after upgrading
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('user_daily_activity'):
+        op.create_table(
+            'user_daily_activity',
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('date', sa.Date(), nullable=False),
+            sa.Column('activities', sa.Integer(), nullable=False),
+            sa.Column('screen_time_sum', sa.Float(), nullable=False),
+            sa.Column('screen_time_logs', sa.Integer(), nullable=False),
+            sa.Column('wellness_sum', sa.Float(), nullable=False),
+            sa.Column('wellness_count', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('user_id', 'date')
+        )
+        op.create_index('idx_user_daily_activity_date', 'user_daily_activity', ['date'], unique=False)
+
+    existing = {c['name'] for c in inspector.get_columns('institutional_analytics')}
+    missing = [c for c in NEW_COLUMNS if c.name not in existing]
+    if missing:
+        with op.batch_alter_table('institutional_analytics', schema=None) as batch_op:
+            for column in missing:
+                batch_op.add_column(column)
+    if 'uq_institutional_analytics_institution_date' not in {
+            ix['name'] for ix in inspector.get_indexes('institutional_analytics')}:
+        # The table was never written by the app; drop any duplicates so the unique index can be built
+        op.execute(
+            "DELETE FROM institutional_analytics WHERE id IN ("
+            " SELECT a.id FROM institutional_analytics a WHERE EXISTS ("
+            "  SELECT 1 FROM institutional_analytics o"
+            "  WHERE o.institution = a.institution AND o.date = a.date AND o.id > a.id))"
+        )
+        op.create_index('uq_institutional_analytics_institution_date', 'institutional_analytics',
+                        ['institution', 'date'], unique=True)
+
+
+def downgrade():
+    op.drop_index('uq_institutional_analytics_institution_date', table_name='institutional_analytics')
+    with op.batch_alter_table('institutional_analytics', schema=None) as batch_op:
+        for column in reversed(NEW_COLUMNS):
+            batch_op.drop_column(column.name)
+    op.drop_index('idx_user_daily_activity_date', table_name='user_daily_activity')
+    op.drop_table('user_daily_activity')
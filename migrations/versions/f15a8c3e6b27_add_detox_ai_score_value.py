@@ -0,0 +1,34 @@
+"""add digital_detox_logs.ai_score_value
+
+Revision ID: f15a8c3e6b27
+Revises: e93b6f20a7d4
+Create Date: 2026-10-18 16:31:44.902157
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f15a8c3e6b27'
+down_revision = 'e93b6f20a7d4'
+branch_labels = None
+depends_on = None
+
+# Same mapping as models.AI_SCORE_VALUES, frozen here so the migration does not change with the model
+AI_SCORE_VALUES = {'Excellent': 5, 'Good': 4, 'Fair': 3, 'Needs Improvement': 2, 'Poor': 1}
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'ai_score_value' not in {c['name'] for c in inspector.get_columns('digital_detox_logs')}:
+        with op.batch_alter_table('digital_detox_logs', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('ai_score_value', sa.SmallInteger(), nullable=True))
+    whens = ' '.join(f"WHEN '{label}' THEN {value}" for label, value in AI_SCORE_VALUES.items())
+    op.execute(f"UPDATE digital_detox_logs SET ai_score_value = CASE ai_score {whens} END "
+               f"WHERE ai_score_value IS NULL AND ai_score IS NOT NULL")
+
+
+def downgrade():
+    with op.batch_alter_table('digital_detox_logs', schema=None) as batch_op:
+        batch_op.drop_column('ai_score_value')
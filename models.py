@@ -1,14 +1,27 @@
 """Database models for the Mindful Horizon application."""
 from datetime import datetime, timedelta
-from sqlalchemy import func
-from sqlalchemy.exc import OperationalError
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy.orm import validates
 from extensions import db
+from werkzeug.security import generate_password_hash, check_password_hash
+from utils.offload import offload, OffloadRejected
+from utils import cpu_tasks
 import logging
 
 # Module logger
 logger = logging.getLogger(__name__)
 
+
+def normalize_institution_name(institution_name):
+    """Normalize institution name for better matching."""
+    if not institution_name:
+        return ''
+    return institution_name.lower().strip()
+
+
+def institution_tokens(institution_name):
+    """Keywords of a normalized institution name, used for provider-patient matching."""
+    return set(normalize_institution_name(institution_name).split())
+
 class User(db.Model):
     """User model for both patients and providers."""
     __tablename__ = 'users'
@@ -18,6 +31,7 @@ class User(db.Model):
     name = db.Column(db.String(100), nullable=False)
     role = db.Column(db.String(20), nullable=True, index=True)  # 'patient' or 'provider'
     institution = db.Column(db.String(100), nullable=True, index=True)  # For institutional aggregation
+    institution_key = db.Column(db.String(100), nullable=True, index=True)  # normalized institution, kept by set_institution
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     last_assessment_at = db.Column(db.DateTime, nullable=True, index=True)
     profile_pic = db.Column(db.String(255), nullable=True)  # Path to profile picture
@@ -41,19 +55,52 @@ class User(db.Model):
     music_logs = db.relationship('MusicTherapyLog', backref='user', lazy=True, cascade='all, delete-orphan')
     progress_recommendations = db.relationship('ProgressRecommendation', backref='user', lazy=True, cascade='all, delete-orphan')
     clinical_notes = db.relationship('ClinicalNote', foreign_keys='[ClinicalNote.patient_id]', backref='patient_user', lazy=True, cascade='all, delete-orphan')
+    institution_token_rows = db.relationship('InstitutionToken', lazy=True, cascade='all, delete-orphan')
 
     def set_password(self, password):
-        """Hash and set password"""
-        self.password_hash = generate_password_hash(password)
+        """Hash and set password (off the event loop under eventlet, see utils.offload; in place outside it)"""
+        try:
+            self.password_hash = offload('password_hash', cpu_tasks.password_hash, password)
+        except OffloadRejected as e:
+            # Offload queue full: hash here rather than fail the request
+            logger.warning(f"{e}; hashing inline")
+            self.password_hash = generate_password_hash(password)
 
     def check_password(self, password):
-        """Check if provided password matches hash"""
-        return check_password_hash(self.password_hash, password)
+        """Check if provided password matches hash (OffloadTimeout if the check does not finish in time)"""
+        try:
+            return offload('password_check', cpu_tasks.password_matches, self.password_hash, password)
+        except OffloadRejected as e:
+            logger.warning(f"{e}; checking inline")
+            return check_password_hash(self.password_hash, password)
+
+    def set_institution(self, institution):
+        """Set the institution with its normalized key and token rows (used for caseload matching); True if the key or tokens changed"""
+        self.institution = institution
+        key = normalize_institution_name(institution) or None
+        tokens = institution_tokens(institution)
+        if key == self.institution_key and {row.token for row in self.institution_token_rows} == tokens:
+            return False
+        self.institution_key = key
+        self.institution_token_rows = [InstitutionToken(token=token) for token in sorted(tokens)]
+        return True
 
     def __repr__(self):
         return f'<User {self.email}>'
 
 
+class InstitutionToken(db.Model):
+    """One keyword of a user's normalized institution name (see User.set_institution)."""
+    __tablename__ = 'institution_tokens'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    token = db.Column(db.String(100), primary_key=True)
+
+    __table_args__ = (
+        # Provider -> patients sharing a keyword
+        db.Index('idx_institution_tokens_token_user', 'token', 'user_id'),
+    )
+
+
 # BlogPost model for blog system (enhanced with relationships)
 class BlogPost(db.Model):
     """Blog post model for storing blog entries."""
@@ -109,8 +156,12 @@ class BlogLike(db.Model):
     # Relationships - Fixed: removed delete-orphan from many-to-one relationship
     user = db.relationship('User', backref='blog_likes')
     
-    # Ensure a user can only like a post once
-    __table_args__ = (db.UniqueConstraint('user_id', 'post_id', name='unique_user_post_like'),)
+    __table_args__ = (
+        # Ensure a user can only like a post once (also serves the "has this user liked it" lookup)
+        db.UniqueConstraint('user_id', 'post_id', name='unique_user_post_like'),
+        # Like counts per post
+        db.Index('idx_blog_likes_post_user', 'post_id', 'user_id'),
+    )
     
     def __repr__(self):
         return f'<BlogLike user:{self.user_id} post:{self.post_id}>'
@@ -130,6 +181,11 @@ class BlogComment(db.Model):
     
     # Relationships - Fixed: self-referencing relationship should use delete instead of delete-orphan
     parent = db.relationship('BlogComment', remote_side=[id], backref='replies')
+    user = db.relationship('User', backref='blog_comments')
+
+    __table_args__ = (
+        db.Index('idx_blog_comments_post_created', 'post_id', 'created_at'),
+    )
     
     def __repr__(self):
         return f'<BlogComment {self.id} by {self.user_id}>'
@@ -174,6 +230,10 @@ class Assessment(db.Model):
         db.Index('idx_assessment_user_created', 'user_id', 'created_at'),
     )
 
+# DigitalDetoxLog.ai_score labels -> 1-5 value stored alongside for SQL aggregation
+AI_SCORE_VALUES = {'Excellent': 5, 'Good': 4, 'Fair': 3, 'Needs Improvement': 2, 'Poor': 1}
+
+
 class DigitalDetoxLog(db.Model):
     """Digital detox log model for storing user screen time and other digital wellness data."""
     __tablename__ = 'digital_detox_logs'
@@ -185,6 +245,7 @@ class DigitalDetoxLog(db.Model):
     academic_score = db.Column(db.Integer, nullable=True)
     social_interactions = db.Column(db.String(20), nullable=True)  # 'high', 'medium', 'low'
     ai_score = db.Column(db.String(20), nullable=True)  # AI-generated wellness score
+    ai_score_value = db.Column(db.SmallInteger, nullable=True)  # AI_SCORE_VALUES[ai_score], set with ai_score
     ai_suggestion = db.Column(db.Text, nullable=True)  # AI-generated suggestions
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     
@@ -194,6 +255,11 @@ class DigitalDetoxLog(db.Model):
         db.Index('idx_detox_user_created', 'user_id', 'created_at'),
     )
 
+    @validates('ai_score')
+    def _set_ai_score_value(self, key, ai_score):
+        self.ai_score_value = AI_SCORE_VALUES.get(ai_score)
+        return ai_score
+
 class RPMData(db.Model):
     """RPM data model for storing user remote patient monitoring data."""
     __tablename__ = 'rpm_data'
@@ -207,6 +273,10 @@ class RPMData(db.Model):
     mood_score = db.Column(db.Integer, nullable=True)  # 1-10 scale
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('idx_rpm_user_date', 'user_id', 'date'),
+    )
+
 class Gamification(db.Model):
     """Gamification model for storing user gamification data."""
     __tablename__ = 'gamification'
@@ -219,6 +289,11 @@ class Gamification(db.Model):
     last_activity = db.Column(db.Date, nullable=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        # One gamification row per user
+        db.Index('uq_gamification_user', 'user_id', unique=True),
+    )
+
 class ClinicalNote(db.Model):
     """Clinical note model for storing provider notes."""
     __tablename__ = 'clinical_notes'
@@ -232,9 +307,16 @@ class ClinicalNote(db.Model):
     provider_notes = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('idx_clinical_notes_patient_session', 'patient_id', 'session_date'),
+    )
+
 class InstitutionalAnalytics(db.Model):
-    """Institutional analytics model for storing institutional data."""
+    """Per-institution, per-day rollup of patient activity (maintained by institution_rollups)."""
     __tablename__ = 'institutional_analytics'
+    __table_args__ = (
+        db.Index('uq_institutional_analytics_institution_date', 'institution', 'date', unique=True),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     institution = db.Column(db.String(100), nullable=False)
@@ -245,7 +327,27 @@ class InstitutionalAnalytics(db.Model):
     avg_screen_time = db.Column(db.Float, nullable=True)
     high_risk_users = db.Column(db.Integer, default=0)
     engagement_rate = db.Column(db.Float, nullable=True)
+    appointments = db.Column(db.Integer, default=0)
+    completed_appointments = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class UserDailyActivity(db.Model):
+    """One patient's activity on one day, summed from the activity logs (maintained by institution_rollups)."""
+    __tablename__ = 'user_daily_activity'
+    __table_args__ = (
+        db.Index('idx_user_daily_activity_date', 'date'),
+    )
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    activities = db.Column(db.Integer, nullable=False, default=0)  # rows across all activity logs
+    screen_time_sum = db.Column(db.Float, nullable=False, default=0.0)
+    screen_time_logs = db.Column(db.Integer, nullable=False, default=0)
+    wellness_sum = db.Column(db.Float, nullable=False, default=0.0)  # assessment wellness points (0-10 each)
+    wellness_count = db.Column(db.Integer, nullable=False, default=0)
+
 
 class Appointment(db.Model):
     """Appointment model for storing user appointments."""
@@ -266,6 +368,13 @@ class Appointment(db.Model):
     # Relationships - Fixed: removed delete-orphan from many-to-one relationships
     user = db.relationship('User', foreign_keys=[user_id], backref='appointments')
     provider = db.relationship('User', foreign_keys=[provider_id])
+
+    __table_args__ = (
+        # Provider schedule by status, slot conflict checks
+        db.Index('idx_appointments_provider_status_date', 'provider_id', 'status', 'date'),
+        # Patient's appointments in date/time order
+        db.Index('idx_appointments_user_date_time', 'user_id', 'date', 'time'),
+    )
     
     def __repr__(self):
         return f'<Appointment {self.id} - {self.user_id} on {self.date} at {self.time}>'
@@ -326,6 +435,10 @@ class MedicationLog(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     taken_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('idx_medication_logs_user_taken', 'user_id', 'taken_at'),
+    )
+
     def __repr__(self):
         return f'<MedicationLog {self.id}>'
 
@@ -460,14 +573,59 @@ class Notification(db.Model):
     message = db.Column(db.Text, nullable=True)
     read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Risk triage (see triage.py): 0-10, NULL until scored
+    severity = db.Column(db.Integer, nullable=True)
+    severity_source = db.Column(db.String(20), nullable=True)  # 'heuristic' or 'llm'
+    severity_reason = db.Column(db.String(255), nullable=True)
+    triaged_at = db.Column(db.DateTime, nullable=True)
 
     sender = db.relationship('User', foreign_keys=[sender_id], backref='sent_notifications')
     recipient = db.relationship('User', foreign_keys=[recipient_id], backref='notifications')
 
+    __table_args__ = (
+        # Provider triage queue: unread messages for a recipient, highest severity first
+        db.Index('idx_notifications_recipient_read_severity', 'recipient_id', 'read', 'severity'),
+        # A recipient's messages in time order (chat history)
+        db.Index('idx_notifications_recipient_created', 'recipient_id', 'created_at'),
+    )
+
     def __repr__(self):
         return f'<Notification {self.type} to {self.recipient_id}>'
 
 
+class AIUsageMetric(db.Model):
+    """Per-minute AI usage roll-up by feature, user and model (written by ai.metering)."""
+    __tablename__ = 'ai_usage_metrics'
+    id = db.Column(db.Integer, primary_key=True)
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    feature = db.Column(db.String(50), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    model = db.Column(db.String(100), nullable=False, default='')
+    calls = db.Column(db.Integer, nullable=False, default=0)
+    cache_hits = db.Column(db.Integer, nullable=False, default=0)
+    fallback_calls = db.Column(db.Integer, nullable=False, default=0)
+    errors = db.Column(db.Integer, nullable=False, default=0)
+    prompt_tokens = db.Column(db.Integer, nullable=False, default=0)
+    response_tokens = db.Column(db.Integer, nullable=False, default=0)
+    total_ms = db.Column(db.Float, nullable=False, default=0.0)
+    max_ms = db.Column(db.Float, nullable=False, default=0.0)
+    latency_histogram = db.Column(db.JSON, nullable=True)  # bucket upper bound (ms) -> count
+
+    __table_args__ = (
+        db.Index('idx_ai_usage_bucket_feature', 'bucket_start', 'feature'),
+        db.Index('idx_ai_usage_user_bucket', 'user_id', 'bucket_start'),
+    )
+
+
+class ConversationRiskState(db.Model):
+    """Checkpoint of a user's recent chat message severities (written by risk_tracker)."""
+    __tablename__ = 'conversation_risk_states'
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    events = db.Column(db.JSON, nullable=False, default=list)  # [[unix time, severity], ...] oldest first
+    risk = db.Column(db.Float, nullable=False, default=0.0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
 # Helper functions for analytics
 def get_user_wellness_trend(user_id, days=30):
     """Get wellness trend for a specific user over the last N days"""
@@ -490,147 +648,7 @@ def get_user_wellness_trend(user_id, days=30):
         'assessments': assessments
     }
 
-def get_institutional_summary(institution, db, days_active=7, days_risk=7, days_assessments=30):
-    """Get summary statistics for an institution"""
-    users = User.query.filter_by(institution=institution, role='patient').all()
-    user_ids = [u.id for u in users]
-
-    if not user_ids:
-        return {
-            'total_users': 0,
-            'active_users': 0,
-            'avg_screen_time': 0.0,
-            'high_risk_users': 0,
-            'engagement_rate': 0.0,
-            'avg_wellness_score': 0.0,
-            'avg_session_duration': 0,
-            'completion_rate': 0.0,
-            'satisfaction_score': 0.0
-        }
-
-    # Define timeframes
-    active_start_date = datetime.now().date() - timedelta(days=days_active)
-    risk_start_date = datetime.now().date() - timedelta(days=days_risk)
-    assessment_start_date = datetime.now().date() - timedelta(days=days_assessments)
-
-    # --- Active Users and Engagement Rate ---
-    # Consider various activities for engagement
-    active_detox_users = db.session.query(DigitalDetoxLog.user_id).filter(
-        DigitalDetoxLog.user_id.in_(user_ids),
-        DigitalDetoxLog.date >= active_start_date
-    ).distinct().all()
-    active_assessment_users = db.session.query(Assessment.user_id).filter(
-        Assessment.user_id.in_(user_ids),
-        Assessment.created_at >= datetime.combine(active_start_date, datetime.min.time())
-    ).distinct().all()
-    active_medication_users = db.session.query(MedicationLog.user_id).filter(
-        MedicationLog.user_id.in_(user_ids),
-        MedicationLog.taken_at >= datetime.combine(active_start_date, datetime.min.time())
-    ).distinct().all()
-    active_breathing_users = db.session.query(BreathingExerciseLog.user_id).filter(
-        BreathingExerciseLog.user_id.in_(user_ids),
-        BreathingExerciseLog.created_at >= datetime.combine(active_start_date, datetime.min.time())
-    ).distinct().all()
-    active_yoga_users = db.session.query(YogaLog.user_id).filter(
-        YogaLog.user_id.in_(user_ids),
-        YogaLog.created_at >= datetime.combine(active_start_date, datetime.min.time())
-    ).distinct().all()
-    try:
-        active_music_users = db.session.query(MusicTherapyLog.user_id).filter(
-            MusicTherapyLog.user_id.in_(user_ids),
-            MusicTherapyLog.created_at >= datetime.combine(active_start_date, datetime.min.time())
-        ).distinct().all()
-    except OperationalError as e:
-        # If the music_therapy_logs table doesn't exist (e.g., migrations not applied),
-        # treat as zero activity instead of crashing the provider dashboard.
-        logger.warning(f"Database table missing or inaccessible when querying music therapy logs: {e}")
-        active_music_users = []
-
-    all_active_user_ids = set()
-    for result in active_detox_users + active_assessment_users + active_medication_users + active_breathing_users + active_yoga_users + active_music_users:
-        all_active_user_ids.add(result[0])
-
-    active_users_count = len(all_active_user_ids)
-    engagement_rate = round((active_users_count / len(users)) * 100, 1) if users else 0.0
-
-    # --- Average Screen Time ---
-    avg_screen_time = db.session.query(func.avg(DigitalDetoxLog.screen_time_hours)).filter(
-        DigitalDetoxLog.user_id.in_(user_ids),
-        DigitalDetoxLog.date >= risk_start_date
-    ).scalar() or 0.0
-
-    # --- High-Risk Users (screen time > 8 hours average, or low mood score) ---
-    # Efficiently calculate average screen time for each user
-    user_avg_screen_times = db.session.query(
-        DigitalDetoxLog.user_id,
-        func.avg(DigitalDetoxLog.screen_time_hours)
-    ).filter(
-        DigitalDetoxLog.user_id.in_(user_ids),
-        DigitalDetoxLog.date >= risk_start_date
-    ).group_by(DigitalDetoxLog.user_id).all()
-
-    high_risk_count = 0
-    for user_id, avg_st in user_avg_screen_times:
-        if avg_st and avg_st > 8:
-            high_risk_count += 1
-        # Add other risk factors here, e.g., low mood score from RPMData
-        # For example:
-        # latest_rpm = RPMData.query.filter_by(user_id=user_id).order_by(RPMData.date.desc()).first()
-        # if latest_rpm and latest_rpm.mood_score and latest_rpm.mood_score < 4:
-        #     high_risk_count += 1
-
-    # --- Average Wellness Score (based on recent assessments) ---
-    recent_assessments = Assessment.query.filter(
-        Assessment.user_id.in_(user_ids),
-        Assessment.created_at >= datetime.combine(assessment_start_date, datetime.min.time())
-    ).all()
-
-    total_wellness_score = 0
-    scored_assessments_count = 0
-    for assessment in recent_assessments:
-        # Assuming a simple mapping for GAD-7/PHQ-9 to a 1-10 wellness scale
-        # This is a simplified example; a more robust calculation might be needed
-        if assessment.assessment_type in ['GAD-7', 'PHQ-9'] and assessment.score is not None:
-            # Invert score: lower assessment score = higher wellness
-            max_score = 21 if assessment.assessment_type == 'GAD-7' else 27
-            wellness_contribution = (1 - (assessment.score / max_score)) * 10 # Scale to 0-10
-            total_wellness_score += wellness_contribution
-            scored_assessments_count += 1
-        elif assessment.assessment_type == 'Daily Mood' and assessment.score is not None:
-            total_wellness_score += assessment.score * 2 # Scale mood (1-5) to 1-10
-            scored_assessments_count += 1
-
-    avg_wellness_score = round(total_wellness_score / scored_assessments_count, 1) if scored_assessments_count > 0 else 0.0
-
-    # --- Average Session Duration and Completion Rate (Appointments) ---
-    all_appointments = Appointment.query.filter(
-        Appointment.provider_id.in_(user_ids), # Assuming provider_id in Appointment refers to the institution's providers
-        Appointment.date >= active_start_date
-    ).all()
-
-    total_session_duration = 0 # Placeholder, as Appointment model doesn't have duration
-    completed_appointments = 0
-    for appt in all_appointments:
-        # Placeholder for duration, assuming an average session length if not stored
-        total_session_duration += 45 # Assuming 45 minutes per session
-        if appt.status == 'completed': # Assuming a 'completed' status for appointments
-            completed_appointments += 1
-
-    avg_session_duration = round(total_session_duration / len(all_appointments), 1) if all_appointments else 0.0
-    completion_rate = round((completed_appointments / len(all_appointments)) * 100, 1) if all_appointments else 0.0
-
-    # --- Patient Satisfaction Score (Placeholder) ---
-    # This would typically come from a separate feedback/survey model
-    satisfaction_score = 4.2 # Placeholder for now
-
-    return {
-        'total_users': len(users),
-        'active_users': active_users_count,
-        'avg_screen_time': round(avg_screen_time, 1),
-        'high_risk_users': high_risk_count,
-        'engagement_rate': engagement_rate,
-        'avg_wellness_score': avg_wellness_score,
-        'avg_session_duration': avg_session_duration,
-        'completion_rate': completion_rate,
-        'satisfaction_score': satisfaction_score
-    }
+def get_institutional_summary(institution, db):
+    """Get summary statistics for an institution (today's rollup row, see institution_rollups)"""
+    from institution_rollups import institution_summary
+    return institution_summary(institution)
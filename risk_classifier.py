@@ -0,0 +1,167 @@
+"""
+Local risk classifier for chat messages (NumPy, runs on CPU in well under a millisecond).
+
+Messages are featurized by hashing word unigrams, word bigrams and character
+trigrams (CRC32, so hashes are stable across processes) into RISK_FEATURE_DIM
+buckets with sublinear term frequency and L2 normalisation. A logistic
+regression over those features gives the probability that a message needs
+a clinical severity check. It is trained offline
+(scripts/train_risk_classifier.py) from ai/fixtures/risk_messages.jsonl and
+stored as a sparse weight vector in ai/models/risk_classifier.npz together
+with the probability below which a message counts as confidently low risk.
+
+NumPy is optional at runtime: without it (or without the model file)
+classify_risk() returns None and callers fall back to the LLM.
+"""
+import os
+import re
+import zlib
+import logging
+import threading
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+
+RISK_CLASSIFIER_ENABLED = os.environ.get("RISK_CLASSIFIER_ENABLED", "1") == "1"
+RISK_CLASSIFIER_PATH = os.environ.get("RISK_CLASSIFIER_PATH", os.path.join(BASE_DIR, 'ai', 'models', 'risk_classifier.npz'))
+# Overrides the threshold stored with the model (probability below which a message skips the LLM check)
+RISK_CLASSIFIER_LOW_THRESHOLD = os.environ.get("RISK_CLASSIFIER_LOW_THRESHOLD")
+RISK_FEATURE_DIM = 1 << 18
+
+_TOKEN = re.compile(r"[a-z0-9']+")
+
+
+def features(text):
+    """Hashed feature strings for a message (before counting)."""
+    tokens = _TOKEN.findall((text or '').lower())
+    feats = ['w:' + t for t in tokens]
+    feats.extend('b:' + a + ' ' + b for a, b in zip(tokens, tokens[1:]))
+    for t in tokens:
+        padded = f' {t} '
+        feats.extend('c:' + padded[i:i + 3] for i in range(len(padded) - 2))
+    return feats
+
+
+def featurize(text, dim=RISK_FEATURE_DIM):
+    """(indices, values): sparse L2-normalised sublinear-tf vector for one message."""
+    feats = features(text)
+    if not feats:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    hashed = np.fromiter((zlib.crc32(f.encode('utf-8')) for f in feats), dtype=np.int64, count=len(feats)) & (dim - 1)
+    indices, counts = np.unique(hashed, return_counts=True)
+    values = (1.0 + np.log(counts)).astype(np.float32)
+    values /= np.sqrt(np.dot(values, values))
+    return indices, values
+
+
+def featurize_batch(texts, dim=RISK_FEATURE_DIM):
+    """Stack messages into CSR-style arrays (row ids, column indices, values)."""
+    rows, cols, vals = [], [], []
+    for row, text in enumerate(texts):
+        indices, values = featurize(text, dim)
+        rows.append(np.full(len(indices), row, dtype=np.int64))
+        cols.append(indices)
+        vals.append(values)
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(vals)
+
+
+def _sigmoid(z):
+    return 1.0 / (1.0 + np.exp(-np.clip(z, -30, 30)))
+
+
+class RiskClassifier:
+    def __init__(self, weights, bias, low_threshold, dim=RISK_FEATURE_DIM):
+        self.weights = weights      # dense float32 array of length dim
+        self.bias = float(bias)
+        self.low_threshold = float(low_threshold)
+        self.dim = dim
+
+    def predict_proba(self, text) -> float:
+        indices, values = featurize(text, self.dim)
+        return float(_sigmoid(np.dot(self.weights[indices], values) + self.bias))
+
+    def predict_proba_batch(self, texts):
+        rows, cols, vals = featurize_batch(texts, self.dim)
+        scores = np.bincount(rows, weights=self.weights[cols] * vals, minlength=len(texts))
+        return _sigmoid(scores + self.bias)
+
+    @classmethod
+    def train(cls, texts, labels, epochs=300, learning_rate=5.0, l2=1e-4, dim=RISK_FEATURE_DIM, low_threshold=0.1):
+        """
+        Full-batch gradient descent on the class-balanced logistic loss with L2.
+        Gradients are accumulated straight from the sparse rows with np.bincount.
+        """
+        rows, cols, vals = featurize_batch(texts, dim)
+        y = np.asarray(labels, dtype=np.float64)
+        n = len(y)
+        positives = max(1.0, y.sum())
+        sample_weight = np.where(y == 1, n / (2 * positives), n / (2 * max(1.0, n - positives)))
+        weights = np.zeros(dim, dtype=np.float64)
+        bias = 0.0
+        for _ in range(epochs):
+            scores = np.bincount(rows, weights=weights[cols] * vals, minlength=n) + bias
+            error = (_sigmoid(scores) - y) * sample_weight / n
+            grad = np.bincount(cols, weights=error[rows] * vals, minlength=dim)
+            weights -= learning_rate * (grad + l2 * weights)
+            bias -= learning_rate * error.sum()
+        return cls(weights.astype(np.float32), bias, low_threshold, dim)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        nonzero = np.flatnonzero(np.abs(self.weights) > 1e-6)
+        np.savez_compressed(path, indices=nonzero.astype(np.int32), weights=self.weights[nonzero],
+                            bias=self.bias, low_threshold=self.low_threshold, dim=self.dim)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            dim = int(data['dim'])
+            weights = np.zeros(dim, dtype=np.float32)
+            weights[data['indices']] = data['weights']
+            return cls(weights, float(data['bias']), float(data['low_threshold']), dim)
+
+
+_classifier = None
+_loaded = False
+_load_lock = threading.Lock()
+
+
+def get_classifier():
+    """The trained classifier, loaded once; None if disabled, NumPy is missing or there is no model file."""
+    global _classifier, _loaded
+    if _loaded:
+        return _classifier
+    with _load_lock:
+        if not _loaded:
+            if RISK_CLASSIFIER_ENABLED and NUMPY_AVAILABLE and os.path.exists(RISK_CLASSIFIER_PATH):
+                try:
+                    _classifier = RiskClassifier.load(RISK_CLASSIFIER_PATH)
+                    if RISK_CLASSIFIER_LOW_THRESHOLD is not None:
+                        _classifier.low_threshold = float(RISK_CLASSIFIER_LOW_THRESHOLD)
+                    logger.info(f"Loaded risk classifier (low-risk threshold {_classifier.low_threshold:.3f})")
+                except Exception as e:
+                    logger.error(f"Could not load risk classifier from {RISK_CLASSIFIER_PATH}: {e}")
+            elif RISK_CLASSIFIER_ENABLED:
+                logger.info("Risk classifier unavailable (NumPy or model file missing); every message goes to the LLM check")
+            _loaded = True
+    return _classifier
+
+
+def classify_risk(text):
+    """
+    (probability, confidently_low) for a message, or None when no classifier is available.
+    `confidently_low` means the message can skip the LLM severity check.
+    """
+    classifier = get_classifier()
+    if classifier is None:
+        return None
+    probability = classifier.predict_proba(text)
+    return probability, probability < classifier.low_threshold
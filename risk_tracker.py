@@ -0,0 +1,191 @@
+"""
+Per-user conversation risk across recent chat messages.
+
+Each user keeps a ring buffer of the last RISK_WINDOW_SIZE message severities.
+Older messages count less (exponential decay with RISK_HALF_LIFE_SECONDS),
+and the conversation risk is the larger of the strongest decayed message and
+the decayed total spread over RISK_LOAD_DIVISOR messages. A run of moderate
+messages therefore builds up risk that a single message would not show, and a
+quiet conversation lets it fade.
+
+The chat paths use it to decide whether a message needs the AI severity check
+(RISK_LLM_GATE) and to escalate on sustained distress. State lives in memory
+(at most RISK_MAX_USERS, least recently active evicted first, idle users
+dropped after RISK_IDLE_SECONDS) and is checkpointed to the
+conversation_risk_states table so a restart does not reset it.
+"""
+import os
+import time
+import logging
+import threading
+from collections import deque, OrderedDict
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+RISK_WINDOW_SIZE = int(os.environ.get("RISK_WINDOW_SIZE", "20"))
+RISK_HALF_LIFE_SECONDS = float(os.environ.get("RISK_HALF_LIFE_SECONDS", "900"))
+RISK_LOAD_DIVISOR = float(os.environ.get("RISK_LOAD_DIVISOR", "3"))
+RISK_LLM_GATE = float(os.environ.get("RISK_LLM_GATE", "3"))  # message or conversation risk that earns an AI check
+RISK_ESCALATE = 7
+RISK_IDLE_SECONDS = float(os.environ.get("RISK_IDLE_SECONDS", "3600"))
+RISK_MAX_USERS = int(os.environ.get("RISK_MAX_USERS", "10000"))
+RISK_CHECKPOINT_SECONDS = float(os.environ.get("RISK_CHECKPOINT_SECONDS", "60"))
+
+
+class ConversationRisk:
+    __slots__ = ('events', 'last_seen', 'dirty')
+
+    def __init__(self, events=(), last_seen=None):
+        # (unix time, severity) pairs, oldest first
+        self.events = deque(events, maxlen=RISK_WINDOW_SIZE)
+        self.last_seen = last_seen or time.time()
+        self.dirty = False
+
+    def snapshot(self, now) -> dict:
+        peak = load = 0.0
+        for ts, severity in self.events:
+            weighted = severity * 0.5 ** (max(0.0, now - ts) / RISK_HALF_LIFE_SECONDS)
+            peak = max(peak, weighted)
+            load += weighted
+        return {
+            'risk': round(min(10.0, max(peak, load / RISK_LOAD_DIVISOR)), 2),
+            'peak': round(peak, 2),
+            'load': round(load, 2),
+            'messages': len(self.events),
+        }
+
+
+class RiskTracker:
+    def __init__(self, max_users=RISK_MAX_USERS, idle_seconds=RISK_IDLE_SECONDS):
+        self.max_users = max_users
+        self.idle_seconds = idle_seconds
+        self._users = OrderedDict()  # user_id -> ConversationRisk, least recently active first
+        self._lock = threading.Lock()
+
+    def _state(self, user_id, now, restored=None):
+        """The user's state (caller holds the lock), created from `restored` or empty if new."""
+        state = self._users.get(user_id)
+        if state is None:
+            state = restored or ConversationRisk(last_seen=now)
+            self._users[user_id] = state
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        return state
+
+    def _restore(self, user_id, now):
+        """Reload a checkpoint written within the idle window (needs an app context)."""
+        try:
+            from extensions import db
+            from models import ConversationRiskState
+            row = db.session.get(ConversationRiskState, user_id)
+        except Exception as e:
+            logger.debug(f"No risk checkpoint for user {user_id}: {e}")
+            return None
+        if row is None or not row.events:
+            return None
+        last_seen = max(ts for ts, _ in row.events)
+        if now - last_seen > self.idle_seconds:
+            return None
+        return ConversationRisk(((ts, severity) for ts, severity in row.events), last_seen)
+
+    def observe(self, user_id, severity, now=None) -> dict:
+        """Record a message's severity and return the conversation snapshot including it."""
+        now = now or time.time()
+        with self._lock:
+            known = user_id in self._users
+        # Database lookup outside the lock; only for users not already in memory
+        restored = None if known else self._restore(user_id, now)
+        with self._lock:
+            state = self._state(user_id, now, restored)
+            state.events.append((now, int(severity)))
+            state.last_seen = now
+            state.dirty = True
+            return state.snapshot(now)
+
+    def revise_latest(self, user_id, severity):
+        """Raise the latest message's severity once a better rating (the AI check) is known."""
+        with self._lock:
+            state = self._users.get(user_id)
+            if state is None or not state.events:
+                return
+            ts, current = state.events[-1]
+            if severity > current:
+                state.events[-1] = (ts, int(severity))
+                state.dirty = True
+
+    def snapshot(self, user_id, now=None):
+        now = now or time.time()
+        with self._lock:
+            state = self._users.get(user_id)
+            return state.snapshot(now) if state is not None else None
+
+    def needs_ai_check(self, message_severity, snapshot) -> bool:
+        return max(message_severity, snapshot['risk']) >= RISK_LLM_GATE
+
+    def checkpoint(self, now=None) -> int:
+        """Write changed conversations to the database and drop idle ones (needs an app context)."""
+        from extensions import db
+        from models import ConversationRiskState
+
+        now = now or time.time()
+        with self._lock:
+            dirty = [(user_id, list(state.events), state.snapshot(now)['risk'])
+                     for user_id, state in self._users.items() if state.dirty]
+            for user_id, _, _ in dirty:
+                self._users[user_id].dirty = False
+        if dirty:
+            try:
+                for user_id, events, risk in dirty:
+                    db.session.merge(ConversationRiskState(
+                        user_id=user_id, events=[[ts, severity] for ts, severity in events],
+                        risk=risk, updated_at=datetime.utcnow()))
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.warning(f"Risk checkpoint failed, will retry: {e}")
+                with self._lock:
+                    for user_id, _, _ in dirty:
+                        if user_id in self._users:
+                            self._users[user_id].dirty = True
+                return 0
+        with self._lock:
+            for user_id in [u for u, s in self._users.items() if not s.dirty and now - s.last_seen > self.idle_seconds]:
+                del self._users[user_id]
+        return len(dirty)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'tracked_users': len(self._users), 'unsaved': sum(1 for s in self._users.values() if s.dirty)}
+
+
+risk_tracker = RiskTracker()
+
+
+def _checkpoint_loop(app, socketio):
+    logger.info("Conversation risk checkpointer started")
+    while True:
+        socketio.sleep(RISK_CHECKPOINT_SECONDS)
+        try:
+            with app.app_context():
+                risk_tracker.checkpoint()
+        except Exception:
+            logger.exception("Conversation risk checkpoint loop error")
+
+
+_checkpointer_pid = None
+_checkpointer_lock = threading.Lock()
+
+
+def ensure_risk_checkpointer(app, socketio):
+    """Start the periodic checkpoint once per serving process (see utils.job_queue.ensure_job_worker)."""
+    global _checkpointer_pid
+    if _checkpointer_pid == os.getpid():
+        return
+    with _checkpointer_lock:
+        if _checkpointer_pid == os.getpid():
+            return
+        _checkpointer_pid = os.getpid()
+        socketio.start_background_task(_checkpoint_loop, app, socketio)
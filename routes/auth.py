@@ -1,5 +1,6 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app
 from models import User, Gamification, db
+from utils.offload import OffloadRejected, OffloadTimeout
 from datetime import datetime, date
 import re
 
@@ -76,6 +77,10 @@ def login():
             else:
                 return redirect(url_for('provider.provider_dashboard'))
 
+        except (OffloadRejected, OffloadTimeout) as e:
+            current_app.logger.warning(f"Login busy - password check not run: {e}")
+            flash('The server is busy right now. Please try again in a moment.', 'error')
+            return render_template('login.html'), 503
         except Exception as e:
             current_app.logger.error(f"Login error: {str(e)}", exc_info=True)
             flash('An error occurred during login. Please try again.', 'error')
@@ -131,9 +136,9 @@ def signup():
             new_user = User(
                 name=name,
                 email=email,
-                role=role,
-                institution=institution
+                role=role
             )
+            new_user.set_institution(institution)
             new_user.set_password(password)
 
             db.session.add(new_user)
@@ -156,6 +161,11 @@ def signup():
             flash('Registration successful! Please login with your credentials.', 'success')
             return redirect(url_for('auth.login'))
 
+        except (OffloadRejected, OffloadTimeout) as e:
+            db.session.rollback()
+            current_app.logger.warning(f"Signup busy - password not hashed: {e}")
+            flash('The server is busy right now. Please try again in a moment.', 'error')
+            return render_template('signup.html'), 503
         except Exception as e:
             db.session.rollback()
             current_app.logger.error(f"Signup error: {str(e)}", exc_info=True)
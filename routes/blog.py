@@ -1,7 +1,9 @@
 from flask import Blueprint, render_template, session, redirect, url_for, flash, request, jsonify
 from models import BlogPost, BlogComment, BlogLike, db, User
 from decorators import login_required
+from utils.query_stats import query_budget
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import joinedload
 from datetime import datetime
 
 blog_bp = Blueprint('blog', __name__, url_prefix='/blog')
@@ -26,6 +28,7 @@ def blog_list():
     return render_template('blog_list.html', posts=posts, insights=insights)
 
 @blog_bp.route('/<int:post_id>')
+@query_budget(15)
 def blog_detail(post_id):
     post = BlogPost.query.get_or_404(post_id)
     
@@ -34,7 +37,7 @@ def blog_detail(post_id):
     db.session.commit()
     
     # Get comments for this post
-    comments = BlogComment.query.filter_by(post_id=post_id).order_by(BlogComment.created_at.asc()).all()
+    comments = BlogComment.query.options(joinedload(BlogComment.user)).filter_by(post_id=post_id).order_by(BlogComment.created_at.asc()).all()
     
     # Check if current user has liked this post
     user_has_liked = False
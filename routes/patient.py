@@ -1,4 +1,4 @@
-from flask import Blueprint, render_template, session, redirect, url_for, flash, request, jsonify
+from flask import Blueprint, render_template, session, redirect, url_for, flash, request, jsonify, current_app
 from models import (User, Gamification, DigitalDetoxLog, Assessment, Goal, Medication, 
                 MedicationLog, BreathingExerciseLog, YogaLog, ProgressRecommendation, 
                 Prescription, MoodLog, RPMData, Appointment, db)
@@ -8,18 +8,20 @@ from datetime import datetime, date, timedelta, timezone
 import json
 import ai.service as ai_service
 from gamification_engine import award_points
+from utils.job_queue import job_handler, enqueue_job, job_queue
+from ai.metering import current_user_id as ai_metering_user
+from utils.query_stats import query_budget
 import logging
 import uuid
 
 # Import shared data storage instead of importing from app to avoid circular imports
 from shared_data import patient_journal_entries, patient_voice_logs_data
+from utils.offload import offload
+from utils import cpu_tasks
 
-# TextBlob for sentiment analysis
-try:
-    from textblob import TextBlob
-    TEXTBLOB_AVAILABLE = True
-except ImportError:
-    TEXTBLOB_AVAILABLE = False
+# TextBlob for sentiment analysis; only probed here, it is imported where the scoring runs (utils.cpu_tasks)
+from importlib.util import find_spec
+TEXTBLOB_AVAILABLE = find_spec('textblob') is not None
 
 logger = logging.getLogger(__name__)
 
@@ -30,9 +32,9 @@ def get_ai_journal_suggestions(title, content):
         sentiment = "Neutral" 
         if TEXTBLOB_AVAILABLE:
              try:
-                 blob = TextBlob(content)
-                 if blob.sentiment.polarity > 0.1: sentiment = "Positive"
-                 elif blob.sentiment.polarity < -0.1: sentiment = "Negative"
+                 polarity = offload('text_polarity', cpu_tasks.text_polarity, content)
+                 if polarity > 0.1: sentiment = "Positive"
+                 elif polarity < -0.1: sentiment = "Negative"
              except: pass
 
         # Use the dedicated AI service function
@@ -372,6 +374,7 @@ def digital_detox():
                          suggestion=suggestion)
 
 @patient_bp.route('/progress')
+@query_budget(15)
 @login_required
 @patient_required
 def progress():
@@ -614,30 +617,15 @@ def api_save_assessment():
             'message': 'Missing required fields: assessment_type and score are required'
         }), 400
 
-    ai_insights = {}
-    ai_insights_generated_successfully = True
-    try:
-        ai_insights = ai_service.generate_assessment_insights(
-            assessment_type=assessment_type,
-            score=score,
-            responses=responses
-        )
-    except Exception as e:
-        ai_insights_generated_successfully = False
-        ai_insights = {
-            'summary': 'AI insights are currently unavailable. Please try again later.',
-            'recommendations': [],
-            'resources': []
-        }
-
     try:
+        # Save first; insights are generated by the background worker
         assessment = Assessment(
             user_id=user_id,
             assessment_type=assessment_type.upper(),
             score=score,
             responses=responses,
             contextual_responses=contextual_responses,
-            ai_insights=json.dumps(ai_insights) if ai_insights else None
+            ai_insights=None
         )
         
         db.session.add(assessment)
@@ -655,24 +643,76 @@ def api_save_assessment():
         
         db.session.commit()
         
-        return jsonify({
-            'success': True,
-            'message': 'Assessment saved successfully',
-            'assessment_id': assessment.id,
-            'points_earned': 20,
-            'total_points': gamification.points,
-            'ai_insights': ai_insights,
-            'ai_insights_generated': ai_insights_generated_successfully
-        })
-        
     except Exception as e:
         db.session.rollback()
         return jsonify({
             'success': False,
-            'message': f'Failed to save assessment: {str(e)}',
-            'insights': ai_insights if 'ai_insights' in locals() else None
+            'message': f'Failed to save assessment: {str(e)}'
         }), 500
 
+    job_id = None
+    try:
+        # Only the id: the answers stay in the main database, not in the job store
+        job_id = enqueue_job('assessment_insights', {'assessment_id': assessment.id}, user_id=user_id)
+    except Exception as e:
+        logger.error(f"Could not queue insight generation for assessment {assessment.id}: {e}")
+
+    return jsonify({
+        'success': True,
+        'message': 'Assessment saved successfully',
+        'assessment_id': assessment.id,
+        'points_earned': 20,
+        'total_points': gamification.points,
+        'ai_insights': None,
+        'ai_insights_generated': False,
+        'ai_insights_pending': job_id is not None,
+        'insights_job_id': job_id
+    })
+
+@job_handler('assessment_insights')
+def process_assessment_insights_job(payload, job):
+    """Generate insights for a saved assessment, store them and push them to the patient."""
+    assessment = db.session.get(Assessment, payload['assessment_id'])
+    if assessment is None:
+        return {'skipped': 'assessment no longer exists'}
+    ai_metering_user.set(assessment.user_id)
+
+    ai_insights = ai_service.generate_assessment_insights(
+        assessment_type=assessment.assessment_type,
+        score=assessment.score,
+        responses=assessment.responses or []
+    )
+    assessment.ai_insights = json.dumps(ai_insights) if ai_insights else None
+    db.session.commit()
+
+    socketio = current_app.extensions.get('socketio')
+    if socketio is not None:
+        socketio.emit('assessment_insights', {
+            'assessment_id': assessment.id,
+            'job_id': job['id'],
+            'ai_insights': ai_insights
+        }, to=f'user_{assessment.user_id}')
+    return {'assessment_id': assessment.id}
+
+@patient_bp.route('/api/insight-jobs/<job_id>')
+@login_required
+@patient_required
+def insight_job_status(job_id):
+    """Polling fallback for clients that miss the SocketIO push."""
+    job = job_queue.get(job_id)
+    if not job or job.get('user_id') != session['user_id']:
+        return jsonify({'success': False, 'message': 'Job not found'}), 404
+
+    response = {
+        'success': True,
+        'status': job['status'],
+        'assessment_id': job['payload'].get('assessment_id')
+    }
+    if job['status'] == 'done':
+        assessment = db.session.get(Assessment, response['assessment_id'])
+        response['ai_insights'] = json.loads(assessment.ai_insights) if assessment and assessment.ai_insights else None
+    return jsonify(response)
+
 @patient_bp.route('/my-prescriptions')
 @login_required
 @patient_required
@@ -829,8 +869,7 @@ def patient_journal():
         sentiment_result = 'Neutral'  # Default fallback
         if TEXTBLOB_AVAILABLE:
             try:
-                blob = TextBlob(content)
-                polarity = blob.sentiment.polarity
+                polarity = offload('text_polarity', cpu_tasks.text_polarity, content)
                 if polarity > 0.1:
                     sentiment_result = 'Positive'
                 elif polarity < -0.1:
@@ -1,113 +1,126 @@
-from flask import Blueprint, render_template, session, redirect, url_for, flash, request, jsonify
+from flask import Blueprint, render_template, session, redirect, url_for, flash, request, jsonify, current_app
 from models import (User, Gamification, DigitalDetoxLog, Assessment, Goal, Medication, 
                 MedicationLog, BreathingExerciseLog, YogaLog, ProgressRecommendation, 
-                Prescription, MoodLog, RPMData, Appointment, ClinicalNote, BlogInsight, db, get_institutional_summary)
+                Prescription, MoodLog, RPMData, Appointment, ClinicalNote, BlogInsight, AIUsageMetric, Notification,
+                db, get_institutional_summary)
 from decorators import login_required, role_required
 from sqlalchemy.orm import joinedload
-from sqlalchemy import or_, and_
+from sqlalchemy import or_, and_, func
 from datetime import datetime, date, timedelta
 import json
-from ai import ask as ai_service
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+import ai.service as ai_service
+from utils.job_queue import job_handler, enqueue_job, job_queue
+from triage import triage_messages, triage_queue, TRIAGE_HIGH_RISK
+from utils.query_stats import query_budget
+from utils.db_routing import read_replica
+from caseload import caseload_page, SORTS as CASELOAD_SORTS, DEFAULT_INSTITUTION
+from analytics_series import detox_series
+
+logger = logging.getLogger(__name__)
 
 provider_bp = Blueprint('provider', __name__, url_prefix='/provider')
 
-def normalize_institution_name(institution_name):
-    """Normalize institution name for better matching."""
-    if not institution_name:
-        return ''
-    return institution_name.lower().strip()
+WELLNESS_LATE_SECTION_SECONDS = 600  # how long late AI sections stay available to the poll endpoint
+
+_late_sections = OrderedDict()  # report token -> {'provider_id', 'expires', 'sections': {section: result}}
+_late_sections_lock = threading.Lock()
+
+
+def _store_late_section(report_token, provider_id, section, result):
+    now = time.monotonic()
+    with _late_sections_lock:
+        entry = _late_sections.setdefault(report_token, {'provider_id': provider_id, 'sections': {}})
+        entry['expires'] = now + WELLNESS_LATE_SECTION_SECONDS
+        entry['sections'][section] = result
+        while _late_sections and next(iter(_late_sections.values()))['expires'] <= now:
+            _late_sections.popitem(last=False)
+
+
+def load_wellness_ai_sections(patient_id, patient_data_for_ai, medication_logs_data):
+    """
+    Fetch the wellness report's AI sections concurrently under one deadline.
+
+    Sections that miss the deadline are rendered as placeholders. When ready they
+    are kept under the report token for the poll endpoint (wellness_report_ai_sections)
+    and pushed to the provider's `user_<id>` SocketIO room as `wellness_report_ai` events.
+    Returns (goal_suggestions, medication_adherence, pending_sections, report_token).
+    """
+    report_token = uuid.uuid4().hex
+    socketio = current_app.extensions.get('socketio')
+    provider_id = session['user_id']
+    provider_room = f"user_{provider_id}"
+
+    def push_late_section(section, result):
+        # The page's socket may not have joined the room yet; the poll endpoint covers that
+        _store_late_section(report_token, provider_id, section, result)
+        if socketio is None:
+            return
+        socketio.emit('wellness_report_ai', {
+            'report_token': report_token,
+            'patient_id': patient_id,
+            'section': section,
+            'data': result
+        }, to=provider_room)
+
+    results, pending = ai_service.generate_wellness_report_insights(
+        patient_data_for_ai, medication_logs_data, on_late=push_late_section
+    )
+    return results.get('goal_suggestions'), results.get('medication_adherence'), pending, report_token
+
+@provider_bp.route('/api/wellness-report-ai/<report_token>')
+@login_required
+def wellness_report_ai_sections(report_token):
+    """Polling fallback for late wellness report AI sections the SocketIO push missed."""
+    with _late_sections_lock:
+        entry = _late_sections.get(report_token)
+        if entry and entry['expires'] > time.monotonic() and entry['provider_id'] == session['user_id']:
+            sections = dict(entry['sections'])
+        else:
+            sections = {}
+    return jsonify({'success': True, 'sections': sections})
 
 @provider_bp.route('/dashboard')
+@query_budget(30)
 @login_required
 @role_required('provider')
 def provider_dashboard():
-    institution = session.get('user_institution', 'Sample University')
+    institution = session.get('user_institution', DEFAULT_INSTITUTION)
 
-    # Normalize the provider's institution for better matching
-    normalized_provider_institution = normalize_institution_name(institution)
-
-    # More flexible institution matching for better patient-provider visibility
-    # Split institution name into keywords for partial matching
-    institution_keywords = set(normalized_provider_institution.split())
-
-    # Fetch all patients and filter them based on institution similarity
-    all_patients = User.query.options(
-        joinedload(User.digital_detox_logs),
-        joinedload(User.clinical_notes)
-    ).filter_by(role='patient').all()
-
-    # Filter patients based on institution similarity
-    patients = []
-    for patient in all_patients:
-        patient_institution = patient.institution or ''
-        normalized_patient_institution = normalize_institution_name(patient_institution)
-        patient_keywords = set(normalized_patient_institution.split())
-
-        # Check for similarity (partial match, case-insensitive)
-        if institution_keywords & patient_keywords:  # Intersection of keywords
-            patients.append(patient)
-        elif not patient_institution and institution == 'Sample University':
-            # Include patients with no institution if provider is using default
-            patients.append(patient)
-
-    # If no patients found with flexible matching, fall back to exact match for backward compatibility
-    if not patients:
-        patients = User.query.options(
-            joinedload(User.digital_detox_logs),
-            joinedload(User.clinical_notes)
-        ).filter_by(role='patient', institution=institution).all()
-
-    caseload_data = []
-    for patient in patients:
-        # Get latest detox and session from already loaded relationships (prevents N+1 queries)
-        latest_detox = patient.digital_detox_logs[0] if patient.digital_detox_logs else None
-        latest_session = patient.clinical_notes[0] if patient.clinical_notes else None
-
-        risk_level = 'Low'
-        if latest_detox:
-            if latest_detox.screen_time_hours > 8 or (latest_detox.ai_score and latest_detox.ai_score == 'Needs Improvement'):
-                risk_level = 'High'
-            elif latest_detox.screen_time_hours > 6 or (latest_detox.ai_score and latest_detox.ai_score == 'Good'):
-                risk_level = 'Medium'
-
-        caseload_data.append({
-            'user_id': patient.id,
-            'name': patient.name,
-            'email': patient.email,
-            'risk_level': risk_level,
-            'last_session': latest_session.session_date.strftime('%Y-%m-%d') if latest_session else 'No sessions',
-            'status': 'Active' if latest_detox and latest_detox.date >= date.today() - timedelta(days=7) else 'Inactive',
-            'digital_score': latest_detox.ai_score if latest_detox and latest_detox.ai_score else 'No data'
-        })
-    
-    # --- Apply client-side filters/search if provided ---
+    # --- Server-side search, risk filter, sort and keyset pagination (see caseload.py) ---
     search_q = request.args.get('q', '').strip()
     filter_risk = request.args.get('risk', '').strip()
-
-    filtered_caseload = caseload_data
-    if search_q:
-        q_lower = search_q.lower()
-        filtered_caseload = [c for c in filtered_caseload if q_lower in (c.get('name') or '').lower() or q_lower in (c.get('email') or '').lower()]
-
-    if filter_risk in ('High', 'Medium', 'Low'):
-        filtered_caseload = [c for c in filtered_caseload if c.get('risk_level') == filter_risk]
+    sort = request.args.get('sort', 'risk')
+    if sort not in CASELOAD_SORTS:
+        sort = 'risk'
+    try:
+        page = caseload_page(institution, search=search_q or None, risk=filter_risk or None, sort=sort,
+                             direction=request.args.get('direction'), cursor=request.args.get('cursor'))
+    except ValueError:
+        # Stale or tampered cursor: start from the first page
+        page = caseload_page(institution, search=search_q or None, risk=filter_risk or None, sort=sort)
+    filtered_caseload = page['patients']
 
     # --- Simple Tasks derivation (quick wins): overdue appointments and inactive follow-ups ---
     tasks = []
     try:
         # Overdue appointments assigned to this provider (status 'booked' and date < today)
-        overdue = Appointment.query.filter(Appointment.provider_id == session.get('user_id'), Appointment.status == 'booked', Appointment.date < date.today()).order_by(Appointment.date.desc()).limit(5).all()
+        overdue = Appointment.query.options(joinedload(Appointment.user)).filter(Appointment.provider_id == session.get('user_id'), Appointment.status == 'booked', Appointment.date < date.today()).order_by(Appointment.date.desc()).limit(5).all()
         for o in overdue:
             tasks.append({'title': f'Complete appointment note for {o.user.name if o.user else o.user_id}', 'patient_id': o.user_id, 'due': o.date.strftime('%Y-%m-%d'), 'type': 'appointment'})
     except Exception:
         # If Appointment table/query fails for any reason, ignore tasks generation gracefully
         tasks = []
 
-    # Also add patients with no recent activity (>7 days)
+    # Also add patients with no recent activity (>7 days), longest inactive first; the panel shows five tasks
     try:
-        for c in caseload_data:
-            if c.get('status') == 'Inactive':
-                tasks.append({'title': f'Check-in with {c.get("name")}', 'patient_id': c.get('user_id'), 'due': '', 'type': 'followup'})
+        inactive = caseload_page(institution, status='Inactive', sort='last_activity', direction='asc', limit=5)
+        for c in inactive['patients']:
+            tasks.append({'title': f'Check-in with {c.get("name")}', 'patient_id': c.get('user_id'), 'due': '', 'type': 'followup'})
     except Exception:
         pass
 
@@ -130,6 +143,9 @@ def provider_dashboard():
                          institution=institution,
                          search_q=search_q,
                          filter_risk=filter_risk,
+                         sort=page['sort'],
+                         direction=page['direction'],
+                         next_cursor=page['next_cursor'],
                          tasks=tasks)
 
 @provider_bp.route('/appointments/accept/<int:appointment_id>', methods=['POST'])
@@ -299,9 +315,132 @@ def ai_documentation():
     
     return render_template('ai_documentation.html', user_name=session['user_name'])
 
+@provider_bp.route('/api/ai-usage')
+@login_required
+@role_required('provider')
+def ai_usage_api():
+    """
+    AI usage by feature and top users over the last `hours`, plus the live in-memory window,
+    counting only calls by users of the provider's institution. Stored figures lag by up to
+    AI_METRICS_FLUSH_SECONDS; the background flusher writes them, not this request.
+    """
+    hours = min(max(request.args.get('hours', 24, type=int), 1), 24 * 31)
+    since = datetime.utcnow() - timedelta(hours=hours)
+    institution = session.get('user_institution', DEFAULT_INSTITUTION)
+    institution_users = db.session.query(User.id).filter(User.institution == institution)
+
+    totals = (
+        func.sum(AIUsageMetric.calls), func.sum(AIUsageMetric.cache_hits),
+        func.sum(AIUsageMetric.fallback_calls), func.sum(AIUsageMetric.errors),
+        func.sum(AIUsageMetric.prompt_tokens), func.sum(AIUsageMetric.response_tokens),
+        func.sum(AIUsageMetric.total_ms), func.max(AIUsageMetric.max_ms),
+    )
+
+    def describe(row):
+        calls, cache_hits, fallback_calls, errors, prompt_tokens, response_tokens, total_ms, max_ms = row
+        return {
+            'calls': calls or 0, 'cache_hits': cache_hits or 0, 'fallback_calls': fallback_calls or 0,
+            'errors': errors or 0, 'prompt_tokens': prompt_tokens or 0, 'response_tokens': response_tokens or 0,
+            'avg_ms': round(total_ms / calls, 1) if calls else None, 'max_ms': round(max_ms or 0, 1),
+        }
+
+    in_scope = and_(AIUsageMetric.bucket_start >= since, AIUsageMetric.user_id.in_(institution_users))
+    by_feature = db.session.query(AIUsageMetric.feature, *totals) \
+        .filter(in_scope) \
+        .group_by(AIUsageMetric.feature).all()
+    token_sum = func.sum(AIUsageMetric.prompt_tokens + AIUsageMetric.response_tokens)
+    top_users = db.session.query(AIUsageMetric.user_id, *totals) \
+        .filter(in_scope) \
+        .group_by(AIUsageMetric.user_id).order_by(token_sum.desc()).limit(20).all()
+
+    return jsonify({
+        'success': True,
+        'hours': hours,
+        'features': {row[0]: describe(row[1:]) for row in by_feature},
+        'top_users': [dict(describe(row[1:]), user_id=row[0]) for row in top_users],
+        'institution': institution,
+        'live': ai_service.ai_usage_summary(15, user_ids={user_id for (user_id,) in institution_users}),
+    })
+
+@job_handler('message_triage')
+def process_message_triage_job(payload, job):
+    """Score a provider's unread messages (or the given ones) and push the result to the provider."""
+    recipient_id = payload['recipient_id']
+    summary = triage_messages(recipient_id, notification_ids=payload.get('notification_ids'),
+                              rescore=payload.get('rescore', False))
+    socketio = current_app.extensions.get('socketio')
+    if socketio is not None:
+        socketio.emit('message_triage_complete', dict(summary, job_id=job['id']), to=f'user_{recipient_id}')
+    return summary
+
+@provider_bp.route('/api/triage', methods=['POST'])
+@login_required
+@role_required('provider')
+def start_message_triage():
+    """Queue a triage run over the provider's unread messages."""
+    data = request.get_json(silent=True) or {}
+    try:
+        job_id = enqueue_job('message_triage', {'recipient_id': session['user_id'], 'rescore': bool(data.get('rescore'))},
+                             user_id=session['user_id'])
+    except Exception as e:
+        logger.error(f"Could not queue message triage: {e}")
+        return jsonify({'success': False, 'message': 'Could not start triage'}), 500
+    return jsonify({'success': True, 'job_id': job_id}), 202
+
+@provider_bp.route('/api/triage/<job_id>')
+@login_required
+@role_required('provider')
+def message_triage_status(job_id):
+    """Polling fallback for clients that miss the SocketIO push."""
+    job = job_queue.get(job_id)
+    if not job or job.get('user_id') != session['user_id'] or job['kind'] != 'message_triage':
+        return jsonify({'success': False, 'message': 'Job not found'}), 404
+    return jsonify({'success': True, 'status': job['status'], 'result': job['result']})
+
+@provider_bp.route('/api/triage-queue')
+@login_required
+@role_required('provider')
+def message_triage_queue():
+    """Unread patient messages for this provider, highest risk first."""
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    min_severity = request.args.get('min_severity', type=int)
+    messages = triage_queue(session['user_id'], limit=limit, min_severity=min_severity)
+    return jsonify({
+        'success': True,
+        'messages': [{
+            'id': m.id,
+            'sender_id': m.sender_id,
+            'sender_name': m.sender.name if m.sender else None,
+            'message': m.message,
+            'severity': m.severity,
+            'severity_source': m.severity_source,
+            'severity_reason': m.severity_reason,
+            'high_risk': m.severity is not None and m.severity >= TRIAGE_HIGH_RISK,
+            'created_at': m.created_at.isoformat() if m.created_at else None,
+        } for m in messages]
+    })
+
+@provider_bp.route('/api/triage-queue/<int:notification_id>/read', methods=['POST'])
+@login_required
+@role_required('provider')
+def mark_triaged_message_read(notification_id):
+    notification = Notification.query.filter_by(id=notification_id, recipient_id=session['user_id']).first()
+    if notification is None:
+        return jsonify({'success': False, 'message': 'Message not found'}), 404
+    try:
+        notification.read = True
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Failed to mark message {notification_id} read: {e}")
+        return jsonify({'success': False, 'message': 'Could not update message'}), 500
+    return jsonify({'success': True})
+
 @provider_bp.route('/analytics')
+@query_budget(20)
 @login_required
 @role_required('provider')
+@read_replica('provider_analytics')
 def analytics():
     institution = session.get('user_institution', 'Sample University')
 
@@ -311,25 +450,19 @@ def analytics():
     # Get recent blog insights
     recent_blog_insights = BlogInsight.query.order_by(BlogInsight.created_at.desc()).limit(10).all()
 
-    # Get patient engagement trends
-    patients = User.query.filter_by(role='patient', institution=institution).all()
-    patient_ids = [p.id for p in patients]
-
-    # Get recent digital detox data for trends
-    recent_detox = DigitalDetoxLog.query.filter(
-        DigitalDetoxLog.user_id.in_(patient_ids),
-        DigitalDetoxLog.date >= datetime.now().date() - timedelta(days=30)
-    ).all()
-
-    # Calculate engagement metrics
-    active_patients = len(set([log.user_id for log in recent_detox]))
-    total_patients = len(patients)
+    # Patient engagement over the last 30 days, counted in SQL
+    patient_ids = db.session.query(User.id).filter(User.role == 'patient', User.institution == institution)
+    since = datetime.now().date() - timedelta(days=30)
+    total_patients = db.session.query(func.count(User.id)) \
+        .filter(User.role == 'patient', User.institution == institution).scalar() or 0
+    active_patients = db.session.query(func.count(func.distinct(DigitalDetoxLog.user_id))) \
+        .filter(DigitalDetoxLog.user_id.in_(patient_ids), DigitalDetoxLog.date >= since).scalar() or 0
 
     # Get assessment completion rates
-    assessments_30_days = Assessment.query.filter(
+    assessments_30_days = db.session.query(func.count(Assessment.id)).filter(
         Assessment.user_id.in_(patient_ids),
         Assessment.created_at >= datetime.now() - timedelta(days=30)
-    ).count()
+    ).scalar()
 
     # Get gamification stats
     gamification_stats = db.session.query(
@@ -338,43 +471,11 @@ def analytics():
         func.count(Gamification.id)
     ).filter(Gamification.user_id.in_(patient_ids)).first()
 
-    # Get wellness trend data for charts
-    detox_trends = {}
-    for log in recent_detox:
-        date_str = log.date.strftime('%Y-%m-%d')
-        if date_str not in detox_trends:
-            detox_trends[date_str] = {'total_hours': 0, 'count': 0, 'ai_scores': []}
-        detox_trends[date_str]['total_hours'] += log.screen_time_hours
-        detox_trends[date_str]['count'] += 1
-        if log.ai_score:
-            detox_trends[date_str]['ai_scores'].append(log.ai_score)
-
-    # Calculate average daily screen time and wellness scores
-    chart_labels = sorted(detox_trends.keys())
-    screen_time_data = []
-    wellness_score_data = []
-
-    for date in chart_labels:
-        data = detox_trends[date]
-        avg_screen_time = data['total_hours'] / data['count'] if data['count'] > 0 else 0
-        screen_time_data.append(round(avg_screen_time, 1))
-
-        # Convert AI scores to numeric values for averaging
-        numeric_scores = []
-        for score in data['ai_scores']:
-            if score == 'Excellent':
-                numeric_scores.append(5)
-            elif score == 'Good':
-                numeric_scores.append(4)
-            elif score == 'Fair':
-                numeric_scores.append(3)
-            elif score == 'Needs Improvement':
-                numeric_scores.append(2)
-            elif score == 'Poor':
-                numeric_scores.append(1)
-
-        avg_wellness = sum(numeric_scores) / len(numeric_scores) if numeric_scores else 0
-        wellness_score_data.append(round(avg_wellness, 1))
+    # Daily screen time and wellness score series for the charts
+    series = detox_series(institution, days=30)
+    chart_labels = series['labels']
+    screen_time_data = series['screen_time']
+    wellness_score_data = series['wellness_score']
 
     analytics_data = {
         'institution': institution,
@@ -397,6 +498,20 @@ def analytics():
                          analytics_data=analytics_data,
                          datetime=datetime)
 
+@provider_bp.route('/api/analytics/series')
+@login_required
+@role_required('provider')
+@read_replica('analytics_series')
+def analytics_series_api():
+    """Detox chart series for the provider's institution: ?days=30&granularity=day|week|month."""
+    institution = session.get('user_institution', 'Sample University')
+    try:
+        series = detox_series(institution, days=request.args.get('days', 30, type=int),
+                              granularity=request.args.get('granularity', 'day'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify(dict(series, success=True))
+
 @provider_bp.route('/send_prescription/<int:patient_id>', methods=['POST'])
 @login_required
 @role_required('provider')
@@ -439,8 +554,10 @@ def send_prescription(patient_id):
     return redirect(url_for('provider.wellness_report', user_id=patient_id))
 
 @provider_bp.route('/wellness-report/<int:user_id>')
+@query_budget(25)
 @login_required
 @role_required('provider')
+@read_replica('wellness_report')
 def wellness_report(user_id):
     from datetime import datetime
     
@@ -524,12 +641,14 @@ def wellness_report(user_id):
         'recent_goals': [{'title': g.title, 'status': g.status, 'progress': g.progress_percentage} for g in Goal.query.filter_by(user_id=user_id).order_by(Goal.created_at.desc()).limit(5).all()],
         'recent_digital_detox': [{'screen_time_hours': d.screen_time_hours, 'ai_score': d.ai_score} for d in digital_detox_logs[:5]]
     }
-    ai_goal_suggestions = ai_service.generate_goal_suggestions(patient_data_for_ai)
 
     # Fetch medication logs for AI adherence analysis
     medication_logs = MedicationLog.query.filter_by(user_id=user_id).order_by(MedicationLog.taken_at.desc()).limit(30).all()
     medication_logs_data = [{'medication_id': log.medication_id, 'taken_at': log.taken_at.isoformat()} for log in medication_logs]
-    ai_medication_adherence_insights = ai_service.analyze_medication_adherence(medication_logs_data, patient_data_for_ai)
+
+    # Goal suggestions and adherence analysis are independent; run them concurrently
+    ai_goal_suggestions, ai_medication_adherence_insights, ai_pending_sections, ai_report_token = \
+        load_wellness_ai_sections(user_id, patient_data_for_ai, medication_logs_data)
 
     return render_template('wellness_report.html', 
                          user_name=session['user_name'], 
@@ -545,4 +664,6 @@ def wellness_report(user_id):
                          phq9_data=filtered_phq9_data,
                          ai_goal_suggestions=ai_goal_suggestions,
                          ai_medication_adherence_insights=ai_medication_adherence_insights,
+                         ai_pending_sections=ai_pending_sections,
+                         ai_report_token=ai_report_token,
                          datetime=datetime)
@@ -0,0 +1,150 @@
+"""
+Backfill (or regenerate) Assessment.ai_insights using batched AI calls.
+
+Usage:
+    python -m scripts.backfill_assessment_insights [--batch-size 8] [--concurrency 4]
+        [--calls-per-minute 60] [--all] [--limit N] [--dry-run]
+
+By default only assessments without insights are processed; --all regenerates
+every row (e.g. after a prompt change). Batches are read lazily and run
+concurrently on worker threads (at most 2x --concurrency queued) while this
+thread writes results. A shared rate budget caps how many model calls per
+minute the run may start, per-item retries included. Items that fail even on
+their individual retry are left NULL so a later run picks them up.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Import the app module to access Flask app context and models
+import importlib
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+app_mod = importlib.import_module('app')
+from extensions import db
+from models import Assessment
+import ai.service as ai_service
+
+
+class RateBudget:
+    """Token bucket shared by the worker threads: at most `per_minute` calls start per minute."""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+def count_pending(regenerate_all, limit):
+    query = Assessment.query
+    if not regenerate_all:
+        query = query.filter(Assessment.ai_insights.is_(None))
+    total = query.count()
+    return total if limit is None else min(total, limit)
+
+
+def iter_batches(regenerate_all, batch_size, limit):
+    """Yield lists of assessment dicts in id order, reading one batch at a time (keyset pagination)."""
+    last_id = 0
+    seen = 0
+    while limit is None or seen < limit:
+        query = Assessment.query.filter(Assessment.id > last_id)
+        if not regenerate_all:
+            query = query.filter(Assessment.ai_insights.is_(None))
+        size = batch_size if limit is None else min(batch_size, limit - seen)
+        rows = query.order_by(Assessment.id).limit(size).all()
+        if not rows:
+            return
+        last_id = rows[-1].id
+        seen += len(rows)
+        yield [{
+            'id': row.id,
+            'assessment_type': row.assessment_type,
+            'score': row.score,
+            'responses': row.responses or [],
+        } for row in rows]
+
+
+def run_batch(batch, budget):
+    return ai_service.generate_assessment_insights_batch(batch, before_call=budget.acquire)
+
+
+def save_results(results):
+    written = 0
+    for assessment_id, insights in results.items():
+        if insights is None:
+            continue
+        assessment = db.session.get(Assessment, assessment_id)
+        if assessment is not None:
+            assessment.ai_insights = json.dumps(insights)
+            written += 1
+    db.session.commit()
+    return written
+
+
+def main(batch_size, concurrency, calls_per_minute, regenerate_all, limit, dry_run):
+    budget = RateBudget(calls_per_minute)
+    started = time.perf_counter()
+    processed = written = failed = 0
+
+    with app_mod.app.app_context():
+        total = count_pending(regenerate_all, limit)
+        print(f"{total} assessments in about {-(-total // batch_size)} batches "
+              f"(batch size {batch_size}, concurrency {concurrency}, {calls_per_minute or 'unlimited'} calls/min)")
+        if dry_run or not total:
+            return
+
+        batches = iter_batches(regenerate_all, batch_size, limit)
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            in_flight = set()
+            exhausted = False
+            while in_flight or not exhausted:
+                # Keep the workers busy without reading every batch up front
+                while not exhausted and len(in_flight) < concurrency * 2:
+                    batch = next(batches, None)
+                    if batch is None:
+                        exhausted = True
+                    else:
+                        in_flight.add(pool.submit(run_batch, batch, budget))
+                if not in_flight:
+                    break
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        results = future.result()
+                    except Exception as e:
+                        print(f"  batch failed: {e}")
+                        continue
+                    processed += len(results)
+                    failed += sum(1 for v in results.values() if v is None)
+                    written += save_results(results)
+                    elapsed = time.perf_counter() - started
+                    print(f"  {processed}/{total} done, {written} written, {failed} failed ({elapsed:.0f}s)")
+
+    elapsed = time.perf_counter() - started
+    print(f"Finished: {written} written, {failed} left for a later run, {elapsed:.1f}s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch-size', type=int, default=8, help='Assessments per model call')
+    parser.add_argument('--concurrency', type=int, default=4, help='Batches in flight at once')
+    parser.add_argument('--calls-per-minute', type=float, default=60, help='Rate budget for model calls (batches and retries); 0 = unlimited')
+    parser.add_argument('--all', action='store_true', help='Regenerate insights for every assessment, not only missing ones')
+    parser.add_argument('--limit', type=int, default=None, help='Process at most N assessments')
+    parser.add_argument('--dry-run', action='store_true', help='Only count what would be processed')
+    args = parser.parse_args()
+    main(args.batch_size, args.concurrency, args.calls_per_minute, args.all, args.limit, args.dry_run)
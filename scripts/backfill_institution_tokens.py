@@ -0,0 +1,54 @@
+"""
+Backfill User.institution_key and the institution_tokens rows used for caseload matching.
+
+Usage:
+    python -m scripts.backfill_institution_tokens [--batch-size 500] [--dry-run]
+
+Run once after the c7e2d4f81b95 migration, and again whenever users were written
+without User.set_institution (e.g. by add_demo_users.py or enable_demo.py, which insert with raw SQL).
+Users are read in id order one batch at a time (keyset pagination) and only
+rows whose key or tokens are out of date are rewritten, so re-running is cheap.
+"""
+import os
+import sys
+import time
+import argparse
+
+from sqlalchemy.orm import selectinload
+
+# Import the app module to access Flask app context and models
+import importlib
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+app_mod = importlib.import_module('app')
+from extensions import db
+from models import User
+
+
+def main(batch_size, dry_run):
+    started = time.perf_counter()
+    seen = changed = 0
+    last_id = 0
+    with app_mod.app.app_context():
+        while True:
+            users = User.query.options(selectinload(User.institution_token_rows)) \
+                .filter(User.id > last_id).order_by(User.id).limit(batch_size).all()
+            if not users:
+                break
+            last_id = users[-1].id
+            seen += len(users)
+            changed += sum(1 for user in users if user.set_institution(user.institution))
+            if dry_run:
+                db.session.rollback()
+            else:
+                db.session.commit()
+            print(f"  {seen} users checked, {changed} {'would be ' if dry_run else ''}updated")
+    print(f"Finished: {changed} of {seen} users {'need' if dry_run else 'got'} new institution tokens "
+          f"({time.perf_counter() - started:.1f}s)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--dry-run', action='store_true', help='Only count users whose tokens are out of date')
+    args = parser.parse_args()
+    main(args.batch_size, args.dry_run)
@@ -0,0 +1,117 @@
+"""
+Benchmark the LLM reply JSON extractor against the previous parsing code.
+
+Usage:
+    python -m scripts.bench_json_extract [--iterations 2000] [--corpus ai/fixtures/recorded_replies.jsonl]
+
+For every reply in the corpus it reports whether each parser recovered a usable
+value, then times the full corpus. "legacy_severity" is the fence-strip +
+greedy regex + brace/quote counting that ask_with_severity used; "legacy_strict"
+is the fence-strip + json.loads used by the generate_* helpers.
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from ai.json_extract import extract_json
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+DEFAULT_CORPUS = os.path.join(BASE_DIR, 'ai', 'fixtures', 'recorded_replies.jsonl')
+
+# Fields a caller needs for the reply to count as recovered
+REQUIRED = {
+    'severity': ['reply'],
+    'assessment_insights': ['summary'],
+    'progress_recommendations': ['insights'],
+    'digital_detox': ['analysis'],
+    'medication_adherence': ['adherence_score'],
+    'goal_suggestions': [],
+}
+
+
+def legacy_severity(raw):
+    clean_raw = raw.strip().replace('```json', '').replace('```', '')
+    m = re.search(r'\{[\s\S]*\}', clean_raw)
+    json_str = m.group(0) if m else clean_raw.strip()
+    try:
+        return json.loads(json_str)
+    except json.JSONDecodeError:
+        if json_str.count('{') > json_str.count('}'):
+            json_str += '}'
+        if json_str.count('"') % 2 != 0:
+            json_str += '"'
+        try:
+            return json.loads(json_str)
+        except Exception:
+            return None
+
+
+def legacy_strict(raw):
+    try:
+        return json.loads(raw.strip().replace('```json', '').replace('```', ''))
+    except json.JSONDecodeError:
+        return None
+
+
+def new_extractor(raw, family):
+    return extract_json(raw, expect='array' if family == 'goal_suggestions' else 'object')
+
+
+def usable(value, family):
+    if family == 'goal_suggestions':
+        return isinstance(value, list) and len(value) > 0
+    return isinstance(value, dict) and all(key in value for key in REQUIRED.get(family, []))
+
+
+def load_corpus(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main(corpus_path, iterations):
+    corpus = load_corpus(corpus_path)
+    parsers = {
+        'legacy_severity': lambda row: legacy_severity(row['text']),
+        'legacy_strict': lambda row: legacy_strict(row['text']),
+        'extractor': lambda row: new_extractor(row['text'], row['family']),
+    }
+
+    print(f"{'family':<26}{'case':<28}" + ''.join(f"{name:>17}" for name in parsers))
+    recovered = {name: 0 for name in parsers}
+    for row in corpus:
+        marks = []
+        for name, parse in parsers.items():
+            ok = usable(parse(row), row['family'])
+            recovered[name] += ok
+            marks.append('ok' if ok else '-')
+        print(f"{row['family']:<26}{row['case']:<28}" + ''.join(f"{m:>17}" for m in marks))
+
+    print(f"\nRecovered out of {len(corpus)} replies:")
+    for name, count in recovered.items():
+        print(f"  {name:<17}{count:>4}")
+
+    well_formed = [row for row in corpus if usable(legacy_strict(row['text']), row['family'])]
+    subsets = [('all replies', corpus), ('well-formed only', well_formed)]
+    for label, rows in subsets:
+        if not rows:
+            continue
+        print(f"\nTiming, {label} ({len(rows)} replies x {iterations} passes):")
+        for name, parse in parsers.items():
+            start = time.perf_counter()
+            for _ in range(iterations):
+                for row in rows:
+                    parse(row)
+            elapsed = time.perf_counter() - start
+            print(f"  {name:<17}{elapsed * 1e6 / (iterations * len(rows)):>8.1f} us/reply")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS)
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+    main(args.corpus, args.iterations)
@@ -0,0 +1,120 @@
+"""
+Measure event-loop lag while CPU-bound requests are in flight, inline vs offloaded.
+
+Usage:
+    python -m scripts.bench_offload [--requests 8] [--task password|burn] [--seconds 0.3]
+
+Each mode runs in a fresh eventlet-patched process, like the gunicorn eventlet
+worker. `--requests` green threads each run one CPU-bound task: a werkzeug
+password hash (the signup/login cost) or `--seconds` of pure-Python spinning.
+Meanwhile a heartbeat green thread records how late each of its 10 ms ticks
+wakes up. The modes are:
+
+  - inline:  the task runs on the hub, as before utils.offload
+  - thread:  OFFLOAD_MODE=auto, eventlet's tpool (the default under eventlet)
+  - process: OFFLOAD_MODE=process, the offload process pool
+
+Prints p95/max lag and wall time per mode. Each run is killed after
+SINGLE_RUN_TIMEOUT_SECONDS, so a pool that keeps its process alive fails the
+run instead of hanging the benchmark. Exits 1 if a run fails or if the default
+(thread) run's max lag exceeds OFFLOAD_LOOP_TARGET_MS.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+MODES = ('inline', 'thread', 'process')
+# --single mode -> OFFLOAD_MODE
+OFFLOAD_MODES = {'inline': 'inline', 'thread': 'auto', 'process': 'process'}
+SINGLE_RUN_TIMEOUT_SECONDS = 120
+
+
+def run_single(mode, requests, task, seconds):
+    import eventlet
+    eventlet.monkey_patch()
+    os.environ['OFFLOAD_MODE'] = OFFLOAD_MODES[mode]
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+    from utils import cpu_tasks
+    from utils.offload import offload, offload_status, offload_pool
+
+    fn, args = (cpu_tasks.password_hash, ('correct horse battery staple',)) if task == 'password' \
+        else (cpu_tasks.burn_cpu, (seconds,))
+    # Start the pool (process start-up is a one-off cost, not request latency)
+    offload('warm_up', cpu_tasks.burn_cpu, 0.01)
+
+    lags = []
+    running = True
+
+    def heartbeat():
+        while running:
+            ticked = time.perf_counter()
+            eventlet.sleep(0.01)
+            lags.append((time.perf_counter() - ticked - 0.01) * 1000)
+
+    beat = eventlet.spawn(heartbeat)
+    eventlet.sleep(0.05)
+    started = time.perf_counter()
+    pool = eventlet.GreenPool()
+    for _ in range(requests):
+        pool.spawn(offload, task, fn, *args)
+    pool.waitall()
+    wall = time.perf_counter() - started
+    running = False
+    beat.wait()
+
+    backend = offload_status()['backend']
+    offload_pool.shutdown()
+
+    lags.sort()
+    print(json.dumps({
+        'mode': mode,
+        'backend': backend,
+        'wall_seconds': round(wall, 3),
+        'lag_p95_ms': round(lags[int(len(lags) * 0.95)], 1) if lags else None,
+        'lag_max_ms': round(lags[-1], 1) if lags else None,
+    }), flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Event-loop lag with inline vs offloaded CPU work")
+    parser.add_argument('--requests', type=int, default=8, help='concurrent CPU-bound requests')
+    parser.add_argument('--task', choices=('password', 'burn'), default='password')
+    parser.add_argument('--seconds', type=float, default=0.3, help='CPU time per burn task')
+    parser.add_argument('--single', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        run_single(args.single, args.requests, args.task, args.seconds)
+        return
+
+    from utils.offload import OFFLOAD_LOOP_TARGET_MS
+    results = {}
+    for mode in MODES:
+        try:
+            out = subprocess.run(
+                [sys.executable, '-m', 'scripts.bench_offload', '--single', mode, '--requests', str(args.requests),
+                 '--task', args.task, '--seconds', str(args.seconds)],
+                capture_output=True, text=True, timeout=SINGLE_RUN_TIMEOUT_SECONDS,
+                cwd=os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+        except subprocess.TimeoutExpired:
+            print(f"{mode}: did not finish within {SINGLE_RUN_TIMEOUT_SECONDS}s")
+            sys.exit(1)
+        if out.returncode != 0:
+            print(f"{mode}: failed\n{out.stderr}")
+            sys.exit(1)
+        results[mode] = json.loads(out.stdout.strip().splitlines()[-1])
+        r = results[mode]
+        print(f"{mode:8} backend={r['backend']:8} wall={r['wall_seconds']:.2f}s "
+              f"lag p95={r['lag_p95_ms']}ms max={r['lag_max_ms']}ms")
+
+    if (results['thread']['lag_max_ms'] or 0) > OFFLOAD_LOOP_TARGET_MS:
+        print(f"FAIL: offloaded run exceeded the {OFFLOAD_LOOP_TARGET_MS:.0f}ms event-loop target")
+        sys.exit(1)
+    print(f"OK: offloaded run stayed within the {OFFLOAD_LOOP_TARGET_MS:.0f}ms event-loop target")
+
+
+if __name__ == '__main__':
+    main()
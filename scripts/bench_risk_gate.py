@@ -0,0 +1,137 @@
+"""
+Replay labelled chat messages through ai.service.reply_with_severity and compare
+how the AI severity check is gated.
+
+Usage:
+    python -m scripts.bench_risk_gate [--corpus ai/fixtures/chat_replay.jsonl]
+        [--concurrency 10] [--passes 1] [--latency lognormal:900,0.35]
+
+Runs against the stub backend (AI_BACKEND=stub), three ways:
+  always      every message gets the AI severity check (previous behaviour)
+  heuristic   only messages at or above RISK_LLM_GATE get it (no classifier)
+  classifier  below the gate, the local risk classifier decides
+
+and prints p50/p95 reply latency, severity-check calls, total backend calls and
+the share of risk-labelled messages that got the severity check. Each message
+is its own conversation, so the gate depends on the message alone. Messages
+the classifier rates confidently low risk get the plain chat reply without the
+severity check; --passes > 1 shows the response cache absorbing repeats. With
+CHAT_FAST_PATH=local they get a local reply and no backend call instead.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Must be set before ai.* is imported
+os.environ['AI_BACKEND'] = 'stub'
+os.environ.setdefault('AI_CACHE_PATH', os.path.join(tempfile.mkdtemp(prefix='risk-gate-'), 'ai_cache.db'))
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import ai.service as ai_service
+import risk_classifier
+from ai.cache import response_cache
+from ai.backend import set_provider
+from ai.stub_impl import StubProvider
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+DEFAULT_CORPUS = os.path.join(BASE_DIR, 'ai', 'fixtures', 'chat_replay.jsonl')
+MODES = ('always', 'heuristic', 'classifier')
+
+
+class CountingProvider:
+    """Wraps a provider and counts the calls that reach it."""
+
+    def __init__(self, provider):
+        self._provider = provider
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def __getattr__(self, name):
+        return getattr(self._provider, name)
+
+    def ask(self, *args, **kwargs):
+        with self._lock:
+            self.calls += 1
+        return self._provider.ask(*args, **kwargs)
+
+
+def load_corpus(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def run_mode(mode, rows, passes, concurrency, provider, classifier):
+    response_cache.clear()
+    provider.calls = 0
+    # Swap the loaded classifier in or out without touching the model file
+    risk_classifier._classifier = classifier if mode == 'classifier' else None
+    risk_classifier._loaded = True
+    results = []
+
+    def one(index_row):
+        index, row = index_row
+        start = time.perf_counter()
+        # 'always' replays the anonymous path, which checks every message when there is no classifier
+        user_id = None if mode == 'always' else f"replay-{mode}-{index}"
+        resp = ai_service.reply_with_severity(row['text'], user_id=user_id)
+        results.append((row['label'], resp['ai_checked'], (time.perf_counter() - start) * 1000))
+
+    work = list(enumerate(rows * passes))
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, work))
+
+    latencies = [ms for _, _, ms in results]
+    risk = [checked for label, checked, _ in results if label == 1]
+    return {
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'severity_calls': sum(1 for _, checked, _ in results if checked),
+        'backend_calls': provider.calls,
+        'recall': sum(risk) / len(risk) if risk else 1.0,
+    }
+
+
+def main(corpus, concurrency, passes, latency, seed):
+    if not risk_classifier.NUMPY_AVAILABLE:
+        sys.exit("NumPy is required for the classifier run")
+    classifier = risk_classifier.get_classifier()
+    if classifier is None:
+        sys.exit(f"No risk classifier at {risk_classifier.RISK_CLASSIFIER_PATH}; run scripts.train_risk_classifier first")
+    provider = CountingProvider(StubProvider(latency=latency, seed=seed))
+    set_provider(provider)
+
+    rows = load_corpus(corpus)
+    risk_count = sum(1 for r in rows if r['label'] == 1)
+    print(f"{len(rows)} messages ({risk_count} risk) x {passes} pass(es), concurrency={concurrency}, "
+          f"latency={latency or 'per-family'}, low-risk threshold={classifier.low_threshold:.3f}")
+    print(f"{'mode':<12}{'p50 ms':>9}{'p95 ms':>9}{'severity':>10}{'backend':>9}{'recall':>8}")
+    baseline = None
+    for mode in MODES:
+        r = run_mode(mode, rows, passes, concurrency, provider, classifier)
+        baseline = baseline or r
+        print(f"{mode:<12}{r['p50']:>9.0f}{r['p95']:>9.0f}{r['severity_calls']:>10}{r['backend_calls']:>9}{r['recall']:>8.2f}")
+    print(f"classifier vs always: severity checks -{1 - r['severity_calls'] / max(1, baseline['severity_calls']):.0%}, "
+          f"backend calls -{1 - r['backend_calls'] / max(1, baseline['backend_calls']):.0%}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--passes', type=int, default=1, help='Replay the corpus this many times')
+    parser.add_argument('--latency', default='', help='Override stub latency, e.g. fixed:500 or lognormal:900,0.35')
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+    main(args.corpus, args.concurrency, args.passes, args.latency, args.seed)
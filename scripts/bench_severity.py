@@ -0,0 +1,109 @@
+"""
+Benchmark severity.heuristic_severity (and the span-reporting
+heuristic_severity_detail) against the previous keyword loops.
+
+Usage:
+    python -m scripts.bench_severity [--messages 20000] [--seed 7] [--iterations 3]
+
+The corpus is generated from the keyword lists plus filler text: chat-length
+messages, journal-length entries, and edge cases (overlapping keywords,
+keywords inside longer words, mixed case, non-ASCII). tests/test_severity.py
+uses the same corpus for the golden-score and parity checks.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from severity import heuristic_severity, heuristic_severity_detail, KEYWORD_GROUPS
+
+FILLER = (
+    "today work sleep tired friends family class exam coffee walk music rain weekend "
+    "dinner mother father school meeting deadline therapy session talked felt better "
+    "worse anxious calm breathing exercise journal morning night phone messages"
+).split()
+
+
+def legacy_heuristic_severity(text: str) -> int:
+    """The keyword loops heuristic_severity used before the compiled matcher (plain substring tests)."""
+    if not text:
+        return 0
+    t = text.lower()
+    score = 0
+    for kw in ['suicide','kill myself','end my life','want to die','cant go on',
+               'cut myself','self harm','hurt myself','die tonight',
+               'no hope','thinking of harming','wish i was dead','planning to']:
+        if kw in t:
+            score += 6
+    for kw in ['plan', 'intent', 'means', 'have a gun', 'poison', 'access to']:
+        if kw in t:
+            score += 2
+    if 'hopeless' in t:
+        score += 3
+    for tok in ['worthless','alone','panic','panic attack','overwhelmed','cant cope','cannot cope']:
+        if tok in t:
+            score += 1
+    return min(10, score)
+
+
+def make_text(rng, words, keyword_rate):
+    keywords = [kw for _, _, group in KEYWORD_GROUPS for kw in group]
+    out = []
+    for _ in range(words):
+        if rng.random() < keyword_rate:
+            kw = rng.choice(keywords)
+            style = rng.random()
+            if style < 0.2:
+                kw = kw.upper()
+            elif style < 0.3:
+                kw = kw + rng.choice(['ing', 'ed', 's', 'ation'])  # keyword inside a longer word
+            elif style < 0.35:
+                kw = kw[:-1]  # near miss
+            out.append(kw)
+        else:
+            out.append(rng.choice(FILLER))
+    text = ' '.join(out)
+    if rng.random() < 0.05:
+        text += ' ' + rng.choice(['İ', 'ß', 'é', '—', '😔'])
+    return text
+
+
+def build_corpus(count, seed):
+    rng = random.Random(seed)
+    chats = [make_text(rng, rng.randint(3, 40), 0.08) for _ in range(count)]
+    journals = [make_text(rng, rng.randint(400, 1500), 0.01) for _ in range(max(1, count // 100))]
+    return chats, journals
+
+
+def timed(fn, texts, iterations):
+    best = float('inf')
+    for _ in range(iterations):
+        start = time.perf_counter()
+        for text in texts:
+            fn(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(messages, seed, iterations):
+    chats, journals = build_corpus(messages, seed)
+    impls = [('legacy', legacy_heuristic_severity), ('score', heuristic_severity),
+             ('detail (spans)', heuristic_severity_detail)]
+    for label, texts in [('chat messages', chats), ('journal entries', journals)]:
+        chars = sum(len(t) for t in texts)
+        print(f"\n{label}: {len(texts)} texts, avg {chars // len(texts)} chars (best of {iterations})")
+        for name, fn in impls:
+            elapsed = timed(fn, texts, iterations)
+            print(f"  {name:<16}{elapsed * 1e6 / len(texts):>9.1f} us/text {len(texts) / elapsed:>12,.0f} texts/s "
+                  f"{chars / elapsed / 1e6:>8.1f} MB/s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=20000, help='Chat-length messages to generate (journals = 1%%)')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--iterations', type=int, default=3)
+    args = parser.parse_args()
+    main(args.messages, args.seed, args.iterations)
@@ -0,0 +1,127 @@
+"""
+Show that a slow PostgreSQL query no longer stalls chat handling under eventlet.
+
+Usage:
+    DATABASE_URL=postgresql://... python -m scripts.check_green_db [--sleep 2]
+
+Runs the same scenario twice in fresh eventlet-patched processes: once with the
+psycopg2 wait callback (utils.green_db, the default) and once with GREEN_DB=off.
+A green thread runs `SELECT pg_sleep(N)`, standing in for a slow analytics
+query. Meanwhile a SocketIO test client sends a `chat_message` (stub AI
+backend) and a heartbeat green thread records the longest gap between its
+10 ms ticks. With the callback the chat reply arrives after milliseconds and
+the heartbeat never stalls. Without it both wait for the query. Exits 1 if
+the green run stalls for more than half the query time. Needs a reachable
+PostgreSQL DATABASE_URL; use a scratch database, since importing the app
+creates its tables when they are missing.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+
+def run_single(sleep_seconds):
+    import eventlet
+    eventlet.monkey_patch()
+    import tempfile
+    workdir = tempfile.mkdtemp(prefix='green-db-')
+    os.environ['AI_BACKEND'] = 'stub'
+    os.environ['AI_STUB_LATENCY'] = 'none'
+    os.environ.setdefault('AI_CACHE_PATH', os.path.join(workdir, 'ai_cache.db'))
+    os.environ.setdefault('JOB_QUEUE_PATH', os.path.join(workdir, 'jobs.db'))
+
+    # Import the app module to access Flask app context and models
+    import importlib
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+    app_mod = importlib.import_module('app')
+    from extensions import db
+    from utils.green_db import green_db_status
+
+    app = app_mod.app
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with app.app_context():
+        engine = db.engine
+    # Connections opened at import (before this run) may predate the callback
+    engine.dispose()
+
+    flask_client = app.test_client()
+    with flask_client.session_transaction() as sess:
+        sess['user_email'] = 'green-db-check@example.com'
+        sess['user_name'] = 'Check'
+    chat = app_mod.socketio.test_client(app, flask_test_client=flask_client)
+    chat.get_received()
+
+    max_gap = 0.0
+    running = True
+
+    def heartbeat():
+        nonlocal max_gap
+        while running:
+            tick = time.perf_counter()
+            eventlet.sleep(0.01)
+            max_gap = max(max_gap, time.perf_counter() - tick - 0.01)
+
+    def slow_query():
+        with engine.connect() as conn:
+            conn.exec_driver_sql(f"SELECT pg_sleep({float(sleep_seconds)})")
+
+    beat = eventlet.spawn(heartbeat)
+    started = time.perf_counter()
+    query = eventlet.spawn(slow_query)
+    eventlet.sleep(0.05)  # let the query reach the server
+    chat.emit('chat_message', {'message': 'I had a rough day but talking helps'})
+    replies = [r for r in chat.get_received() if r['name'] == 'chat_response']
+    chat_seconds = time.perf_counter() - started
+    query.wait()
+    query_seconds = time.perf_counter() - started
+    running = False
+    beat.wait()
+    print(json.dumps({
+        'green_db': green_db_status(),
+        'chat_replied': bool(replies),
+        'chat_seconds': round(chat_seconds, 3),
+        'query_seconds': round(query_seconds, 3),
+        'max_stall_seconds': round(max_gap, 3),
+    }))
+
+
+def main(sleep_seconds):
+    url = os.environ.get('DATABASE_URL', '')
+    if not url.startswith(('postgres://', 'postgresql')):
+        print("DATABASE_URL must point at PostgreSQL for this check")
+        sys.exit(2)
+    results = {}
+    for label, green in (('green', 'auto'), ('blocking', 'off')):
+        env = dict(os.environ, GREEN_DB=green)
+        proc = subprocess.run([sys.executable, '-m', 'scripts.check_green_db', '--single', '--sleep', str(sleep_seconds)],
+                              env=env, capture_output=True, text=True)
+        lines = [line for line in proc.stdout.splitlines() if line.startswith('{')]
+        if proc.returncode != 0 or not lines:
+            print(f"{label} run failed:\n{proc.stderr[-2000:]}")
+            sys.exit(1)
+        results[label] = json.loads(lines[-1])
+
+    print(f"slow query: pg_sleep({sleep_seconds})")
+    print(f"{'mode':<10}{'wait callback':>15}{'chat reply (s)':>16}{'max stall (s)':>15}{'query (s)':>11}")
+    for label, r in results.items():
+        print(f"{label:<10}{str(r['green_db']['psycopg2_wait_callback']):>15}{r['chat_seconds']:>16}"
+              f"{r['max_stall_seconds']:>15}{r['query_seconds']:>11}")
+    green = results['green']
+    if not green['chat_replied'] or green['chat_seconds'] > sleep_seconds / 2 or green['max_stall_seconds'] > sleep_seconds / 2:
+        print("FAIL: chat handling stalled behind the slow query")
+        sys.exit(1)
+    print("ok: chat_message is answered while the slow query runs")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sleep', type=float, default=2.0, help='Seconds the slow query sleeps on the server')
+    parser.add_argument('--single', action='store_true', help='Run one scenario in this process (used internally)')
+    args = parser.parse_args()
+    if args.single:
+        run_single(args.sleep)
+    else:
+        main(args.sleep)
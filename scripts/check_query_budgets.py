@@ -0,0 +1,162 @@
+"""
+Enforce the per-route query budgets (utils.query_stats.query_budget) under the test client.
+
+Usage:
+    python -m scripts.check_query_budgets [--small 3] [--large 30]
+
+Builds a throwaway SQLite database twice, once with `--small` and once with
+`--large` patients (each with detox logs, clinical notes, appointments,
+assessments, goals and medication logs, plus blog comments and likes), and
+requests each budgeted page as the matching role. A page fails if it breaks its
+declared budget (QueryBudgetExceeded: too many statements, or one statement
+shape repeated past its limit) or if its statement count grows with the data.
+Exits 1 on any failure, so it can run in CI.
+"""
+import os
+import re
+import sys
+import argparse
+import tempfile
+from datetime import date, datetime, timedelta
+
+# Must be set before the app is imported
+_workdir = tempfile.mkdtemp(prefix='query-budgets-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_workdir, 'budgets.db')}"
+os.environ['QUERY_BUDGET_ENFORCE'] = '1'
+os.environ['AI_BACKEND'] = 'stub'
+os.environ.setdefault('AI_STUB_LATENCY', 'none')
+os.environ.setdefault('AI_CACHE_PATH', os.path.join(_workdir, 'ai_cache.db'))
+os.environ.setdefault('JOB_QUEUE_PATH', os.path.join(_workdir, 'jobs.db'))
+
+# Import the app module to access Flask app context and models
+import importlib
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+app_mod = importlib.import_module('app')
+from extensions import db
+from models import (User, DigitalDetoxLog, ClinicalNote, Appointment, Assessment, Goal, Medication,
+                    MedicationLog, RPMData, BlogPost, BlogComment, BlogLike)
+from utils.query_stats import QueryBudgetExceeded
+
+INSTITUTION = 'Sample University'
+_SERVER_TIMING_COUNT = re.compile(r'db;dur=[\d.]+;desc="(\d+) queries"')
+
+
+def seed(patients):
+    """Fresh schema with one provider, `patients` patients and one blog post; returns ids to request."""
+    db.drop_all()
+    db.create_all()
+    provider = User(email='provider@example.com', name='Provider', role='provider')
+    provider.set_institution(INSTITUTION)
+    provider.set_password('check-query-budgets')
+    db.session.add(provider)
+    db.session.flush()
+    today = date.today()
+    patient_ids = []
+    for i in range(patients):
+        patient = User(email=f'patient{i}@example.com', name=f'Patient {i}', role='patient',
+                       last_assessment_at=datetime.utcnow() - timedelta(days=1))
+        patient.set_institution(INSTITUTION)
+        patient.set_password('check-query-budgets')
+        db.session.add(patient)
+        db.session.flush()
+        patient_ids.append(patient.id)
+        medication = Medication(user_id=patient.id, name='Sertraline', dosage='50mg')
+        db.session.add(medication)
+        db.session.flush()
+        for d in range(3):
+            day = today - timedelta(days=d * 3)
+            db.session.add_all([
+                DigitalDetoxLog(user_id=patient.id, date=day, screen_time_hours=5 + d),
+                ClinicalNote(provider_id=provider.id, patient_id=patient.id,
+                             session_date=datetime.combine(day, datetime.min.time())),
+                Appointment(user_id=patient.id, provider_id=provider.id, date=day - timedelta(days=1),
+                            time='10:00', appointment_type='therapy', status='booked'),
+                Assessment(user_id=patient.id, assessment_type='GAD-7', score=6 + d,
+                           created_at=datetime.utcnow() - timedelta(days=d)),
+                Assessment(user_id=patient.id, assessment_type='PHQ-9', score=8 + d,
+                           created_at=datetime.utcnow() - timedelta(days=d)),
+                RPMData(user_id=patient.id, date=day, mood_score=6),
+                Goal(user_id=patient.id, title=f'Goal {d}', category='mental_health', start_date=day),
+                MedicationLog(user_id=patient.id, medication_id=medication.id,
+                              taken_at=datetime.utcnow() - timedelta(days=d)),
+            ])
+    post = BlogPost(title='Sleep and mood', content='...', author_id=provider.id)
+    db.session.add(post)
+    db.session.flush()
+    for patient_id in patient_ids:
+        db.session.add(BlogComment(user_id=patient_id, post_id=post.id, content='Thanks for this'))
+        db.session.add(BlogLike(user_id=patient_id, post_id=post.id))
+    db.session.commit()
+    return provider.id, patient_ids[0], post.id
+
+
+def login(client, user_id, role):
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+        sess['user_email'] = f'{role}@example.com'
+        sess['user_name'] = role.title()
+        sess['user_role'] = role
+        sess['user_institution'] = INSTITUTION
+
+
+def pages(provider_id, patient_id, post_id):
+    """(label, role, user to log in as, url)."""
+    return [
+        ('provider_dashboard', 'provider', provider_id, '/provider/dashboard'),
+        ('wellness_report', 'provider', provider_id, f'/provider/wellness-report/{patient_id}'),
+        ('progress', 'patient', patient_id, '/patient/progress'),
+        ('blog_detail', None, None, f'/blog/{post_id}'),
+    ]
+
+
+def measure(app, patients):
+    """{label: statement count or error message} for every budgeted page."""
+    results = {}
+    with app.app_context():
+        ids = seed(patients)
+    for label, role, user_id, url in pages(*ids):
+        client = app.test_client()
+        if role:
+            login(client, user_id, role)
+        try:
+            response = client.get(url)
+        except QueryBudgetExceeded as e:
+            results[label] = str(e)
+            continue
+        except Exception as e:
+            results[label] = f"request failed: {e!r}"
+            continue
+        match = _SERVER_TIMING_COUNT.search(', '.join(response.headers.getlist('Server-Timing')))
+        if response.status_code != 200 or not match:
+            results[label] = f"status {response.status_code}"
+            continue
+        results[label] = int(match.group(1))
+    return results
+
+
+def main(small, large):
+    app = app_mod.app
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    small_counts = measure(app, small)
+    large_counts = measure(app, large)
+
+    failures = 0
+    print(f"{'page':<22}{f'{small} patients':>14}{f'{large} patients':>14}")
+    for label in small_counts:
+        a, b = small_counts[label], large_counts[label]
+        problem = next((r for r in (a, b) if isinstance(r, str)), None)
+        if problem is None and b > a:
+            problem = "statement count grows with the data (likely N+1)"
+        failures += problem is not None
+        print(f"{label:<22}{a if isinstance(a, int) else '-':>14}{b if isinstance(b, int) else '-':>14}"
+              + (f"  FAIL: {problem}" if problem else ''))
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--small', type=int, default=3, help='Patients in the small data set')
+    parser.add_argument('--large', type=int, default=30, help='Patients in the large data set')
+    args = parser.parse_args()
+    main(args.small, args.large)
@@ -0,0 +1,196 @@
+"""
+Query-plan regression check for the hot query shapes issued by the routes.
+
+Usage:
+    python -m scripts.check_query_plans [--database-url URL ...] [--verbose]
+
+Every shape in SHAPES mirrors a query in the routes (the source is noted next to
+it) and is EXPLAINed against each database:
+
+  - a fresh in-memory SQLite schema built from models.py (always), which checks
+    the indexes declared on the models;
+  - each --database-url, and DATABASE_URL when it points at PostgreSQL, which
+    checks a migrated database (run `flask db upgrade` first).
+
+A shape fails when one of its hot tables is read with a full scan (SQLite
+"SCAN <table>", PostgreSQL "Seq Scan" with enable_seqscan off), or when a shape
+marked `ordered` needs a separate sort on SQLite although an index could
+return the rows in order. Any failure is printed and the script exits 1, so it
+can run in CI after schema or query changes.
+"""
+import os
+import re
+import sys
+import argparse
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import create_engine, select, func, or_, and_
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from extensions import db
+from models import (RPMData, Gamification, ClinicalNote, Appointment, MedicationLog, Notification,
+                    BlogComment, BlogLike)
+
+_SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)')
+
+
+def _shapes():
+    """(name, hot tables, statement, ordered) for each hot query."""
+    today = date.today()
+    today_start = datetime.combine(today, datetime.min.time())
+    today_end = datetime.combine(today, datetime.max.time())
+    return [
+        # routes/patient.py dashboard, routes/provider.py appointment list
+        ('rpm_latest', {'rpm_data'},
+         select(RPMData).where(RPMData.user_id == 1).order_by(RPMData.date.desc()).limit(1), True),
+        # routes/patient.py daily check-in
+        ('rpm_today', {'rpm_data'},
+         select(RPMData).where(RPMData.user_id == 1, RPMData.date == today).limit(1), False),
+        # routes/provider.py patient report
+        ('rpm_history', {'rpm_data'},
+         select(RPMData).where(RPMData.user_id == 1).order_by(RPMData.date.asc()).limit(90), True),
+        # gamification_engine.award_points, dashboards
+        ('gamification_user', {'gamification'},
+         select(Gamification).where(Gamification.user_id == 1).limit(1), False),
+        # routes/provider.py patient report
+        ('clinical_notes_recent', {'clinical_notes'},
+         select(ClinicalNote).where(ClinicalNote.patient_id == 1)
+         .order_by(ClinicalNote.session_date.desc()).limit(10), True),
+        # routes/provider.py dashboard
+        ('appointments_overdue', {'appointments'},
+         select(Appointment).where(Appointment.provider_id == 1, Appointment.status == 'booked',
+                                   Appointment.date < today)
+         .order_by(Appointment.date.desc()).limit(5), True),
+        # routes/provider.py appointment list (status filter applied)
+        ('appointments_provider', {'appointments'},
+         select(Appointment).where(
+             or_(Appointment.provider_id == 1,
+                 and_(Appointment.provider_id.is_(None), Appointment.user_id.in_([2, 3, 4]))),
+             Appointment.status == 'pending')
+         .order_by(Appointment.date.asc(), Appointment.time.asc()), False),
+        # security_fixes.py slot conflict check
+        ('appointments_slot_conflict', {'appointments'},
+         select(Appointment).where(Appointment.provider_id == 1, Appointment.date == today,
+                                   Appointment.time == '10:00',
+                                   Appointment.status.in_(['pending', 'accepted', 'booked'])).limit(1), False),
+        # routes/patient.py dashboard
+        ('appointments_patient', {'appointments'},
+         select(Appointment).where(Appointment.user_id == 1)
+         .order_by(Appointment.date.asc(), Appointment.time.asc()), True),
+        # models.py institutional analytics
+        ('appointments_institution', {'appointments'},
+         select(Appointment).where(Appointment.provider_id.in_([1, 2, 3]),
+                                   Appointment.date >= today - timedelta(days=30)), False),
+        # routes/provider.py patient report
+        ('medication_logs_recent', {'medication_logs'},
+         select(MedicationLog).where(MedicationLog.user_id == 1)
+         .order_by(MedicationLog.taken_at.desc()).limit(30), True),
+        # routes/patient.py medication page
+        ('medication_logs_today', {'medication_logs'},
+         select(MedicationLog).where(MedicationLog.user_id == 1, MedicationLog.taken_at >= today_start,
+                                     MedicationLog.taken_at <= today_end), False),
+        # routes/patient.py log_medication
+        ('medication_logged_today', {'medication_logs'},
+         select(MedicationLog).where(MedicationLog.medication_id == 1, MedicationLog.user_id == 1,
+                                     MedicationLog.taken_at >= today_start).limit(1), False),
+        # routes/chat.py chat history
+        ('notifications_history', {'notifications'},
+         select(Notification).where(Notification.recipient_id == 1)
+         .order_by(Notification.created_at.asc()), True),
+        # triage.triage_queue
+        ('notifications_triage_queue', {'notifications'},
+         select(Notification).where(Notification.recipient_id == 1, Notification.type == 'message',
+                                    Notification.read.isnot(True))
+         .order_by(Notification.severity.desc().nulls_last(), Notification.created_at.asc()).limit(50), False),
+        # routes/blog.py post page
+        ('blog_comments_post', {'blog_comments'},
+         select(BlogComment).where(BlogComment.post_id == 1).order_by(BlogComment.created_at.asc()), True),
+        ('blog_comments_count', {'blog_comments'},
+         select(func.count()).select_from(BlogComment).where(BlogComment.post_id == 1), False),
+        ('blog_like_user', {'blog_likes'},
+         select(BlogLike).where(BlogLike.user_id == 1, BlogLike.post_id == 1).limit(1), False),
+        ('blog_likes_count', {'blog_likes'},
+         select(func.count()).select_from(BlogLike).where(BlogLike.post_id == 1), False),
+    ]
+
+
+def _compile(conn, statement):
+    compiled = statement.compile(dialect=conn.dialect, compile_kwargs={'render_postcompile': True})
+    if conn.dialect.positional:
+        return str(compiled), tuple(compiled.params[name] for name in compiled.positiontup)
+    return str(compiled), compiled.params
+
+
+def explain_sqlite(conn, statement):
+    """(plan lines, fully scanned tables, needs a separate sort)."""
+    sql, params = _compile(conn, statement)
+    lines = [row[3] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}", params)]
+    scanned = {m.group(1) for m in (_SQLITE_SCAN.match(line) for line in lines) if m}
+    sorted_separately = any(line.startswith('USE TEMP B-TREE FOR ORDER BY') for line in lines)
+    return lines, scanned, sorted_separately
+
+
+def _plan_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from _plan_nodes(child)
+
+
+def explain_postgres(conn, statement):
+    sql, params = _compile(conn, statement)
+    plan = conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {sql}", params).scalar()[0]['Plan']
+    nodes = list(_plan_nodes(plan))
+    lines = [f"{n['Node Type']} {n.get('Relation Name', '')} {n.get('Index Name', '')}".strip() for n in nodes]
+    scanned = {n['Relation Name'] for n in nodes if n['Node Type'] == 'Seq Scan'}
+    return lines, scanned, False
+
+
+def check(engine, label, verbose):
+    failures = 0
+    with engine.connect() as conn:
+        if engine.dialect.name == 'postgresql':
+            # Small or empty tables make a sequential scan look cheapest; only report it when no index can serve
+            conn.exec_driver_sql("SET enable_seqscan = off")
+            explain = explain_postgres
+        elif engine.dialect.name == 'sqlite':
+            explain = explain_sqlite
+        else:
+            print(f"{label}: EXPLAIN is not supported for {engine.dialect.name}, skipped")
+            return 0
+        print(f"{label}:")
+        for name, hot_tables, statement, ordered in _shapes():
+            lines, scanned, sorted_separately = explain(conn, statement)
+            problems = [f"full scan of {t}" for t in sorted(scanned & hot_tables)]
+            if ordered and sorted_separately:
+                problems.append("sorted separately instead of read in index order")
+            failures += bool(problems)
+            print(f"  {'FAIL' if problems else 'ok':<5}{name}" + (f": {'; '.join(problems)}" if problems else ''))
+            if problems or verbose:
+                for line in lines:
+                    print(f"         {line}")
+    return failures
+
+
+def main(database_urls, verbose):
+    models_engine = create_engine('sqlite://')
+    db.metadata.create_all(models_engine)
+    failures = check(models_engine, 'models.py schema (SQLite)', verbose)
+    for url in database_urls:
+        failures += check(create_engine(url), url.split('@')[-1], verbose)
+    if failures:
+        print(f"{failures} query shape(s) without a usable index")
+        sys.exit(1)
+    print("All hot query shapes use an index")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database-url', action='append', default=[],
+                        help='Also check an existing (migrated) database; may be repeated')
+    parser.add_argument('--verbose', action='store_true', help='Print every plan, not only failing ones')
+    args = parser.parse_args()
+    urls = list(args.database_url)
+    env_url = os.environ.get('DATABASE_URL', '')
+    if env_url.startswith(('postgres://', 'postgresql')) and env_url not in urls:
+        urls.append(env_url.replace('postgres://', 'postgresql://', 1))
+    main(urls, args.verbose)
@@ -0,0 +1,98 @@
+"""
+Check read/write routing (utils.db_routing) against two local SQLite files.
+
+Usage:
+    python -m scripts.check_replica_routing
+
+Creates a primary database, copies it to a "replica" file, then writes one
+more user to the primary only, so the two differ. It checks that SELECTs go
+to the primary outside read_replica() scopes and to the replica inside them.
+Inside a scope, locking reads and reads after a write in the same transaction
+must stay on the primary. Once the replica file becomes unreadable, scoped
+reads must fall back to the primary. Exits 1 on any failure.
+"""
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+
+# Must be set before the app is imported
+_workdir = tempfile.mkdtemp(prefix='replica-routing-')
+PRIMARY_PATH = os.path.join(_workdir, 'primary.db')
+REPLICA_PATH = os.path.join(_workdir, 'replica.db')
+os.environ['DATABASE_URL'] = f"sqlite:///{PRIMARY_PATH}"
+os.environ['DATABASE_REPLICA_URL'] = f"sqlite:///{REPLICA_PATH}"
+os.environ['AI_BACKEND'] = 'stub'
+os.environ.setdefault('AI_CACHE_PATH', os.path.join(_workdir, 'ai_cache.db'))
+os.environ.setdefault('JOB_QUEUE_PATH', os.path.join(_workdir, 'jobs.db'))
+
+# Import the app module to access Flask app context and models
+import importlib
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+app_mod = importlib.import_module('app')
+from sqlalchemy import func
+from extensions import db
+from models import User
+from utils.db_routing import read_replica, replica_monitor, replica_status, REPLICA_BIND
+
+
+def add_user(email):
+    user = User(email=email, name=email.split('@')[0], role='patient')
+    user.set_password('check-replica-routing')
+    db.session.add(user)
+
+
+def user_count():
+    return db.session.query(func.count(User.id)).scalar()
+
+
+def main():
+    results = []
+
+    def expect(label, actual, expected):
+        results.append((label, actual == expected))
+        print(f"  {'ok' if actual == expected else 'FAIL':<5}{label}: {actual} users (expected {expected})")
+
+    with app_mod.app.app_context():
+        db.create_all()
+        add_user('shared@example.com')
+        db.session.commit()
+        # Snapshot the primary as the replica, then let the primary move ahead
+        with sqlite3.connect(PRIMARY_PATH) as source, sqlite3.connect(REPLICA_PATH) as target:
+            source.backup(target)
+        add_user('primary-only@example.com')
+        db.session.commit()
+        db.session.remove()
+
+        print("Routing:")
+        expect("unscoped read uses the primary", user_count(), 2)
+        db.session.remove()
+        with read_replica('check'):
+            expect("scoped read uses the replica", user_count(), 1)
+            expect("scoped locking read uses the primary", len(User.query.with_for_update().all()), 2)
+            add_user('pending@example.com')
+            db.session.flush()
+            expect("scoped read after a write uses the primary", user_count(), 3)
+            db.session.rollback()
+            expect("scoped read after rollback uses the replica again", user_count(), 1)
+        db.session.remove()
+
+        # Make the replica unreadable and drop pooled connections to it
+        replica = db.engines[REPLICA_BIND]
+        replica.dispose()
+        os.remove(REPLICA_PATH)
+        os.makedirs(REPLICA_PATH)
+        replica_monitor.check(replica, force=True)
+        with read_replica('check'):
+            expect("scoped read with the replica down uses the primary", user_count(), 2)
+        db.session.remove()
+
+        print(f"Replica status: {replica_status()}")
+    shutil.rmtree(_workdir, ignore_errors=True)
+    if not all(ok for _, ok in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
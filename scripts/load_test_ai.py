@@ -0,0 +1,145 @@
+"""
+Offline load test for the AI layer using the stub backend.
+
+Usage:
+    python -m scripts.load_test_ai [--requests 200] [--concurrency 20] [--scenario mix]
+                                   [--repeat-ratio 0.5] [--latency lognormal:900,0.35]
+
+Runs the same workload through ai.service four times (response cache on/off x
+wellness-report fan-out on/off) with AI_BACKEND=stub, so no network access or
+API key is needed, and prints throughput and latency percentiles for each run.
+`--repeat-ratio` is the share of requests that reuse an earlier input, which is
+what the response cache can absorb.
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+# Must be set before ai.* is imported
+os.environ['AI_BACKEND'] = 'stub'
+os.environ.setdefault('AI_CACHE_PATH', os.path.join(tempfile.mkdtemp(prefix='ai-load-'), 'ai_cache.db'))
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import ai.service as ai_service
+from ai.cache import response_cache
+from ai.backend import set_provider
+from ai.stub_impl import StubProvider
+
+ASSESSMENT_TYPES = ['GAD-7', 'PHQ-9']
+CHAT_MESSAGES = [
+    "I've been feeling anxious about work all week.",
+    "I can't sleep and my thoughts keep racing.",
+    "Today was actually a good day.",
+    "I feel lonely since moving to a new city.",
+]
+
+
+def make_inputs(count, repeat_ratio, seed):
+    """Build `count` request inputs where roughly `repeat_ratio` of them repeat an earlier one."""
+    rng = random.Random(seed)
+    inputs = []
+    for i in range(count):
+        if inputs and rng.random() < repeat_ratio:
+            inputs.append(rng.choice(inputs))
+            continue
+        inputs.append({
+            'id': i,
+            'assessment_type': rng.choice(ASSESSMENT_TYPES),
+            'score': rng.randint(0, 27),
+            'responses': [rng.randint(0, 3) for _ in range(9)],
+            'message': f"{rng.choice(CHAT_MESSAGES)} (#{i})",
+            'patient': {'patient_id': i, 'recent_mood': rng.randint(1, 5), 'sleep_hours': rng.randint(4, 9)},
+            'medication_logs': [{'day': d, 'taken': rng.random() > 0.2} for d in range(7)],
+        })
+    return inputs
+
+
+def run_assessment(item, fanout):
+    ai_service.generate_assessment_insights(item['assessment_type'], item['score'], item['responses'])
+
+
+def run_report(item, fanout):
+    if fanout:
+        ai_service.generate_wellness_report_insights(item['patient'], item['medication_logs'], deadline_seconds=30)
+    else:
+        ai_service.generate_goal_suggestions(item['patient'])
+        ai_service.analyze_medication_adherence(item['medication_logs'], item['patient'])
+
+
+def run_chat(item, fanout):
+    asyncio.run(ai_service.ask_with_severity(item['message']))
+
+
+SCENARIOS = {
+    'assessment': [run_assessment],
+    'report': [run_report],
+    'chat': [run_chat],
+    'mix': [run_assessment, run_report, run_chat],
+}
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def run_once(inputs, scenario, concurrency, cache, fanout):
+    response_cache.clear()
+    response_cache.enabled = cache
+    handlers = SCENARIOS[scenario]
+    latencies = []
+    before = response_cache.stats()
+
+    def one(index_item):
+        index, item = index_item
+        start = time.perf_counter()
+        handlers[index % len(handlers)](item, fanout)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, enumerate(inputs)))
+    elapsed = time.perf_counter() - started
+    after = response_cache.stats()
+    hits = sum(after[k] - before[k] for k in ('memory_hits', 'disk_hits'))
+    lookups = hits + after['misses'] - before['misses']
+    return {
+        'cache': cache,
+        'fanout': fanout,
+        'throughput': len(inputs) / elapsed,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'hit_rate': hits / lookups if lookups else 0.0,
+    }
+
+
+def main(requests, concurrency, scenario, repeat_ratio, latency, seed):
+    set_provider(StubProvider(latency=latency, seed=seed))
+    inputs = make_inputs(requests, repeat_ratio, seed)
+    print(f"Scenario={scenario} requests={requests} concurrency={concurrency} "
+          f"repeat_ratio={repeat_ratio} latency={latency or 'per-family'}")
+    print(f"{'cache':<7}{'fanout':<8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'hit rate':>10}")
+    for cache in (False, True):
+        for fanout in (False, True):
+            r = run_once(inputs, scenario, concurrency, cache, fanout)
+            print(f"{str(r['cache']):<7}{str(r['fanout']):<8}{r['throughput']:>9.1f}"
+                  f"{r['p50']:>10.0f}{r['p95']:>10.0f}{r['hit_rate']:>10.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS), default='mix')
+    parser.add_argument('--repeat-ratio', type=float, default=0.5, help='Share of requests that reuse an earlier input')
+    parser.add_argument('--latency', default='', help='Override stub latency, e.g. fixed:500 or lognormal:900,0.35')
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+    main(args.requests, args.concurrency, args.scenario, args.repeat_ratio, args.latency, args.seed)
@@ -0,0 +1,33 @@
+"""
+Rebuild the institution rollups (user_daily_activity, institutional_analytics) from the activity logs.
+
+Usage:
+    python -m scripts.reconcile_rollups [--days 35]
+
+The serving process does this every night for the last ROLLUP_RECONCILE_DAYS
+days (see institution_rollups). Run it by hand after `flask db upgrade` to
+backfill history (e.g. --days 365), or after bulk imports that bypass the ORM.
+"""
+import os
+import sys
+import argparse
+
+# Import the app module to access Flask app context and models
+import importlib
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+app_mod = importlib.import_module('app')
+from institution_rollups import rollups, ROLLUP_RECONCILE_DAYS
+
+
+def main(days):
+    with app_mod.app.app_context():
+        result = rollups.reconcile(days)
+    print(f"Rebuilt {result['days']} days: {result['user_days']} patient-days, "
+          f"{result['institutions']} institutions ({result['seconds']}s)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=ROLLUP_RECONCILE_DAYS, help='How many days back to rebuild')
+    args = parser.parse_args()
+    main(args.days)
@@ -0,0 +1,112 @@
+"""
+Train the local chat risk classifier (risk_classifier.py) from the labelled fixture corpus.
+
+Usage:
+    python -m scripts.train_risk_classifier [--corpus ai/fixtures/risk_messages.jsonl]
+        [--folds 5] [--target-recall 0.99] [--output ai/models/risk_classifier.npz] [--dry-run]
+
+Each corpus line is {"text": ..., "label": 1 | 0}, where 1 means the message
+needs a clinical severity check. Stratified k-fold cross-validation picks the
+low-risk threshold: the highest probability cut-off that still sends at least
+--target-recall of the held-out risk messages to the LLM. Messages the keyword
+heuristic already sends to the LLM (score >= RISK_LLM_GATE) are left out of
+that choice, since the classifier is not consulted for them. The final model
+is then trained on the whole corpus and saved with that threshold.
+"""
+import os
+import sys
+import json
+import random
+import argparse
+
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from risk_classifier import RiskClassifier, RISK_CLASSIFIER_PATH
+from risk_tracker import RISK_LLM_GATE
+from severity import heuristic_severity
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+DEFAULT_CORPUS = os.path.join(BASE_DIR, 'ai', 'fixtures', 'risk_messages.jsonl')
+
+
+def load_corpus(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    return [row['text'] for row in rows], [int(row['label']) for row in rows]
+
+
+def stratified_folds(labels, folds, seed):
+    rng = random.Random(seed)
+    assignment = [0] * len(labels)
+    for label in set(labels):
+        members = [i for i, y in enumerate(labels) if y == label]
+        rng.shuffle(members)
+        for position, i in enumerate(members):
+            assignment[i] = position % folds
+    return assignment
+
+
+def cross_validate(texts, labels, folds, seed, train_kwargs):
+    """Out-of-fold probabilities for every message."""
+    assignment = stratified_folds(labels, folds, seed)
+    probabilities = np.zeros(len(texts))
+    for fold in range(folds):
+        train_idx = [i for i, f in enumerate(assignment) if f != fold]
+        test_idx = [i for i, f in enumerate(assignment) if f == fold]
+        model = RiskClassifier.train([texts[i] for i in train_idx], [labels[i] for i in train_idx], **train_kwargs)
+        probabilities[test_idx] = model.predict_proba_batch([texts[i] for i in test_idx])
+    return probabilities
+
+
+def choose_threshold(probabilities, labels, target_recall):
+    """Largest cut-off whose skipped messages (p < cut-off) leave risk recall >= target."""
+    labels = np.asarray(labels)
+    risk_probs = np.sort(probabilities[labels == 1])
+    allowed_misses = int(np.floor((1.0 - target_recall) * len(risk_probs) + 1e-9))
+    # Skipping everything below the (allowed_misses)-th lowest risk probability keeps the rest
+    threshold = risk_probs[allowed_misses] if allowed_misses < len(risk_probs) else 1.0
+    return float(threshold)
+
+
+def report(probabilities, labels, threshold):
+    labels = np.asarray(labels)
+    skipped = probabilities < threshold
+    risk = labels == 1
+    recall = 1.0 - (skipped & risk).sum() / max(1, risk.sum())
+    skip_rate_low = (skipped & ~risk).sum() / max(1, (~risk).sum())
+    print(f"  threshold {threshold:.3f}: risk recall {recall:.3f}, low-risk messages skipping the LLM {skip_rate_low:.3f}")
+
+
+def main(corpus, folds, target_recall, output, seed, dry_run):
+    texts, labels = load_corpus(corpus)
+    print(f"{len(texts)} messages ({sum(labels)} risk, {len(labels) - sum(labels)} low risk)")
+    train_kwargs = {}
+
+    probabilities = cross_validate(texts, labels, folds, seed, train_kwargs)
+    gated = np.array([heuristic_severity(t) < RISK_LLM_GATE for t in texts])
+    print(f"{int(gated.sum())} messages below the heuristic gate ({RISK_LLM_GATE}) are decided by the classifier")
+    gated_labels = np.asarray(labels)[gated]
+    threshold = choose_threshold(probabilities[gated], gated_labels, target_recall)
+    print(f"{folds}-fold cross-validation, messages below the heuristic gate:")
+    for candidate in sorted({0.05, 0.1, 0.2, 0.3, 0.5, round(threshold, 3)}):
+        report(probabilities[gated], gated_labels, candidate)
+    print(f"Chosen low-risk threshold: {threshold:.3f} (target recall {target_recall})")
+
+    model = RiskClassifier.train(texts, labels, low_threshold=threshold, **train_kwargs)
+    if dry_run:
+        return
+    model.save(output)
+    print(f"Saved {output} ({os.path.getsize(output) / 1024:.0f} KiB)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS)
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--target-recall', type=float, default=0.99, help='Share of risk messages that must reach the LLM in cross-validation')
+    parser.add_argument('--output', default=RISK_CLASSIFIER_PATH)
+    parser.add_argument('--seed', type=int, default=13)
+    parser.add_argument('--dry-run', action='store_true', help='Evaluate only, do not write the model')
+    args = parser.parse_args()
+    main(args.corpus, args.folds, args.target_recall, args.output, args.seed, args.dry_run)
@@ -365,6 +365,93 @@ function openAssessmentModal(options) {
     }
   }
 
+  function renderAssessmentInsights(insights) {
+    const loadingEl = document.getElementById('aiInsightsLoading');
+    if (loadingEl) loadingEl.classList.add('hidden');
+
+    // Update Summary
+    const summaryEl = document.getElementById('aiSummary');
+    if (summaryEl && insights.summary) {
+      summaryEl.textContent = insights.summary;
+    }
+
+    // Update Recommendations
+    const recsEl = document.getElementById('aiRecommendations');
+    if (recsEl && insights.recommendations && Array.isArray(insights.recommendations)) {
+      recsEl.innerHTML = insights.recommendations.map(rec =>
+        `<li class="flex items-start"><i class="fas fa-check-circle text-green-500 mt-1 mr-2"></i><span>${rec}</span></li>`
+      ).join('');
+    }
+
+    // Update Resources
+    const resEl = document.getElementById('aiResources');
+    if (resEl && insights.resources && Array.isArray(insights.resources)) {
+      resEl.innerHTML = insights.resources.map(res =>
+        `<li class="flex items-start"><i class="fas fa-external-link-alt text-blue-500 mt-1 mr-2"></i><span>${res}</span></li>`
+      ).join('');
+    }
+
+    // Show the container
+    const contentEl = document.getElementById('aiInsightsContent');
+    if (contentEl) {
+      contentEl.classList.remove('hidden');
+      // Scroll to insights
+      contentEl.scrollIntoView({ behavior: 'smooth' });
+    }
+  }
+
+  // Insights are generated in the background: listen for the socket push and poll as a fallback
+  function waitForAssessmentInsights(jobId, assessmentId) {
+    const loadingEl = document.getElementById('aiInsightsLoading');
+    if (loadingEl) loadingEl.classList.remove('hidden');
+
+    let finished = false;
+    let pollTimer = null;
+    const socket = window.socket;
+
+    function finish(insights) {
+      if (finished) return;
+      finished = true;
+      if (pollTimer) clearTimeout(pollTimer);
+      if (socket) socket.off('assessment_insights', onPush);
+      if (insights) {
+        renderAssessmentInsights(insights);
+      } else if (loadingEl) {
+        loadingEl.classList.add('hidden');
+      }
+    }
+
+    function onPush(data) {
+      if (data && (data.job_id === jobId || data.assessment_id === assessmentId)) {
+        finish(data.ai_insights);
+      }
+    }
+
+    if (socket) socket.on('assessment_insights', onPush);
+
+    let polls = 0;
+    async function poll() {
+      if (finished) return;
+      polls++;
+      try {
+        const res = await fetch(`/patient/api/insight-jobs/${encodeURIComponent(jobId)}`, { credentials: 'same-origin' });
+        if (res.ok) {
+          const data = await res.json();
+          if (data.status === 'done') return finish(data.ai_insights);
+          if (data.status === 'failed') return finish(null);
+        }
+      } catch (e) {
+        // Network hiccup; try again on the next tick
+      }
+      if (polls < 40) {
+        pollTimer = setTimeout(poll, 3000);
+      } else {
+        finish(null);
+      }
+    }
+    pollTimer = setTimeout(poll, 3000);
+  }
+
   async function completeAssessment() {
     if (window.__assessmentSaving) return;
     window.__assessmentSaving = true;
@@ -399,37 +486,9 @@ function openAssessmentModal(options) {
 
       // Dynamically update AI insights if available
       if (json.success && json.ai_insights) {
-        const insights = json.ai_insights;
-
-        // Update Summary
-        const summaryEl = document.getElementById('aiSummary');
-        if (summaryEl && insights.summary) {
-          summaryEl.textContent = insights.summary;
-        }
-
-        // Update Recommendations
-        const recsEl = document.getElementById('aiRecommendations');
-        if (recsEl && insights.recommendations && Array.isArray(insights.recommendations)) {
-          recsEl.innerHTML = insights.recommendations.map(rec =>
-            `<li class="flex items-start"><i class="fas fa-check-circle text-green-500 mt-1 mr-2"></i><span>${rec}</span></li>`
-          ).join('');
-        }
-
-        // Update Resources
-        const resEl = document.getElementById('aiResources');
-        if (resEl && insights.resources && Array.isArray(insights.resources)) {
-          resEl.innerHTML = insights.resources.map(res =>
-            `<li class="flex items-start"><i class="fas fa-external-link-alt text-blue-500 mt-1 mr-2"></i><span>${res}</span></li>`
-          ).join('');
-        }
-
-        // Show the container
-        const contentEl = document.getElementById('aiInsightsContent');
-        if (contentEl) {
-          contentEl.classList.remove('hidden');
-          // Scroll to insights
-          contentEl.scrollIntoView({ behavior: 'smooth' });
-        }
+        renderAssessmentInsights(json.ai_insights);
+      } else if (json.success && json.ai_insights_pending) {
+        waitForAssessmentInsights(json.insights_job_id, json.assessment_id);
       } else {
         // If no insights returned immediately, maybe reload or show a message
         if (confirm('Assessment saved. Reload page to see updated history?')) {
@@ -1,14 +1,25 @@
 
 document.addEventListener('DOMContentLoaded', function() {
+    fetch('/provider/api/analytics/series?days=30&granularity=day', { credentials: 'same-origin' })
+        .then(function(response) { return response.json(); })
+        .then(function(series) {
+            if (series.success) {
+                renderCharts(series);
+            }
+        })
+        .catch(function(error) { console.error('Failed to load analytics series', error); });
+});
+
+function renderCharts(series) {
     // Screen Time Chart
     const screenTimeCtx = document.getElementById('screenTimeChart').getContext('2d');
     new Chart(screenTimeCtx, {
         type: 'line',
         data: {
-            labels: {{ analytics_data.chart_labels | tojson }},
+            labels: series.labels,
             datasets: [{
                 label: 'Average Daily Screen Time (hours)',
-                data: {{ analytics_data.screen_time_data | tojson }},
+                data: series.screen_time,
                 borderColor: 'rgb(59, 130, 246)',
                 backgroundColor: 'rgba(59, 130, 246, 0.1)',
                 tension: 0.1
@@ -38,10 +49,10 @@ document.addEventListener('DOMContentLoaded', function() {
     new Chart(wellnessCtx, {
         type: 'line',
         data: {
-            labels: {{ analytics_data.chart_labels | tojson }},
+            labels: series.labels,
             datasets: [{
                 label: 'Average Wellness Score',
-                data: {{ analytics_data.wellness_score_data | tojson }},
+                data: series.wellness_score,
                 borderColor: 'rgb(239, 68, 68)',
                 backgroundColor: 'rgba(239, 68, 68, 0.1)',
                 tension: 0.1
@@ -66,4 +77,4 @@ document.addEventListener('DOMContentLoaded', function() {
             }
         }
     });
-});
+}
@@ -260,3 +260,89 @@ function exportReport() {
     link.click();
     document.body.removeChild(link);
 }
+
+// Live upgrade of AI sections that missed the server-side deadline
+document.addEventListener('DOMContentLoaded', function() {
+    const socket = window.socket || (typeof io !== 'undefined' ? io() : null);
+    const pendingCards = Array.from(document.querySelectorAll('[data-ai-section][data-ai-pending="true"]'));
+    if (pendingCards.length === 0) return;
+    const reportToken = pendingCards[0].getAttribute('data-report-token');
+
+    function escapeHtml(value) {
+        const div = document.createElement('div');
+        div.textContent = value == null ? '' : String(value);
+        return div.innerHTML;
+    }
+
+    function renderGoalSuggestions(data) {
+        if (!Array.isArray(data) || data.length === 0) {
+            return '<p class="text-gray-600">No AI goal suggestions available at this time.</p>';
+        }
+        const items = data.map(function(goal) {
+            if (goal && typeof goal === 'object') {
+                const desc = goal.description ? ': ' + escapeHtml(goal.description) : '';
+                return '<li><strong>' + escapeHtml(goal.title) + '</strong>' + desc + '</li>';
+            }
+            return '<li>' + escapeHtml(goal) + '</li>';
+        });
+        return '<ul class="list-disc pl-5 space-y-2 text-gray-700">' + items.join('') + '</ul>';
+    }
+
+    function renderMedicationAdherence(data) {
+        if (!data || !data.insight) {
+            return '<p class="text-gray-600">No AI medication adherence insights available at this time.</p>';
+        }
+        let html = '<p class="text-gray-700 mb-2">' + escapeHtml(data.insight) + '</p>';
+        if (data.adherence_score !== undefined && data.adherence_score !== null) {
+            html += '<p class="text-gray-700 mb-2"><strong>Adherence score:</strong> ' + escapeHtml(data.adherence_score) + '</p>';
+        }
+        if (data.recommendation) {
+            html += '<p class="text-gray-700"><strong>Recommendation:</strong> ' + escapeHtml(data.recommendation) + '</p>';
+        }
+        return html;
+    }
+
+    const renderers = {
+        goal_suggestions: renderGoalSuggestions,
+        medication_adherence: renderMedicationAdherence
+    };
+
+    function renderSection(section, data) {
+        if (!renderers[section]) return;
+        const card = document.querySelector('[data-ai-section="' + section + '"][data-report-token="' + reportToken + '"][data-ai-pending="true"]');
+        if (!card) return;
+        const body = card.querySelector('.ai-section-body');
+        if (body) body.innerHTML = renderers[section](data);
+        card.removeAttribute('data-ai-pending');
+    }
+
+    function stillPending() {
+        return document.querySelectorAll('[data-ai-section][data-ai-pending="true"]').length > 0;
+    }
+
+    if (socket) {
+        socket.on('wellness_report_ai', function(payload) {
+            if (payload && payload.report_token === reportToken) renderSection(payload.section, payload.data);
+        });
+    }
+
+    // Polling fallback: a section that finished before the socket joined its room is only cached server-side
+    let polls = 0;
+    async function poll() {
+        if (!stillPending()) return;
+        polls++;
+        try {
+            const res = await fetch('/provider/api/wellness-report-ai/' + encodeURIComponent(reportToken), { credentials: 'same-origin' });
+            if (res.ok) {
+                const data = await res.json();
+                Object.keys(data.sections || {}).forEach(function(section) {
+                    renderSection(section, data.sections[section]);
+                });
+            }
+        } catch (e) {
+            // Network hiccup; try again on the next tick
+        }
+        if (stillPending() && polls < 40) setTimeout(poll, 3000);
+    }
+    setTimeout(poll, 3000);
+});
@@ -506,6 +506,84 @@ window.showTemporaryNotification = function(message, type = 'info') {
     }, 5000);
 }
 
+// Message triage queue: unread patient messages sorted by risk
+function escapeTriageText(text) {
+    const div = document.createElement('div');
+    div.textContent = text == null ? '' : String(text);
+    return div.innerHTML;
+}
+
+function triageBadgeClass(severity) {
+    if (severity == null) return 'bg-gray-100 text-gray-700';
+    if (severity >= 7) return 'bg-red-100 text-red-800';
+    if (severity >= 4) return 'bg-yellow-100 text-yellow-800';
+    return 'bg-green-100 text-green-800';
+}
+
+window.loadTriageQueue = function() {
+    const list = document.getElementById('triageQueue');
+    if (!list) return;
+
+    fetch('/provider/api/triage-queue?limit=50', { credentials: 'same-origin' })
+        .then(response => response.json())
+        .then(data => {
+            if (!data.success) throw new Error(data.message || 'Failed to load messages');
+            if (!data.messages.length) {
+                list.innerHTML = '<li class="py-3 text-sm text-gray-500">No unread patient messages.</li>';
+                return;
+            }
+            list.innerHTML = data.messages.map(m => `
+                <li class="py-3 flex items-start justify-between">
+                    <div class="flex-1 pr-4">
+                        <div class="flex items-center space-x-2">
+                            <span class="px-2 py-1 rounded-full text-xs font-medium ${triageBadgeClass(m.severity)}">
+                                ${m.severity == null ? 'Unscored' : 'Risk ' + m.severity + '/10'}
+                            </span>
+                            <span class="text-sm font-medium text-gray-900">${escapeTriageText(m.sender_name || 'Unknown sender')}</span>
+                            <span class="text-xs text-gray-500">${m.created_at ? new Date(m.created_at + 'Z').toLocaleString() : ''}</span>
+                        </div>
+                        <p class="text-sm text-gray-700 mt-1">${escapeTriageText(m.message)}</p>
+                        ${m.severity_reason ? `<p class="text-xs text-gray-500 mt-1 italic">${escapeTriageText(m.severity_reason)}</p>` : ''}
+                    </div>
+                    <div class="flex space-x-2">
+                        ${m.sender_id ? `<a href="#" class="text-indigo-600 hover:text-indigo-800 open-message-btn" data-patient-id="${m.sender_id}" title="Reply"><i class="fas fa-reply" aria-hidden="true"></i></a>` : ''}
+                        <button class="text-gray-500 hover:text-gray-800 mark-triage-read-btn" data-notification-id="${m.id}" title="Mark as read">
+                            <i class="fas fa-check" aria-hidden="true"></i>
+                        </button>
+                    </div>
+                </li>
+            `).join('');
+        })
+        .catch(error => {
+            console.error('Error loading triage queue:', error);
+            list.innerHTML = '<li class="py-3 text-sm text-red-600">Could not load patient messages.</li>';
+        });
+}
+
+function triageHeaders() {
+    const headers = { 'Content-Type': 'application/json' };
+    const csrfToken = document.querySelector('meta[name="csrf-token"]')?.getAttribute('content');
+    if (csrfToken) headers['X-CSRFToken'] = csrfToken;
+    return headers;
+}
+
+window.runMessageTriage = function() {
+    fetch('/provider/api/triage', { method: 'POST', headers: triageHeaders(), credentials: 'same-origin', body: '{}' })
+        .then(response => response.json())
+        .then(data => {
+            if (!data.success) throw new Error(data.message || 'Could not start triage');
+            showTemporaryNotification('Triage started — the queue will refresh when it finishes.', 'info');
+        })
+        .catch(error => showTemporaryNotification(error.message, 'error'));
+}
+
+socket.on('message_triage_complete', function(data) {
+    window.loadTriageQueue();
+    if (data.scored || data.ai_rated) {
+        showTemporaryNotification(`Triage finished: ${data.scored} scored, ${data.ai_rated} reviewed by AI.`, 'success');
+    }
+});
+
 document.addEventListener('DOMContentLoaded', function() {
     console.log('🚀 Provider Dashboard loaded, initializing appointments...');
     console.log('👤 Current user session check...');
@@ -517,8 +595,24 @@ document.addEventListener('DOMContentLoaded', function() {
     
     window.loadAppointments();
 
+    window.loadTriageQueue();
+
     // Event listeners for provider dashboard
     document.getElementById('refresh-appointments-btn')?.addEventListener('click', window.refreshAppointments);
+    document.getElementById('run-triage-btn')?.addEventListener('click', window.runMessageTriage);
+
+    document.getElementById('triageQueue')?.addEventListener('click', function(event) {
+        const target = event.target.closest('button.mark-triage-read-btn');
+        if (!target) return;
+        fetch(`/provider/api/triage-queue/${target.dataset.notificationId}/read`, {
+            method: 'POST', headers: triageHeaders(), credentials: 'same-origin'
+        })
+            .then(response => response.json())
+            .then(data => {
+                if (data.success) target.closest('li')?.remove();
+            })
+            .catch(error => console.error('Error marking message read:', error));
+    });
 
     document.querySelectorAll('.filter-appointments-btn').forEach(button => {
         button.addEventListener('click', function() {
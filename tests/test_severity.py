@@ -0,0 +1,57 @@
+"""
+Golden-score and parity checks for severity.heuristic_severity and
+heuristic_severity_detail against the keyword loops they replaced
+(scripts.bench_severity.legacy_heuristic_severity). Matching is plain
+substring containment, as before: 'plan' counts inside 'explanation'.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from severity import heuristic_severity, heuristic_severity_detail
+from scripts.bench_severity import build_corpus, legacy_heuristic_severity
+
+# Texts whose scores were checked by hand; (text, expected score)
+GOLDEN = [
+    ('', 0),
+    ('Had a good day at work today.', 0),
+    ('I feel so alone and overwhelmed', 2),
+    ('I had a panic attack on the bus', 2),
+    ('I feel hopeless', 3),
+    ('There is no hope left, I feel hopeless', 9),
+    ('I am planning to end my life', 10),
+    ('Can you explain the plan for tomorrow?', 2),
+    ('I WANT TO DIE', 6),
+    ('my intentions are good', 2),
+    ('Thinking of harming myself and I have access to pills', 8),
+    ('I cannot cope, I cant cope', 2),
+    ('Ich fühle mich allein — alone, İstanbul', 1),
+    ('I want to die tonight', 10),
+    ('An explanation of the means test', 4),
+    ('Hopelessness, and I keep panicking', 4),
+]
+
+
+@pytest.mark.parametrize('text,expected', GOLDEN)
+def test_golden_scores(text, expected):
+    assert heuristic_severity(text) == expected
+    assert heuristic_severity_detail(text)['score'] == expected
+    assert legacy_heuristic_severity(text) == expected
+
+
+def test_parity_with_legacy_loops_on_generated_corpus():
+    chats, journals = build_corpus(20000, 7)
+    mismatches = [text for text in chats + journals
+                  if not heuristic_severity(text) == heuristic_severity_detail(text)['score'] == legacy_heuristic_severity(text)]
+    assert not mismatches, f"{len(mismatches)} mismatches, e.g. {mismatches[0][:120]!r}"
+
+
+def test_detail_spans_locate_keywords():
+    text = 'Lately I want to die tonight, a panic attack every day'
+    lowered = text.lower()
+    detail = heuristic_severity_detail(text)
+    assert {m['keyword'] for m in detail['matches']} == {'want to die', 'die tonight', 'panic attack', 'panic'}
+    for match in detail['matches']:
+        assert lowered[match['start']:match['end']] == match['keyword']
@@ -0,0 +1,128 @@
+"""
+Risk triage for patient messages sent to providers (Notification rows of type 'message').
+
+Every message gets the keyword heuristic from severity.py (cheap enough to run
+inline when the message is sent and in bulk over a backlog). Messages scoring
+at or above TRIAGE_LLM_THRESHOLD are then rated by the AI backend, a bounded
+number at a time, and keep the higher of the two scores. Providers read the
+unread messages highest severity first.
+"""
+import os
+import logging
+from datetime import datetime
+
+from sqlalchemy import update
+from sqlalchemy.orm import joinedload
+
+from extensions import db
+from models import Notification
+from severity import heuristic_severity_detail
+from ai.fanout import map_bounded
+import ai.service as ai_service
+
+logger = logging.getLogger(__name__)
+
+TRIAGE_CHUNK_SIZE = int(os.environ.get("TRIAGE_CHUNK_SIZE", "200"))
+TRIAGE_LLM_THRESHOLD = int(os.environ.get("TRIAGE_LLM_THRESHOLD", "4"))  # heuristic score that earns an AI rating
+TRIAGE_LLM_CONCURRENCY = int(os.environ.get("TRIAGE_LLM_CONCURRENCY", "4"))
+TRIAGE_LLM_MAX_PER_RUN = int(os.environ.get("TRIAGE_LLM_MAX_PER_RUN", "100"))
+TRIAGE_HIGH_RISK = 7
+
+
+def heuristic_triage(text):
+    """(severity, reason) from the keyword heuristic."""
+    detail = heuristic_severity_detail(text or '')
+    keywords = sorted({m['keyword'] for m in detail['matches']})
+    reason = f"keywords: {', '.join(keywords)}"[:255] if keywords else None
+    return detail['score'], reason
+
+
+def _unread_messages(recipient_id):
+    return Notification.query.filter(
+        Notification.recipient_id == recipient_id,
+        Notification.type == 'message',
+        Notification.read.isnot(True),
+    )
+
+
+def triage_messages(recipient_id, notification_ids=None, rescore=False, on_chunk=None) -> dict:
+    """
+    Score a recipient's unread messages in chunks, then escalate the riskiest ones to the AI backend.
+
+    Only unscored messages are read unless `rescore` is set; `notification_ids`
+    narrows the run to specific messages. `on_chunk(scored_so_far)` is called
+    after each chunk is committed.
+    """
+    query = _unread_messages(recipient_id)
+    if notification_ids:
+        query = query.filter(Notification.id.in_(notification_ids))
+    if not rescore:
+        query = query.filter(Notification.severity.is_(None))
+
+    scored = 0
+    last_id = 0
+    while True:
+        rows = query.filter(Notification.id > last_id) \
+            .with_entities(Notification.id, Notification.message) \
+            .order_by(Notification.id).limit(TRIAGE_CHUNK_SIZE).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        now = datetime.utcnow()
+        updates = []
+        for row in rows:
+            score, reason = heuristic_triage(row.message)
+            updates.append({'id': row.id, 'severity': score, 'severity_source': 'heuristic',
+                            'severity_reason': reason, 'triaged_at': now})
+        db.session.execute(update(Notification), updates)
+        db.session.commit()
+        scored += len(rows)
+        if on_chunk is not None:
+            on_chunk(scored)
+
+    escalated, ai_rated = escalate_messages(recipient_id, notification_ids)
+    summary = {'scored': scored, 'escalated': escalated, 'ai_rated': ai_rated}
+    logger.info(f"Triage for recipient {recipient_id}: {summary}")
+    return summary
+
+
+def escalate_messages(recipient_id, notification_ids=None):
+    """
+    AI-rate unread messages whose heuristic score reached TRIAGE_LLM_THRESHOLD, riskiest
+    first, at most TRIAGE_LLM_MAX_PER_RUN per call. Messages left over (or whose rating
+    failed) keep their heuristic score and are picked up by the next run.
+    Returns (attempted, rated).
+    """
+    query = _unread_messages(recipient_id).filter(
+        Notification.severity >= TRIAGE_LLM_THRESHOLD,
+        Notification.severity_source == 'heuristic',
+    )
+    if notification_ids:
+        query = query.filter(Notification.id.in_(notification_ids))
+    candidates = query.with_entities(Notification.id, Notification.message, Notification.severity) \
+        .order_by(Notification.severity.desc(), Notification.created_at.asc()) \
+        .limit(TRIAGE_LLM_MAX_PER_RUN).all()
+    candidates = [c for c in candidates if c.message]
+    if not candidates:
+        return 0, 0
+
+    ratings = map_bounded(lambda c: ai_service.assess_message_severity(c.message), candidates, TRIAGE_LLM_CONCURRENCY)
+    now = datetime.utcnow()
+    updates = [
+        {'id': c.id, 'severity': max(c.severity, rating['severity']), 'severity_source': 'llm',
+         'severity_reason': rating['reason'][:255] or None, 'triaged_at': now}
+        for c, rating in zip(candidates, ratings) if rating
+    ]
+    if updates:
+        db.session.execute(update(Notification), updates)
+        db.session.commit()
+    return len(candidates), len(updates)
+
+
+def triage_queue(recipient_id, limit=50, min_severity=None):
+    """Unread messages for a recipient, highest severity first (oldest first within a severity)."""
+    query = _unread_messages(recipient_id).options(joinedload(Notification.sender))
+    if min_severity is not None:
+        query = query.filter(Notification.severity >= min_severity)
+    return query.order_by(Notification.severity.desc().nulls_last(), Notification.created_at.asc()) \
+        .limit(limit).all()
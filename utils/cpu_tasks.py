@@ -0,0 +1,79 @@
+"""
+CPU-bound task functions run through utils.offload.
+
+They can run in offload worker processes (OFFLOAD_MODE=process), so they must
+stay importable module-level functions that take and return plain picklable
+values. They must not import the app, Flask or the database.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def password_hash(password):
+    from werkzeug.security import generate_password_hash
+    return generate_password_hash(password)
+
+
+def password_matches(pwhash, password):
+    from werkzeug.security import check_password_hash
+    return check_password_hash(pwhash, password)
+
+
+def text_polarity(text):
+    """TextBlob sentiment polarity of `text`, from -1 to 1."""
+    from textblob import TextBlob
+    return TextBlob(text).sentiment.polarity
+
+
+def voice_features(file_path):
+    """Acoustic features of the first two minutes of an audio file (see app.classify_emotion)."""
+    import librosa
+    import numpy as np
+
+    y, sr = librosa.load(file_path, duration=120)  # Max 2 minutes
+
+    # Extract basic features
+    audio_features = {
+        'duration': len(y) / sr,
+        'sample_rate': sr
+    }
+
+    # Extract acoustic features
+    try:
+        # Pitch (fundamental frequency)
+        pitches, magnitudes = librosa.piptrack(y=y, sr=sr)
+        pitch_values = pitches[pitches > 0]
+        if len(pitch_values) > 0:
+            audio_features['mean_pitch'] = float(np.mean(pitch_values))
+            audio_features['pitch_std'] = float(np.std(pitch_values))
+
+        # Energy (RMS)
+        rms = librosa.feature.rms(y=y)
+        audio_features['mean_energy'] = float(np.mean(rms))
+        audio_features['energy_std'] = float(np.std(rms))
+
+        # Zero-crossing rate (related to voice quality)
+        zcr = librosa.feature.zero_crossing_rate(y)
+        audio_features['mean_zcr'] = float(np.mean(zcr))
+        audio_features['zcr_std'] = float(np.std(zcr))
+
+        # Spectral features
+        spectral_centroid = librosa.feature.spectral_centroid(y=y, sr=sr)
+        audio_features['mean_spectral_centroid'] = float(np.mean(spectral_centroid))
+        audio_features['spectral_centroid_std'] = float(np.std(spectral_centroid))
+
+    except Exception as feature_error:
+        logger.warning(f"Feature extraction error: {feature_error}")
+
+    return audio_features
+
+
+def burn_cpu(seconds):
+    """Spin for `seconds` of wall time; used by scripts/bench_offload.py."""
+    import time
+    end = time.perf_counter() + seconds
+    n = 0
+    while time.perf_counter() < end:
+        n += 1
+    return n
@@ -0,0 +1,189 @@
+"""
+Read/write routing between the primary database and an optional read replica.
+
+Set DATABASE_REPLICA_URL to register a `replica` bind next to the primary. The
+session (extensions.db) keeps sending everything to the primary, except plain
+SELECTs issued inside a named read scope:
+
+    @read_replica('provider_analytics')     # or: with read_replica('...'):
+    def analytics(): ...
+
+Inside a scope a SELECT goes to the replica unless
+
+  - no replica is configured, or its last health check failed;
+  - its measured lag exceeds REPLICA_MAX_LAG_SECONDS (PostgreSQL standbys
+    report it; other databases count as lag 0);
+  - the statement locks rows (SELECT ... FOR UPDATE);
+  - the session already wrote in the current transaction, so the request reads
+    its own writes.
+
+Writes inside a scope still go to the primary. Lag and health are measured at
+most every REPLICA_CHECK_SECONDS per process, and a replica connection error
+marks it unavailable until the next check. replica_status() reports routing
+counts per scope for /health. Locally, point DATABASE_URL and
+DATABASE_REPLICA_URL at two SQLite files or two PostgreSQL containers (see
+scripts/check_replica_routing.py).
+"""
+import os
+import time
+import logging
+import threading
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.sql import Select
+
+from utils.pool_stats import pool_engine_options
+
+logger = logging.getLogger(__name__)
+
+DATABASE_REPLICA_URL = os.environ.get("DATABASE_REPLICA_URL", "")
+REPLICA_BIND = 'replica'
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get("REPLICA_MAX_LAG_SECONDS", "30"))
+REPLICA_CHECK_SECONDS = float(os.environ.get("REPLICA_CHECK_SECONDS", "10"))
+
+_POSTGRES_LAG = ("SELECT CASE WHEN pg_is_in_recovery() "
+                 "THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) ELSE 0 END")
+
+_scope = contextvars.ContextVar('db_routing_scope', default=None)
+
+
+def replica_binds(url=None) -> dict:
+    """SQLALCHEMY_BINDS entry for the replica (empty when none is configured)."""
+    url = url if url is not None else DATABASE_REPLICA_URL
+    if not url:
+        return {}
+    return {REPLICA_BIND: dict(pool_engine_options(url, name=REPLICA_BIND), url=url)}
+
+
+class ReplicaMonitor:
+    """Health and lag of the replica engine, re-measured at most every REPLICA_CHECK_SECONDS."""
+
+    def __init__(self):
+        self.available = False
+        self.lag_seconds = None
+        self.error = None
+        self.checked_at = 0.0
+        self.routed = Counter()     # scope -> SELECTs sent to the replica
+        self.fallbacks = Counter()  # scope -> SELECTs kept on the primary for lag or health
+        self._hooked = set()
+        self._lock = threading.Lock()
+        self._checking = threading.Lock()
+
+    def _hook(self, engine):
+        if id(engine) in self._hooked:
+            return
+        self._hooked.add(id(engine))
+
+        @event.listens_for(engine, 'handle_error')
+        def _replica_error(exception_context):
+            # Connection-level failures only; a bad query is not the replica's fault
+            if exception_context.is_disconnect or isinstance(exception_context.sqlalchemy_exception, OperationalError):
+                self.mark_unavailable(exception_context.original_exception)
+
+    def mark_unavailable(self, error):
+        with self._lock:
+            if self.available:
+                logger.warning(f"Read replica unavailable, reading from the primary: {error}")
+            self.available = False
+            self.error = str(error)
+            self.checked_at = time.monotonic()
+
+    def check(self, engine, force=False):
+        """Measure lag if the last check is stale; returns whether the replica may serve reads."""
+        self._hook(engine)
+        if force or time.monotonic() - self.checked_at >= REPLICA_CHECK_SECONDS:
+            # One thread measures; the others use the previous result meanwhile
+            if self._checking.acquire(blocking=force):
+                try:
+                    self._measure(engine)
+                finally:
+                    self._checking.release()
+        return self.available and (self.lag_seconds or 0) <= REPLICA_MAX_LAG_SECONDS
+
+    def _measure(self, engine):
+        try:
+            with engine.connect() as conn:
+                if engine.dialect.name == 'postgresql':
+                    lag = float(conn.exec_driver_sql(_POSTGRES_LAG).scalar() or 0)
+                else:
+                    conn.exec_driver_sql("SELECT 1")
+                    lag = 0.0
+        except Exception as e:
+            self.mark_unavailable(e)
+            return
+        with self._lock:
+            if lag > REPLICA_MAX_LAG_SECONDS and (self.lag_seconds or 0) <= REPLICA_MAX_LAG_SECONDS:
+                logger.warning(f"Read replica lag {lag:.1f}s exceeds {REPLICA_MAX_LAG_SECONDS}s, reading from the primary")
+            self.available = True
+            self.lag_seconds = round(lag, 3)
+            self.error = None
+            self.checked_at = time.monotonic()
+
+    def count(self, scope, routed):
+        with self._lock:
+            (self.routed if routed else self.fallbacks)[scope] += 1
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                'configured': bool(self._hooked) or bool(DATABASE_REPLICA_URL),
+                'available': self.available,
+                'lag_seconds': self.lag_seconds,
+                'max_lag_seconds': REPLICA_MAX_LAG_SECONDS,
+                'error': self.error,
+                'routed': dict(self.routed),
+                'fallbacks': dict(self.fallbacks),
+            }
+
+
+replica_monitor = ReplicaMonitor()
+
+
+def replica_status() -> dict:
+    return replica_monitor.status()
+
+
+@contextmanager
+def read_replica(name):
+    """Send plain SELECTs in this block (or decorated view) to the replica when it is healthy."""
+    token = _scope.set(name)
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def current_read_scope():
+    return _scope.get()
+
+
+class RoutingSession(FlaskSession):
+    """extensions.db session: the primary by default, the replica for SELECTs inside read_replica()."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        scope = _scope.get()
+        if (bind is None and scope is not None and isinstance(clause, Select)
+                and clause._for_update_arg is None and not self.info.get('db_routing_wrote')):
+            engine = self._db.engines.get(REPLICA_BIND)
+            if engine is not None:
+                routed = replica_monitor.check(engine)
+                replica_monitor.count(scope, routed)
+                if routed:
+                    return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _note_write(session, flush_context):
+    session.info['db_routing_wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def _clear_write(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('db_routing_wrote', None)
@@ -0,0 +1,107 @@
+"""
+Cooperative PostgreSQL I/O under the eventlet worker.
+
+psycopg2 is a C driver: a query blocks the OS thread, and with eventlet that
+thread runs every green thread of the worker, so one slow query stalls all
+SocketIO connections and HTTP requests. psycopg2 can instead call a "wait
+callback" whenever it would block; the callback here (the same one psycogreen
+ships) parks the current green thread on the connection's socket with
+eventlet's trampoline, so the hub keeps serving others while the query runs.
+
+init_green_db(app) wires it up:
+
+  - a `do_connect` hook installs the callback before the first psycopg2
+    connection is opened in a process where eventlet has monkey patched the
+    socket module (the gunicorn eventlet worker, `socketio.run` under
+    eventlet), so connections are created in green mode;
+  - an at-fork hook empties the pools in each forked worker, because
+    connections opened by a --preload master were made before patching (and
+    must not be shared between processes anyway).
+
+GREEN_DB=off disables it. scripts/check_green_db.py shows the difference
+against a real PostgreSQL server.
+"""
+import os
+import logging
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+GREEN_DB_ENABLED = os.environ.get("GREEN_DB", "auto") != "off"
+
+_installed = False
+_install_lock = threading.Lock()
+
+
+def eventlet_active() -> bool:
+    try:
+        import eventlet.patcher
+        return eventlet.patcher.is_monkey_patched('socket')
+    except ImportError:
+        return False
+
+
+def eventlet_wait_callback(conn, timeout=-1):
+    """psycopg2 wait callback: yield to the eventlet hub until the connection is ready."""
+    from eventlet.hubs import trampoline
+    from psycopg2 import extensions, OperationalError
+
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            break
+        elif state == extensions.POLL_READ:
+            trampoline(conn.fileno(), read=True)
+        elif state == extensions.POLL_WRITE:
+            trampoline(conn.fileno(), write=True)
+        else:
+            raise OperationalError(f"Bad result from poll: {state!r}")
+
+
+def enable_green_psycopg2() -> bool:
+    """Install the wait callback once per process if eventlet is active; True when installed."""
+    global _installed
+    if _installed or not GREEN_DB_ENABLED or not eventlet_active():
+        return _installed
+    with _install_lock:
+        if _installed:
+            return True
+        try:
+            from psycopg2 import extensions
+        except ImportError:
+            return False
+        extensions.set_wait_callback(eventlet_wait_callback)
+        _installed = True
+        logger.info("psycopg2 wait callback installed: PostgreSQL queries yield to the eventlet hub")
+    return True
+
+
+def _before_connect(dialect, conn_rec, cargs, cparams):
+    if dialect.driver == 'psycopg2':
+        enable_green_psycopg2()
+
+
+def green_db_status() -> dict:
+    return {'enabled': GREEN_DB_ENABLED, 'eventlet': eventlet_active(), 'psycopg2_wait_callback': _installed}
+
+
+def init_green_db(app):
+    """Make psycopg2 connections cooperative whenever the process runs under eventlet."""
+    if not GREEN_DB_ENABLED:
+        return
+    event.listen(Engine, 'do_connect', _before_connect)
+
+    def _reset_pools_after_fork():
+        from extensions import db
+        try:
+            with app.app_context():
+                for engine in db.engines.values():
+                    # Drop the parent's connections without closing them under it
+                    engine.dispose(close=False)
+        except Exception as e:
+            logger.warning(f"Could not reset database pools after fork: {e}")
+
+    os.register_at_fork(after_in_child=_reset_pools_after_fork)
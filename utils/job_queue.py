@@ -0,0 +1,247 @@
+"""
+Persistent background job queue backed by a local SQLite file.
+
+Jobs survive restarts: anything left `running` by a crashed worker is
+re-queued when the worker starts, which assumes one worker process per queue
+file (the deployment runs a single gunicorn worker). Handlers are registered
+per job kind and run inside the Flask app context on a SocketIO background
+task, so they can use the ORM and emit to SocketIO rooms.
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+JOB_QUEUE_PATH = os.environ.get("JOB_QUEUE_PATH", os.path.join(BASE_DIR, 'instance', 'jobs.db'))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "1.0"))  # seconds between polls when idle
+JOB_RETENTION_SECONDS = int(os.environ.get("JOB_RETENTION_SECONDS", str(3 * 24 * 3600)))
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+
+class JobQueue:
+    """FIFO queue of JSON payloads with retry and status tracking."""
+
+    def __init__(self, path=JOB_QUEUE_PATH, max_attempts=JOB_MAX_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+        self._schema_ready = False
+
+    def _connect(self):
+        if not self._schema_ready:
+            # before connecting: sqlite cannot create the file in a missing directory
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        if not self._schema_ready:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                ' id TEXT PRIMARY KEY,'
+                ' kind TEXT NOT NULL,'
+                ' user_id INTEGER,'
+                ' payload TEXT NOT NULL,'
+                ' status TEXT NOT NULL,'
+                ' attempts INTEGER NOT NULL DEFAULT 0,'
+                ' result TEXT,'
+                ' error TEXT,'
+                ' created_at REAL NOT NULL,'
+                ' updated_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs(status, created_at)')
+            self._schema_ready = True
+        return conn
+
+    @staticmethod
+    def _row_to_dict(row):
+        if row is None:
+            return None
+        job = dict(row)
+        job['payload'] = json.loads(job['payload']) if job['payload'] else {}
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def enqueue(self, kind: str, payload: dict, user_id=None) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute(
+                'INSERT INTO jobs (id, kind, user_id, payload, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (job_id, kind, user_id, json.dumps(payload, default=str), STATUS_QUEUED, now, now)
+            )
+        finally:
+            conn.close()
+        return job_id
+
+    def claim(self):
+        """Atomically move the oldest queued job to running and return it."""
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                'SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1', (STATUS_QUEUED,)
+            ).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            conn.execute(
+                'UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?',
+                (STATUS_RUNNING, time.time(), row['id'])
+            )
+            conn.execute('COMMIT')
+            job = self._row_to_dict(row)
+            job['attempts'] += 1
+            return job
+        except sqlite3.Error:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def complete(self, job_id: str, result=None):
+        conn = self._connect()
+        try:
+            conn.execute(
+                'UPDATE jobs SET status = ?, result = ?, error = NULL, updated_at = ? WHERE id = ?',
+                (STATUS_DONE, json.dumps(result, default=str), time.time(), job_id)
+            )
+        finally:
+            conn.close()
+
+    def fail(self, job_id: str, error: str, attempts: int):
+        """Re-queue the job, or mark it failed once it has used all its attempts."""
+        status = STATUS_QUEUED if attempts < self.max_attempts else STATUS_FAILED
+        conn = self._connect()
+        try:
+            conn.execute(
+                'UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?',
+                (status, error[:2000], time.time(), job_id)
+            )
+        finally:
+            conn.close()
+        return status
+
+    def get(self, job_id: str):
+        conn = self._connect()
+        try:
+            return self._row_to_dict(conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone())
+        finally:
+            conn.close()
+
+    def requeue_running(self) -> int:
+        """Crash recovery: jobs left running by a dead worker go back to the queue."""
+        conn = self._connect()
+        try:
+            return conn.execute(
+                'UPDATE jobs SET status = ?, updated_at = ? WHERE status = ?',
+                (STATUS_QUEUED, time.time(), STATUS_RUNNING)
+            ).rowcount
+        finally:
+            conn.close()
+
+    def purge_finished(self, older_than_seconds=JOB_RETENTION_SECONDS) -> int:
+        conn = self._connect()
+        try:
+            return conn.execute(
+                'DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?',
+                (STATUS_DONE, STATUS_FAILED, time.time() - older_than_seconds)
+            ).rowcount
+        finally:
+            conn.close()
+
+    def depth(self) -> dict:
+        conn = self._connect()
+        try:
+            rows = conn.execute('SELECT status, COUNT(*) AS n FROM jobs GROUP BY status').fetchall()
+            return {row['status']: row['n'] for row in rows}
+        finally:
+            conn.close()
+
+
+job_queue = JobQueue()
+
+# kind -> handler(payload: dict, job: dict) -> JSON-serialisable result
+_handlers = {}
+
+
+def job_handler(kind: str):
+    """Decorator registering the function that processes jobs of `kind`."""
+    def decorator(fn):
+        _handlers[kind] = fn
+        return fn
+    return decorator
+
+
+def enqueue_job(kind: str, payload: dict, user_id=None) -> str:
+    return job_queue.enqueue(kind, payload, user_id=user_id)
+
+
+def _run_job(app, job):
+    handler = _handlers.get(job['kind'])
+    if handler is None:
+        job_queue.fail(job['id'], f"No handler registered for job kind '{job['kind']}'", job_queue.max_attempts)
+        logger.error(f"Dropping job {job['id']}: no handler for '{job['kind']}'")
+        return
+    with app.app_context():
+        try:
+            result = handler(job['payload'], job)
+            job_queue.complete(job['id'], result)
+        except Exception as e:
+            logger.exception(f"Job {job['id']} ({job['kind']}) failed on attempt {job['attempts']}")
+            try:
+                from extensions import db
+                db.session.rollback()
+            except Exception:
+                pass
+            job_queue.fail(job['id'], str(e), job['attempts'])
+
+
+def _worker_loop(app, socketio):
+    recovered = job_queue.requeue_running()
+    if recovered:
+        logger.info(f"Re-queued {recovered} job(s) left running by a previous worker")
+    job_queue.purge_finished()
+    logger.info("Background job worker started")
+    while True:
+        try:
+            job = job_queue.claim()
+        except sqlite3.Error as e:
+            logger.warning(f"Job queue unavailable: {e}")
+            job = None
+        if job is None:
+            socketio.sleep(JOB_POLL_INTERVAL)
+            continue
+        _run_job(app, job)
+        # Yield to request handling between jobs
+        socketio.sleep(0)
+
+
+_worker_pid = None
+_worker_lock = threading.Lock()
+
+
+def ensure_job_worker(app, socketio):
+    """
+    Start the worker once per serving process. Called per request so it starts
+    after gunicorn forks (a task started in a --preload master would not survive).
+    """
+    global _worker_pid
+    if _worker_pid == os.getpid():
+        return
+    with _worker_lock:
+        if _worker_pid == os.getpid():
+            return
+        _worker_pid = os.getpid()
+        socketio.start_background_task(_worker_loop, app, socketio)
@@ -0,0 +1,336 @@
+"""
+Run CPU-bound work off the eventlet hub.
+
+The app serves everything from one eventlet worker, so any CPU-heavy call
+made inline stalls every request and socket until it finishes. Examples are
+password hashing, librosa feature extraction, TextBlob sentiment and PIL
+recompression. offload(name, fn, *args) runs `fn` elsewhere and blocks only
+the calling green thread:
+
+  - `thread`: eventlet's tpool (real OS threads) under eventlet, a thread pool
+    otherwise. The default (OFFLOAD_MODE=auto) under eventlet; also used when
+    the process pool cannot start or breaks;
+  - `inline`: the call runs in place. The default outside eventlet (scripts,
+    the CLI, the threaded dev server), where there is no hub to keep free;
+  - `process`: only with OFFLOAD_MODE=process, a pool of OFFLOAD_WORKERS
+    spawned processes, so pure-Python work runs in parallel too. Task
+    functions must be importable module-level functions (see utils.cpu_tasks).
+    Each worker re-imports the main module, and the pool must be shut down
+    (shutdown(), also registered with atexit) before the process can exit.
+
+At most OFFLOAD_MAX_PENDING tasks are admitted at once; a caller waits up to
+OFFLOAD_QUEUE_WAIT_SECONDS for a slot and then gets OffloadRejected. A task
+that takes longer than its timeout (OFFLOAD_TIMEOUT_SECONDS by default)
+raises OffloadTimeout in the caller; its slot is freed when it really ends.
+
+A monitor green thread measures how late the hub wakes it up (event-loop lag)
+against OFFLOAD_LOOP_TARGET_MS. offload_status() reports lag, queue depth and
+per-task counts for /health, and offload_metrics_text() reports them for
+/metrics.
+"""
+import os
+import time
+import atexit
+import logging
+import threading
+import multiprocessing
+from collections import deque, defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+OFFLOAD_MODE = os.environ.get("OFFLOAD_MODE", "auto")  # auto (thread under eventlet, else inline) | process | thread | inline
+OFFLOAD_WORKERS = int(os.environ.get("OFFLOAD_WORKERS", str(min(4, os.cpu_count() or 1))))
+OFFLOAD_MAX_PENDING = int(os.environ.get("OFFLOAD_MAX_PENDING", str(OFFLOAD_WORKERS * 8)))
+OFFLOAD_QUEUE_WAIT_SECONDS = float(os.environ.get("OFFLOAD_QUEUE_WAIT_SECONDS", "5"))
+OFFLOAD_TIMEOUT_SECONDS = float(os.environ.get("OFFLOAD_TIMEOUT_SECONDS", "30"))
+OFFLOAD_LOOP_TARGET_MS = float(os.environ.get("OFFLOAD_LOOP_TARGET_MS", "100"))
+OFFLOAD_LAG_INTERVAL_SECONDS = 0.1
+OFFLOAD_LAG_WINDOW_SECONDS = 60
+
+
+class OffloadRejected(RuntimeError):
+    """No offload slot became free within OFFLOAD_QUEUE_WAIT_SECONDS."""
+
+
+class OffloadTimeout(TimeoutError):
+    """The offloaded task did not finish within its timeout."""
+
+
+def _eventlet_active() -> bool:
+    try:
+        import eventlet.patcher
+        return eventlet.patcher.is_monkey_patched('thread')
+    except ImportError:
+        return False
+
+
+class OffloadPool:
+    def __init__(self, mode=OFFLOAD_MODE, workers=OFFLOAD_WORKERS, max_pending=OFFLOAD_MAX_PENDING):
+        self.mode = mode
+        self.workers = workers
+        self.max_pending = max_pending
+        self.backend = None
+        self.pending = 0   # admitted and not finished
+        self.waiting = 0   # waiting for a slot
+        self.rejected = 0
+        self.tasks = defaultdict(lambda: {'calls': 0, 'failures': 0, 'timeouts': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+        self._executor = None
+        self._pid = None
+        self._slots = None
+        self._lock = threading.Lock()
+
+    # --- backend selection ---
+
+    def _start(self):
+        """Pick and start the backend for this process (caller holds the lock)."""
+        self._pid = os.getpid()
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._executor = None
+        if self.mode == 'inline' or (self.mode == 'auto' and not _eventlet_active()):
+            self.backend = 'inline'
+            return
+        if self.mode == 'process':
+            try:
+                # spawn: workers start clean instead of inheriting the hub, sockets and monkey patching
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+                self.backend = 'process'
+                return
+            except (OSError, ImportError, NotImplementedError, ValueError) as e:
+                logger.warning(f"Offload process pool unavailable, using threads: {e}")
+        self._start_threads()
+
+    def _start_threads(self):
+        if _eventlet_active():
+            self.backend = 'tpool'
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='offload')
+            self.backend = 'thread'
+
+    def _current(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._start()
+        return self.backend
+
+    def _fall_back(self, error):
+        with self._lock:
+            if self.backend != 'process':
+                return
+            logger.warning(f"Offload process pool broke, falling back to threads: {error}")
+            executor = self._executor
+            self._start_threads()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    # --- running tasks ---
+
+    def run(self, name, fn, *args, timeout=None, **kwargs):
+        """Run fn(*args, **kwargs) off the hub and return its result (re-raising its exception)."""
+        backend = self._current()
+        started = time.perf_counter()
+        if backend == 'inline':
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._record(name, started)
+
+        with self._lock:
+            self.waiting += 1
+        acquired = self._slots.acquire(timeout=OFFLOAD_QUEUE_WAIT_SECONDS)
+        with self._lock:
+            self.waiting -= 1
+            if not acquired:
+                self.rejected += 1
+            else:
+                self.pending += 1
+        if not acquired:
+            raise OffloadRejected(f"Offload queue full ({self.max_pending} pending), '{name}' rejected")
+
+        timeout = timeout or OFFLOAD_TIMEOUT_SECONDS
+        outcome = 'failures'
+        try:
+            result = self._execute(fn, args, kwargs, timeout)
+            outcome = None
+            return result
+        except OffloadTimeout:
+            outcome = 'timeouts'
+            raise
+        finally:
+            self._record(name, started, outcome)
+
+    def _release(self, *_):
+        with self._lock:
+            self.pending -= 1
+        self._slots.release()
+
+    def _execute(self, fn, args, kwargs, timeout):
+        if self.backend == 'tpool':
+            return self._execute_tpool(fn, args, kwargs, timeout)
+        executor = self._executor
+        try:
+            future = executor.submit(fn, *args, **kwargs)
+        except (BrokenProcessPool, RuntimeError) as e:
+            self._fall_back(e)
+            if self.backend == 'process':
+                self._release()
+                raise
+            return self._execute(fn, args, kwargs, timeout)
+        # The slot is freed when the task really ends, even after the caller timed out
+        future.add_done_callback(self._release)
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise OffloadTimeout(f"{getattr(fn, '__name__', fn)} did not finish within {timeout}s")
+        except BrokenProcessPool as e:
+            self._fall_back(e)
+            raise
+
+    def _execute_tpool(self, fn, args, kwargs, timeout):
+        import eventlet
+        from eventlet import tpool
+        worker = eventlet.spawn(tpool.execute, fn, *args, **kwargs)
+        worker.link(self._release)
+        with eventlet.Timeout(timeout, OffloadTimeout(f"{getattr(fn, '__name__', fn)} did not finish within {timeout}s")):
+            return worker.wait()
+
+    def _record(self, name, started, outcome=None):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            stats = self.tasks[name]
+            stats['calls'] += 1
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+            if outcome:
+                stats[outcome] += 1
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                'backend': self.backend or 'not started',
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'pending': self.pending,
+                'waiting': self.waiting,
+                'rejected': self.rejected,
+                'tasks': {name: dict(s, avg_ms=round(s['total_ms'] / s['calls'], 1) if s['calls'] else 0.0,
+                                     total_ms=round(s['total_ms'], 1), max_ms=round(s['max_ms'], 1))
+                          for name, s in self.tasks.items()},
+            }
+
+    def shutdown(self):
+        """Stop this process's executor; offloading starts a fresh backend if it is used again."""
+        with self._lock:
+            if self._pid != os.getpid():
+                return  # a forked child: the executor belongs to the parent
+            executor, self._executor, self._pid = self._executor, None, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+offload_pool = OffloadPool()
+offload = offload_pool.run
+atexit.register(offload_pool.shutdown)
+
+
+# --- Event-loop lag ---
+
+class LoopLagMonitor:
+    def __init__(self):
+        self.samples = deque(maxlen=int(OFFLOAD_LAG_WINDOW_SECONDS / OFFLOAD_LAG_INTERVAL_SECONDS) * 2)
+        self.over_target = 0
+        self._last_warning = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, lag_ms):
+        now = time.monotonic()
+        with self._lock:
+            self.samples.append((now, lag_ms))
+            if lag_ms <= OFFLOAD_LOOP_TARGET_MS:
+                return
+            self.over_target += 1
+            warn = now - self._last_warning > OFFLOAD_LAG_WINDOW_SECONDS
+            if warn:
+                self._last_warning = now
+        if warn:
+            logger.warning(f"Event loop lag {lag_ms:.0f}ms exceeds the {OFFLOAD_LOOP_TARGET_MS:.0f}ms target; "
+                           f"offload pool: {offload_pool.status()['pending']} pending")
+
+    def status(self) -> dict:
+        since = time.monotonic() - OFFLOAD_LAG_WINDOW_SECONDS
+        with self._lock:
+            lags = sorted(ms for ts, ms in self.samples if ts >= since)
+            over_target = self.over_target
+        return {
+            'target_ms': OFFLOAD_LOOP_TARGET_MS,
+            'window_seconds': OFFLOAD_LAG_WINDOW_SECONDS,
+            'p95_ms': round(lags[int(len(lags) * 0.95)], 1) if lags else None,
+            'max_ms': round(lags[-1], 1) if lags else None,
+            'over_target_total': over_target,
+            'within_target': not lags or lags[-1] <= OFFLOAD_LOOP_TARGET_MS,
+        }
+
+
+loop_lag = LoopLagMonitor()
+
+
+def _lag_loop(socketio):
+    logger.info("Event loop lag monitor started")
+    while True:
+        ticked = time.perf_counter()
+        socketio.sleep(OFFLOAD_LAG_INTERVAL_SECONDS)
+        loop_lag.record(max(0.0, (time.perf_counter() - ticked - OFFLOAD_LAG_INTERVAL_SECONDS) * 1000))
+
+
+_monitor_pid = None
+_monitor_lock = threading.Lock()
+
+
+def ensure_loop_lag_monitor(app, socketio):
+    """Start the lag monitor once per serving process (see utils.job_queue.ensure_job_worker)."""
+    global _monitor_pid
+    if _monitor_pid == os.getpid():
+        return
+    with _monitor_lock:
+        if _monitor_pid == os.getpid():
+            return
+        _monitor_pid = os.getpid()
+        socketio.start_background_task(_lag_loop, socketio)
+
+
+def offload_status() -> dict:
+    return dict(offload_pool.status(), loop_lag=loop_lag.status())
+
+
+def offload_metrics_text() -> str:
+    """offload_status() in Prometheus text exposition format."""
+    status = offload_status()
+    lag = status['loop_lag']
+    lines = [
+        "# HELP offload_pending Offloaded tasks admitted and not finished",
+        "# TYPE offload_pending gauge",
+        f"offload_pending {status['pending']}",
+        "# HELP offload_waiting Callers waiting for an offload slot",
+        "# TYPE offload_waiting gauge",
+        f"offload_waiting {status['waiting']}",
+        "# HELP offload_rejected_total Offload calls rejected because the queue was full",
+        "# TYPE offload_rejected_total counter",
+        f"offload_rejected_total {status['rejected']}",
+        "# HELP event_loop_lag_p95_ms p95 event-loop lag over the recent window",
+        "# TYPE event_loop_lag_p95_ms gauge",
+        f"event_loop_lag_p95_ms {lag['p95_ms'] or 0}",
+        "# HELP event_loop_lag_max_ms Max event-loop lag over the recent window",
+        "# TYPE event_loop_lag_max_ms gauge",
+        f"event_loop_lag_max_ms {lag['max_ms'] or 0}",
+    ]
+    for metric, key, help_text in (('offload_tasks_total', 'calls', 'Offloaded tasks run'),
+                                   ('offload_task_failures_total', 'failures', 'Offloaded tasks that raised'),
+                                   ('offload_task_timeouts_total', 'timeouts', 'Offloaded tasks that timed out')):
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} counter")
+        for name, stats in status['tasks'].items():
+            lines.append(f'{metric}{{task="{name}"}} {stats[key]}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,189 @@
+"""
+Database connection pool settings and telemetry.
+
+Pool settings come from the environment (DB_POOL_SIZE, DB_MAX_OVERFLOW,
+DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING); pool_engine_options()
+turns them into SQLALCHEMY_ENGINE_OPTIONS. Each engine gets an
+InstrumentedQueuePool, which records for every checkout how long the caller
+waited for a connection, and counts checkout timeouts, new connections and
+invalidations. pool_status() combines these with the pool's live size,
+in-use and overflow figures; it is served on /health and, in Prometheus text
+format, on /metrics (see pool_metrics_text). /metrics requires
+`Authorization: Bearer $METRICS_TOKEN` and answers 403 while METRICS_TOKEN is
+unset, so pool figures are never public by default.
+
+A pool is reported as `saturated` when in-use connections reach
+POOL_WARN_RATIO of its capacity (size + overflow) or a checkout timed out in
+the last POOL_STATS_WINDOW_SECONDS, i.e. before requests start to fail.
+"""
+import os
+import time
+import threading
+from collections import deque
+
+from sqlalchemy import event, exc as sa_exc
+from sqlalchemy.pool import QueuePool
+
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "120"))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "1") == "1"
+POOL_STATS_WINDOW_SECONDS = float(os.environ.get("POOL_STATS_WINDOW_SECONDS", "300"))
+POOL_WARN_RATIO = float(os.environ.get("POOL_WARN_RATIO", "0.8"))
+POOL_WAIT_SAMPLES = 5000
+
+
+def pool_engine_options(database_uri, name='primary') -> dict:
+    """SQLALCHEMY_ENGINE_OPTIONS for `database_uri` with the configured, instrumented pool."""
+    options = {'pool_pre_ping': DB_POOL_PRE_PING, 'pool_recycle': DB_POOL_RECYCLE}
+    if database_uri.startswith('sqlite:'):
+        # Improve SQLite compatibility with threaded servers (e.g., SocketIO)
+        options['connect_args'] = {'check_same_thread': False}
+        if database_uri in ('sqlite://', 'sqlite:///:memory:'):
+            return options  # in-memory databases keep SQLAlchemy's single-connection pool
+    options.update(poolclass=InstrumentedQueuePool, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+                   pool_timeout=DB_POOL_TIMEOUT, pool_logging_name=name)
+    return options
+
+
+class PoolStats:
+    """Checkout waits and pool events for one pool."""
+
+    def __init__(self, name):
+        self.name = name
+        self.checkouts = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.wait_ms_total = 0.0
+        self.peak_in_use = 0
+        self.recent = deque(maxlen=POOL_WAIT_SAMPLES)  # (monotonic time, wait ms)
+        self.recent_timeouts = deque(maxlen=POOL_WAIT_SAMPLES)  # monotonic times
+        self._lock = threading.Lock()
+
+    def record_checkout(self, wait_ms, in_use):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_ms_total += wait_ms
+            self.peak_in_use = max(self.peak_in_use, in_use)
+            self.recent.append((time.monotonic(), wait_ms))
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+            self.recent_timeouts.append(time.monotonic())
+
+    def record_event(self, attribute):
+        with self._lock:
+            setattr(self, attribute, getattr(self, attribute) + 1)
+
+    def snapshot(self, pool) -> dict:
+        since = time.monotonic() - POOL_STATS_WINDOW_SECONDS
+        with self._lock:
+            waits = sorted(ms for ts, ms in self.recent if ts >= since)
+            recent_timeouts = sum(1 for ts in self.recent_timeouts if ts >= since)
+            totals = {
+                'checkouts': self.checkouts, 'timeouts': self.timeouts, 'connects': self.connects,
+                'invalidations': self.invalidations, 'peak_in_use': self.peak_in_use,
+                'avg_wait_ms': round(self.wait_ms_total / self.checkouts, 2) if self.checkouts else 0.0,
+            }
+        capacity = pool.size() + max(pool._max_overflow, 0)
+        in_use = pool.checkedout()
+        return dict(
+            totals,
+            size=pool.size(),
+            max_overflow=pool._max_overflow,
+            timeout_seconds=pool.timeout(),
+            in_use=in_use,
+            idle=pool.checkedin(),
+            overflow=max(pool.overflow(), 0),
+            recent={
+                'window_seconds': POOL_STATS_WINDOW_SECONDS,
+                'checkouts': len(waits),
+                'timeouts': recent_timeouts,
+                'wait_p50_ms': round(waits[len(waits) // 2], 2) if waits else 0.0,
+                'wait_p95_ms': round(waits[int(len(waits) * 0.95)], 2) if waits else 0.0,
+                'wait_max_ms': round(waits[-1], 2) if waits else 0.0,
+            },
+            saturated=bool(recent_timeouts) or (capacity > 0 and in_use >= capacity * POOL_WARN_RATIO),
+        )
+
+
+_pools = {}  # pool -> PoolStats, for every live instrumented pool in this process
+_pools_lock = threading.Lock()
+
+
+def _stats_for(pool) -> PoolStats:
+    stats = _pools.get(pool)
+    if stats is None:
+        with _pools_lock:
+            stats = _pools.get(pool)
+            if stats is None:
+                name = pool.logging_name or 'default'
+                # A pool replaced without dispose() (Engine.dispose(close=False) after fork) is superseded
+                for old in [p for p, s in _pools.items() if s.name == name]:
+                    del _pools[old]
+                stats = _pools[pool] = PoolStats(name)
+                event.listen(pool, 'invalidate', lambda *args: stats.record_event('invalidations'))
+    return stats
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that times every checkout and counts checkout timeouts."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except sa_exc.TimeoutError:
+            _stats_for(self).record_timeout()
+            raise
+        _stats_for(self).record_checkout((time.perf_counter() - started) * 1000, self.checkedout())
+        return connection
+
+    def _create_connection(self):
+        record = super()._create_connection()
+        _stats_for(self).record_event('connects')
+        return record
+
+    def dispose(self):
+        super().dispose()
+        # Engine.dispose() replaces the pool; forget this one's figures
+        with _pools_lock:
+            _pools.pop(self, None)
+
+
+def pool_status() -> dict:
+    """{pool name: figures} for every instrumented pool in this process."""
+    with _pools_lock:
+        pools = list(_pools.items())
+    return {stats.name: stats.snapshot(pool) for pool, stats in pools}
+
+
+def pool_metrics_text() -> str:
+    """pool_status() in Prometheus text exposition format."""
+    gauges = [
+        ('db_pool_size', 'Configured pool size', lambda s: s['size']),
+        ('db_pool_in_use', 'Connections checked out', lambda s: s['in_use']),
+        ('db_pool_idle', 'Connections idle in the pool', lambda s: s['idle']),
+        ('db_pool_overflow', 'Overflow connections open', lambda s: s['overflow']),
+        ('db_pool_peak_in_use', 'Most connections checked out at once', lambda s: s['peak_in_use']),
+        ('db_pool_wait_p95_ms', 'p95 checkout wait over the recent window', lambda s: s['recent']['wait_p95_ms']),
+        ('db_pool_saturated', '1 when the pool is near capacity or timed out recently', lambda s: int(s['saturated'])),
+    ]
+    counters = [
+        ('db_pool_checkouts_total', 'Connection checkouts', lambda s: s['checkouts']),
+        ('db_pool_timeouts_total', 'Checkouts that timed out waiting for a connection', lambda s: s['timeouts']),
+        ('db_pool_connects_total', 'New database connections', lambda s: s['connects']),
+        ('db_pool_invalidations_total', 'Connections invalidated', lambda s: s['invalidations']),
+    ]
+    status = pool_status()
+    lines = []
+    for kind, metrics in (('gauge', gauges), ('counter', counters)):
+        for name, help_text, value in metrics:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for pool_name, figures in status.items():
+                lines.append(f'{name}{{pool="{pool_name}"}} {value(figures)}')
+    return '\n'.join(lines) + '\n'
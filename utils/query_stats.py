@@ -0,0 +1,197 @@
+"""
+Per-request SQL statement counting and N+1 detection.
+
+SQLAlchemy cursor events (installed once on every Engine) record each statement
+run while a request is being handled: how many, the total database time, and how
+often each statement shape repeats. A shape is the SQL text with bind
+placeholders and expanded IN lists folded together, so the same lazy load issued
+for every row of a list counts as one shape repeated N times.
+
+After each request the totals go out as a `Server-Timing: db;dur=...` header and
+one key=value log line on the `query_stats` logger (WARNING when a shape repeats
+QUERY_REPEAT_THRESHOLD times or the route's budget is exceeded, INFO otherwise).
+
+Routes declare an upper bound with @query_budget(max_queries, max_repeats=None).
+Outside tests an exceeded budget is only logged; with app.testing or
+QUERY_BUDGET_ENFORCE=1 it raises QueryBudgetExceeded, which fails the request
+under the test client (see scripts/check_query_budgets.py).
+"""
+import os
+import re
+import time
+import logging
+import threading
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import request, current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('query_stats')
+
+QUERY_STATS_ENABLED = os.environ.get("QUERY_STATS_ENABLED", "1") == "1"
+QUERY_REPEAT_THRESHOLD = int(os.environ.get("QUERY_REPEAT_THRESHOLD", "5"))  # same shape this often in one request looks like N+1
+QUERY_BUDGET_ENFORCE = os.environ.get("QUERY_BUDGET_ENFORCE", "0") == "1"
+
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|\$\d+")
+_PLACEHOLDER_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def statement_shape(statement: str) -> str:
+    """SQL text with placeholders and IN lists folded, so repeats of one query compare equal."""
+    shape = _PLACEHOLDER.sub('?', statement)
+    shape = _PLACEHOLDER_LIST.sub('?', shape)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+
+class QueryStats:
+    """Statements seen in one request (or one track_queries() block)."""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.shapes = Counter()
+        # Fan-out workers copy the request context, so several threads may record at once
+        self._lock = threading.Lock()
+
+    def record(self, statement, elapsed_ms):
+        shape = statement_shape(statement)
+        with self._lock:
+            self.count += 1
+            self.total_ms += elapsed_ms
+            self.shapes[shape] += 1
+
+    def repeated(self, threshold=QUERY_REPEAT_THRESHOLD):
+        """[(shape, times)] for shapes run at least `threshold` times, most repeated first."""
+        with self._lock:
+            return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+    def max_repeats(self) -> int:
+        with self._lock:
+            return max(self.shapes.values(), default=0)
+
+
+_current = contextvars.ContextVar('query_stats_current', default=None)
+_hooks_installed = False
+_hooks_lock = threading.Lock()
+
+
+def current_query_stats():
+    return _current.get()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault('query_stats_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    started = conn.info.get('query_stats_started')
+    if stats is None or not started:
+        return
+    stats.record(statement, (time.perf_counter() - started.pop()) * 1000)
+
+
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute; drop its start time
+    conn = exception_context.connection
+    started = conn.info.get('query_stats_started') if conn is not None else None
+    if started:
+        started.pop()
+
+
+def install_engine_hooks():
+    """Listen on every Engine (primary and any others created later), once per process."""
+    global _hooks_installed
+    with _hooks_lock:
+        if _hooks_installed:
+            return
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+        _hooks_installed = True
+
+
+@contextmanager
+def track_queries():
+    """Count the statements run inside the block (for scripts, jobs and checks)."""
+    install_engine_hooks()
+    stats = QueryStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+def query_budget(max_queries, max_repeats=None):
+    """
+    Declare the most statements a route may run per request, and optionally how often
+    a single statement shape may repeat (defaults to QUERY_REPEAT_THRESHOLD - 1).
+    Place it directly under the @route decorator.
+    """
+    def decorator(view):
+        view.query_budget = (max_queries, max_repeats if max_repeats is not None else QUERY_REPEAT_THRESHOLD - 1)
+        return view
+    return decorator
+
+
+def budget_problems(stats, budget):
+    """Human-readable reasons a request broke its budget (empty if within it)."""
+    if budget is None:
+        return []
+    max_queries, max_repeats = budget
+    problems = []
+    if stats.count > max_queries:
+        problems.append(f"{stats.count} queries (budget {max_queries})")
+    for shape, n in stats.repeated(max_repeats + 1):
+        problems.append(f"{n}x {shape[:200]}")
+    return problems
+
+
+def _start_request():
+    _current.set(QueryStats())
+
+
+def _finish_request(response):
+    stats = _current.get()
+    if stats is None:
+        return response
+    response.headers.add('Server-Timing', f'db;dur={stats.total_ms:.1f};desc="{stats.count} queries"')
+    if not stats.count:
+        return response
+
+    view = current_app.view_functions.get(request.endpoint)
+    budget = getattr(view, 'query_budget', None)
+    problems = budget_problems(stats, budget)
+    repeated = stats.repeated()
+    level = logging.WARNING if problems or repeated else logging.INFO
+    logger.log(level, f"endpoint={request.endpoint} method={request.method} status={response.status_code} "
+                      f"queries={stats.count} db_ms={stats.total_ms:.1f} max_repeat={stats.max_repeats()} "
+                      f"budget={budget[0] if budget else '-'}"
+                      + (f" repeated={[f'{n}x {shape[:120]}' for shape, n in repeated]}" if repeated else ''))
+    if problems and (QUERY_BUDGET_ENFORCE or current_app.testing):
+        raise QueryBudgetExceeded(f"{request.endpoint} exceeded its query budget: {'; '.join(problems)}")
+    return response
+
+
+def _end_request(exc=None):
+    _current.set(None)
+
+
+def init_query_stats(app):
+    """Count statements for every request handled by `app`."""
+    if not QUERY_STATS_ENABLED:
+        return
+    install_engine_hooks()
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_end_request)